@@ -6,6 +6,23 @@
 #              Don't modify the contents of this file.
 
 
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+from itertools import compress, islice, repeat
+from operator import mul
+from struct import unpack_from
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional. Without it batches are hashed one key at a time.
+    np = None
+
+# Smallest batch worth the overhead of converting keys to NumPy arrays
+_NUMPY_MIN_BATCH = 512
+
+
 # -------------- Used by both HashMaps (SC & OA)  -------------- #
 
 class DynamicArrayException(Exception):
@@ -25,17 +42,16 @@ class DynamicArray:
 
     def __iter__(self):
         """
-        Disable iterator capability for DynamicArray class
-        This means loops and aggregate functions like
-        those shown below won't work:
+        Return an iterator over the elements, so loops and aggregate
+        functions like these work:
 
         da = DynamicArray()
-        for value in da:        # will not work
-        min(da)                 # will not work
-        max(da)                 # will not work
-        sort(da)                # will not work
+        for value in da:
+        min(da)
+        max(da)
+        sorted(da)
         """
-        return None
+        return iter(self._data)
 
     def __str__(self) -> str:
         """Override string method to provide more readable output."""
@@ -78,24 +94,443 @@ class DynamicArray:
         return len(self._data)
 
 
+class PagedArray:
+    """
+    Fixed length array whose elements all start out as fill. Storage is
+    only allocated a page of PAGE_SIZE elements at a time, when an element
+    of that page is first set, so creating even a huge array costs
+    O(length / PAGE_SIZE). Used for the new table of an incremental resize.
+    Supported methods are the ones of DynamicArray the hash maps index
+    with: get_at_index, set_at_index, length and iteration.
+    If typecode is given, each page is an array.array of that type rather
+    than a list, which the garbage collector does not have to traverse.
+    """
+
+    PAGE_SIZE = 4096
+    _PAGE_BITS = 12
+
+    __slots__ = ('_pages', '_length', '_fill', '_typecode')
+
+    def __init__(self, length: int, fill: object = None, typecode: str = None) -> None:
+        """Initialize an array of length elements equal to fill."""
+        self._length = length
+        self._fill = fill
+        self._typecode = typecode
+        self._pages = [None] * ((length + self.PAGE_SIZE - 1) >> self._PAGE_BITS)
+
+    def __iter__(self):
+        """Return an iterator over the elements."""
+        remaining = self._length
+        for page in self._pages:
+            n = min(remaining, self.PAGE_SIZE)
+            if page is None:
+                yield from repeat(self._fill, n)
+            else:
+                yield from islice(page, n)
+            remaining -= n
+
+    def get_at_index(self, index: int):
+        """Return value of element at a given index."""
+        if index < 0 or index >= self._length:
+            raise DynamicArrayException
+        page = self._pages[index >> self._PAGE_BITS]
+        if page is None:
+            return self._fill
+        return page[index & (self.PAGE_SIZE - 1)]
+
+    __getitem__ = get_at_index
+
+    def set_at_index(self, index: int, value: object) -> None:
+        """Set value of element at a given index."""
+        if index < 0 or index >= self._length:
+            raise DynamicArrayException
+        page = self._pages[index >> self._PAGE_BITS]
+        if page is None:
+            if self._typecode is None:
+                page = [self._fill] * self.PAGE_SIZE
+            else:
+                page = array(self._typecode, [self._fill]) * self.PAGE_SIZE
+            self._pages[index >> self._PAGE_BITS] = page
+        page[index & (self.PAGE_SIZE - 1)] = value
+
+    __setitem__ = set_at_index
+
+    def length(self) -> int:
+        """Return length of array."""
+        return self._length
+
+    __len__ = length
+
+
 def hash_function_1(key: str) -> int:
     """Sample Hash function #1 to be used with HashMap implementation"""
-    hash = 0
-    for letter in key:
-        hash += ord(letter)
-    return hash
+    # Same as adding up ord() of every letter, but summed in C
+    return sum(map(ord, key))
 
 
 def hash_function_2(key: str) -> int:
     """Sample Hash function #2 to be used with HashMap implementation"""
-    hash, index = 0, 0
-    index = 0
-    for letter in key:
-        hash += (index + 1) * ord(letter)
-        index += 1
+    # Same as adding up (index + 1) * ord() of every letter, but summed in C
+    return sum(map(mul, range(1, len(key) + 1), map(ord, key)))
+
+
+def to_list(items) -> list:
+    """Return the elements of a DynamicArray or any other iterable as a list."""
+    if isinstance(items, DynamicArray):
+        return items._data.copy()
+    return list(items)
+
+
+def hash_batch(keys: list, function: callable) -> list:
+    """
+    Return the hash of every key in keys, in the same order.
+    Large batches hashed with hash_function_1, hash_function_2 or
+    hash_fnv1a are hashed with NumPy when it is installed; the results are
+    identical to calling the function on each key.
+    """
+    if np is not None and len(keys) >= _NUMPY_MIN_BATCH:
+        if function is hash_fnv1a:
+            return _fnv1a_numpy(keys)
+        if function in (hash_function_1, hash_function_2) and _all_str(keys):
+            return _ord_sum_numpy(keys, weighted=function is hash_function_2)
+    return list(map(function, keys))
+
+
+def bucket_order(hashes: list, capacity: int) -> list:
+    """
+    Return the positions of hashes sorted by the bucket they fall in
+    (hash % capacity), keeping the original order within a bucket.
+    Inserting a batch in this order fills the table one region at a time.
+    """
+    if np is not None and len(hashes) >= _NUMPY_MIN_BATCH:
+        try:
+            buckets = np.array(hashes, dtype=np.uint64) % np.uint64(capacity)
+        except OverflowError:
+            # Negative or over 64-bit hashes from a custom hash function
+            pass
+        else:
+            return np.argsort(buckets, kind='stable').tolist()
+    return sorted(range(len(hashes)), key=lambda i: hashes[i] % capacity)
+
+
+def _all_str(keys: list) -> bool:
+    """Return True if every key is a str."""
+    return all(type(key) is str for key in keys)
+
+
+def _ord_sum_numpy(keys: list, weighted: bool) -> list:
+    """
+    hash_function_1 (or hash_function_2 if weighted) of every key at once.
+    Keys become rows of UTF-32 code points padded with zeros, which add
+    nothing to either sum.
+    """
+    codes = np.array(keys, dtype=str)
+    width = codes.dtype.itemsize // 4
+    if width == 0:
+        return [0] * len(keys)
+    ords = codes.view(np.uint32).reshape(len(keys), width).astype(np.int64)
+    if weighted:
+        ords *= np.arange(1, width + 1, dtype=np.int64)
+    return ords.sum(axis=1).tolist()
+
+
+def _fnv1a_numpy(keys: list) -> list:
+    """
+    hash_fnv1a of every key at once. The keys' bytes are laid out as rows
+    of a matrix and each column is folded into all the hashes in one step.
+    """
+    data = [_key_bytes(key) for key in keys]
+    lengths = np.array([len(item) for item in data], dtype=np.int64)
+    width = int(lengths.max()) if len(data) else 0
+
+    hashes = np.full(len(data), _FNV_OFFSET, dtype=np.uint64)
+    if width == 0:
+        return hashes.tolist()
+
+    matrix = np.array(data, dtype=f'S{width}').view(np.uint8).reshape(len(data), width)
+    prime = np.uint64(_FNV_PRIME)
+    for column in range(width):
+        # Only keys at least this long take part (uint64 math wraps)
+        mixed = (hashes ^ matrix[:, column]) * prime
+        hashes = np.where(lengths > column, mixed, hashes)
+
+    return hashes.tolist()
+
+
+# ------------------ Lazy views over a HashMap ------------------- #
+
+# Default for get() that no stored value can be
+_MISSING = object()
+
+
+class MapView:
+    """
+    Base class for the keys(), values() and items() views of a HashMap.
+    A view holds no copy of the entries; iterating it walks the map's
+    buckets directly, and raises RuntimeError if the map is resized or has
+    keys added or removed during the iteration.
+    """
+
+    __slots__ = ('_map',)
+
+    def __init__(self, map) -> None:
+        """Initialize a view of map."""
+        self._map = map
+
+    def __len__(self) -> int:
+        """Return the number of entries in the map."""
+        return self._map.get_size()
+
+    def __str__(self) -> str:
+        """Override string method to provide more readable output."""
+        return type(self).__name__ + '(' + str(list(self)) + ')'
+
+
+class KeysView(MapView):
+    """View of the keys of a HashMap."""
+
+    __slots__ = ()
+
+    def __iter__(self):
+        """Generate the keys of the map."""
+        for key, _ in self._map._iter_items():
+            yield key
+
+    def __contains__(self, key: object) -> bool:
+        """Return True if key is in the map."""
+        return self._map.contains_key(key)
+
+
+class ValuesView(MapView):
+    """View of the values of a HashMap."""
+
+    __slots__ = ()
+
+    def __iter__(self):
+        """Generate the values of the map."""
+        for _, value in self._map._iter_items():
+            yield value
+
+    def __contains__(self, value: object) -> bool:
+        """Return True if any key maps to value (scans the map)."""
+        for item in self:
+            if item is value or item == value:
+                return True
+        return False
+
+
+class ItemsView(MapView):
+    """View of the (key, value) pairs of a HashMap."""
+
+    __slots__ = ()
+
+    def __iter__(self):
+        """Generate the (key, value) pairs of the map."""
+        return self._map._iter_items()
+
+    def __contains__(self, item: tuple) -> bool:
+        """Return True if the map holds the (key, value) pair item."""
+        key, value = item
+        stored = self._map.get(key, _MISSING)
+        if stored is _MISSING:
+            return False
+        return stored is value or stored == value
+
+
+# ------------ Well distributed 64-bit hash functions ------------ #
+
+_MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+_FNV_OFFSET = 0xCBF29CE484222325
+_FNV_PRIME = 0x100000001B3
+
+_XX_PRIME_1 = 0x9E3779B185EBCA87
+_XX_PRIME_2 = 0xC2B2AE3D27D4EB4F
+_XX_PRIME_3 = 0x165667B19E3779F9
+_XX_PRIME_4 = 0x85EBCA77C2B2AE63
+_XX_PRIME_5 = 0x27D4EB2F165667C5
+
+
+def _key_bytes(key) -> bytes:
+    """Return the bytes hashed for a key (str keys are UTF-8 encoded)."""
+    # Exact str first: it is by far the most common key type
+    if type(key) is str:
+        return key.encode('utf-8', 'surrogatepass')
+    if isinstance(key, bytes):
+        return key
+    if not isinstance(key, str):
+        key = str(key)
+    return key.encode('utf-8', 'surrogatepass')
+
+
+def _rotl_64(value: int, bits: int) -> int:
+    """Rotate a 64-bit integer left by the given number of bits."""
+    return ((value << bits) | (value >> (64 - bits))) & _MASK_64
+
+
+def hash_fnv1a(key: str) -> int:
+    """
+    64-bit FNV-1a hash of the key's bytes.
+    Simple and well distributed for short keys, and stable across processes.
+    FNV-1a has to take one byte at a time, so hashing single keys is a
+    Python loop per byte (hash_blake2b is the faster stable choice), but
+    large batches passed to hash_batch are vectorised with NumPy.
+    """
+    # Module constants bound to locals, as they are read once per byte
+    hash, prime, mask = _FNV_OFFSET, _FNV_PRIME, _MASK_64
+    for byte in _key_bytes(key):
+        hash = ((hash ^ byte) * prime) & mask
+    return hash
+
+
+def hash_xx64(key: str) -> int:
+    """
+    xxHash64-style hash of the key's bytes.
+    Works on 8 byte lanes unpacked in a single struct call, so long keys
+    cost one loop iteration per 8 bytes instead of one per character.
+    Stable across processes.
+    """
+    data = _key_bytes(key)
+    length = len(data)
+    n_lanes = length >> 3
+
+    hash = (_XX_PRIME_5 + length) & _MASK_64
+    for lane in unpack_from('<%dQ' % n_lanes, data):
+        lane = (_rotl_64((lane * _XX_PRIME_2) & _MASK_64, 31) * _XX_PRIME_1) & _MASK_64
+        hash = (_rotl_64(hash ^ lane, 27) * _XX_PRIME_1 + _XX_PRIME_4) & _MASK_64
+
+    # Remaining 0 - 7 bytes are folded in as a single integer
+    if (length & 7):
+        tail = int.from_bytes(data[n_lanes << 3:], 'little')
+        hash = (_rotl_64(hash ^ ((tail * _XX_PRIME_5) & _MASK_64), 11) * _XX_PRIME_1) & _MASK_64
+
+    # Final avalanche so every input bit affects every output bit
+    hash ^= hash >> 33
+    hash = (hash * _XX_PRIME_2) & _MASK_64
+    hash ^= hash >> 29
+    hash = (hash * _XX_PRIME_3) & _MASK_64
+    hash ^= hash >> 32
     return hash
 
 
+def hash_blake2b(key: str) -> int:
+    """
+    64-bit BLAKE2b digest of the key's bytes.
+    Cryptographic quality (a good choice for adversarial keys) and computed
+    entirely in C, so it is the fastest of the functions that are stable
+    across processes, for short keys as well as long ones.
+    """
+    return int.from_bytes(blake2b(_key_bytes(key), digest_size=8).digest(), 'little')
+
+
+def hash_builtin(key: str) -> int:
+    """
+    Python's builtin hash() (SipHash for str and bytes) as a 64-bit value.
+    The fastest option, but str/bytes hashes are salted per process
+    (see PYTHONHASHSEED), so they must not be persisted or shared.
+    """
+    return hash(key) & _MASK_64
+
+
+# Hash functions that can be selected by name via the function argument
+HASH_FUNCTIONS = {
+    'hash_function_1': hash_function_1,
+    'hash_function_2': hash_function_2,
+    'fnv1a': hash_fnv1a,
+    'xx64': hash_xx64,
+    'blake2b': hash_blake2b,
+    'builtin': hash_builtin,
+}
+
+
+def get_hash_function(function) -> callable:
+    """
+    Return the hash function for a HashMap given either a callable or the
+    name of one of the HASH_FUNCTIONS.
+    """
+    if callable(function):
+        return function
+    if function not in HASH_FUNCTIONS:
+        raise ValueError(f"Unknown hash function: {function!r}")
+    return HASH_FUNCTIONS[function]
+
+
+# Hash functions that give the same result in every process, so the hashes
+# they produce can be kept in shared memory or on disk. 'builtin' is
+# salted per process for str keys.
+STABLE_HASH_FUNCTIONS = tuple(name for name in HASH_FUNCTIONS if name != 'builtin')
+
+
+# Table capacities. Odd primes below _SIEVE_LIMIT are looked up in a table
+# built once at import; larger numbers are tested with Miller-Rabin, which
+# with these bases gives an exact answer for every n < 3.3 * 10 ** 24 (far
+# beyond any table that fits in memory).
+
+_SIEVE_LIMIT = 1 << 16
+_MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+
+
+def _odd_primes_below(limit: int) -> list:
+    """Return the odd primes below limit (sieve of Eratosthenes)."""
+    sieve = bytearray([1]) * limit
+    sieve[0:2] = b'\x00\x00'
+    for n in range(2, int(limit ** 0.5) + 1):
+        if sieve[n]:
+            sieve[n * n::n] = bytes(len(range(n * n, limit, n)))
+    return list(compress(range(3, limit, 2), sieve[3::2]))
+
+
+_ODD_PRIMES = _odd_primes_below(_SIEVE_LIMIT)
+_ODD_PRIME_SET = frozenset(_ODD_PRIMES)
+
+
+def is_prime(n: int) -> bool:
+    """
+    Return True if n is prime. Same answers as HashMap._is_prime, without
+    the trial division.
+    """
+    if n < _SIEVE_LIMIT:
+        return n == 2 or n in _ODD_PRIME_SET
+
+    # Cheap rejection of most composites before Miller-Rabin
+    for p in _MR_BASES:
+        if n % p == 0:
+            return False
+
+    # Write n - 1 as d * 2 ** r with d odd
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+
+    for a in _MR_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(r - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def next_prime(n: int) -> int:
+    """
+    Return the smallest odd prime >= n (3 for n <= 3), which is what
+    HashMap._next_prime returns.
+    """
+    if n < _ODD_PRIMES[-1]:
+        return _ODD_PRIMES[bisect_left(_ODD_PRIMES, n)]
+
+    if n % 2 == 0:
+        n += 1
+    while not is_prime(n):
+        n += 2
+    return n
+
+
 # --------- For use in Separate Chaining (SC) HashMap  --------- #
 
 class SLNode:
@@ -103,11 +538,18 @@ class SLNode:
     Singly Linked List node for use in a hash map
     """
 
-    def __init__(self, key: str, value: object, next: "SLNode" = None) -> None:
-        """Initialize node given a key and value."""
+    __slots__ = ('key', 'value', 'next', 'hash')
+
+    def __init__(self, key: str, value: object, next: "SLNode" = None,
+                 hash: int = None) -> None:
+        """
+        Initialize node given a key and value.
+        hash caches the full hash of the key so it never has to be recomputed.
+        """
         self.key = key
         self.value = value
         self.next = next
+        self.hash = hash
 
     def __str__(self) -> str:
         """Override string method to provide more readable output."""
@@ -119,6 +561,8 @@ class LinkedListIterator:
     Separate iterator class for LinkedList
     """
 
+    __slots__ = ('_node',)
+
     def __init__(self, current_node: SLNode) -> None:
         """Initialize the iterator with a node."""
         self._node = current_node
@@ -144,6 +588,8 @@ class LinkedList:
     Supported methods are: insert, remove, contains, length, iterator
     """
 
+    __slots__ = ('_head', '_size')
+
     def __init__(self) -> None:
         """
         Initialize new linked list;
@@ -168,20 +614,26 @@ class LinkedList:
         """Return an iterator for the list, starting at the head."""
         return LinkedListIterator(self._head)
 
-    def insert(self, key: str, value: object) -> None:
+    def clear(self) -> None:
+        """Remove every node from the list."""
+        self._head = None
+        self._size = 0
+
+    def insert(self, key: str, value: object, hash: int = None) -> None:
         """Insert new node at front of the list."""
-        self._head = SLNode(key, value, self._head)
+        self._head = SLNode(key, value, self._head, hash)
         self._size += 1
 
-    def remove(self, key: str) -> bool:
+    def remove(self, key: str, hash: int = None) -> bool:
         """
         Remove first node with matching key.
+        If the key's hash is given, it is compared before the key itself.
         Return True if removal was successful, False otherwise.
         """
         previous, node = None, self._head
         while node:
 
-            if node.key == key:
+            if (hash is None or node.hash == hash) and node.key == key:
                 if previous:
                     previous.next = node.next
                 else:
@@ -192,11 +644,33 @@ class LinkedList:
             previous, node = node, node.next
         return False
 
-    def contains(self, key: str) -> SLNode:
-        """Return node with matching key, or None if no match"""
+    def pop(self, key: str, hash: int = None) -> SLNode:
+        """
+        Remove first node with matching key and return it, or None if no
+        match. If the key's hash is given, it is compared before the key.
+        """
+        previous, node = None, self._head
+        while node:
+
+            if (hash is None or node.hash == hash) and node.key == key:
+                if previous:
+                    previous.next = node.next
+                else:
+                    self._head = node.next
+                self._size -= 1
+                return node
+
+            previous, node = node, node.next
+        return None
+
+    def contains(self, key: str, hash: int = None) -> SLNode:
+        """
+        Return node with matching key, or None if no match.
+        If the key's hash is given, it is compared before the key itself.
+        """
         node = self._head
         while node:
-            if node.key == key:
+            if (hash is None or node.hash == hash) and node.key == key:
                 return node
             node = node.next
         return node
@@ -210,10 +684,16 @@ class LinkedList:
 
 class HashEntry:
 
-    def __init__(self, key: str, value: object) -> None:
-        """Initialize an entry for use in a hash map."""
+    __slots__ = ('key', 'value', 'hash', 'is_tombstone')
+
+    def __init__(self, key: str, value: object, hash: int = None) -> None:
+        """
+        Initialize an entry for use in a hash map.
+        hash caches the full hash of the key so it never has to be recomputed.
+        """
         self.key = key
         self.value = value
+        self.hash = hash
 
         # Set this value to True when you "delete" a HashEntry
         self.is_tombstone = False
@@ -221,3 +701,107 @@ class HashEntry:
     def __str__(self) -> str:
         """Override string method to provide more readable output."""
         return f"K: {self.key} V: {self.value} TS: {self.is_tombstone}"
+
+
+class CompactBuckets:
+    """
+    Open addressing table stored as parallel flat arrays instead of one
+    HashEntry object per slot. control holds one byte per slot saying
+    whether it is EMPTY, FULL or DELETED (a tombstone), hashes holds the
+    cached 64-bit hash of each key, and keys / values hold the entries.
+    With paged=True the four arrays are PagedArrays instead, so making the
+    table costs next to nothing until its slots are filled.
+    """
+
+    __slots__ = ('control', 'hashes', 'keys', 'values')
+
+    EMPTY = 0
+    FULL = 1
+    DELETED = 2
+
+    def __init__(self, capacity: int, paged: bool = False) -> None:
+        """Initialize a table of capacity empty slots."""
+        if paged:
+            self.control = PagedArray(capacity, self.EMPTY, 'B')
+            self.hashes = PagedArray(capacity, 0, 'Q')
+            self.keys = PagedArray(capacity, None)
+            self.values = PagedArray(capacity, None)
+            return
+        self.control = bytearray(capacity)
+        self.hashes = array('Q', bytes(8 * capacity))
+        self.keys = [None] * capacity
+        self.values = [None] * capacity
+
+    def length(self) -> int:
+        """Return the number of slots in the table."""
+        return len(self.control)
+
+
+class MapStats:
+    """
+    Counters kept by a HashMap created with stats=True. Everything is
+    updated as the map changes, so reading them never scans the table.
+
+    histogram maps a length to how many times it occurs in the current
+    table: chain length -> number of buckets for separate chaining, and
+    probe length (1 = found in its home slot) -> number of entries for
+    open addressing.
+    """
+
+    __slots__ = ('hits', 'misses', 'resizes', 'resize_ns', 'max_resize_ns',
+                 'histogram')
+
+    def __init__(self, histogram: dict = None) -> None:
+        """Initialize all counters to zero."""
+        self.hits = 0
+        self.misses = 0
+        self.resizes = 0
+        self.resize_ns = 0
+        self.max_resize_ns = 0
+        self.histogram = {} if histogram is None else histogram
+
+    def add(self, length: int) -> None:
+        """Count one more bucket / entry of the given length."""
+        self.histogram[length] = self.histogram.get(length, 0) + 1
+
+    def discard(self, length: int) -> None:
+        """Count one less bucket / entry of the given length."""
+        count = self.histogram[length] - 1
+        if (count == 0):
+            del self.histogram[length]
+        else:
+            self.histogram[length] = count
+
+    def move(self, old_length: int, new_length: int) -> None:
+        """A bucket / entry changed length from old_length to new_length."""
+        self.discard(old_length)
+        self.add(new_length)
+
+    def lookup(self, found: bool) -> None:
+        """Count a get / contains_key that found (or missed) its key."""
+        if (found):
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def record_resize(self, elapsed_ns: int) -> None:
+        """Count a resize that took elapsed_ns nanoseconds."""
+        self.resizes += 1
+        self.resize_ns += elapsed_ns
+        if (elapsed_ns > self.max_resize_ns):
+            self.max_resize_ns = elapsed_ns
+
+    def as_dict(self) -> dict:
+        """Return the counters as a plain dict, histogram sorted by length."""
+        lookups = self.hits + self.misses
+        longest = max(self.histogram) if self.histogram else 0
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'resizes': self.resizes,
+            'resize_ns': self.resize_ns,
+            'max_resize_ns': self.max_resize_ns,
+            'histogram': dict(sorted(self.histogram.items())),
+            'max_length': longest,
+        }
@@ -0,0 +1,353 @@
+# Name: Patrick Kramer
+# OSU Email: kramepat@oregonstate.edu
+# Course: CS261 - Data Structures
+# Assignment: 6 - HashMap Implementation
+# Due Date: 8/9/22
+# Description: Throughput / latency benchmarks for both HashMap implementations
+
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from math import log
+from time import perf_counter_ns
+
+import hash_map_oa
+import hash_map_sc
+
+
+# Each implementation is built from (initial capacity, hash function name).
+# The chained map is given a max load factor so it grows. With its fixed
+# default capacity every operation would be O(n) and nothing past a few
+# thousand keys would ever finish.
+IMPLEMENTATIONS = {
+    'sc': lambda capacity, function: hash_map_sc.HashMap(capacity, function, max_load=1.0),
+    'oa': lambda capacity, function: hash_map_oa.HashMap(capacity, function),
+    'oa_compact': lambda capacity, function: hash_map_oa.CompactHashMap(capacity, function),
+}
+
+DEFAULT_SIZES = '1000,10000,100000'
+FULL_SIZES = '1000,10000,100000,1000000,10000000'
+
+
+# ------------------- Timing helpers ------------------- #
+
+def timer_overhead() -> int:
+    """
+    Returns the median cost in ns of one back to back pair of
+    perf_counter_ns calls. It is subtracted from every latency sample.
+    """
+    samples = []
+    for _ in range(10001):
+        start = perf_counter_ns()
+        samples.append(perf_counter_ns() - start)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def percentile(sorted_samples: list, fraction: float) -> int:
+    """
+    Returns the sample at the given fraction (0-1) of a sorted list.
+    """
+    if (not sorted_samples):
+        return 0
+    return sorted_samples[round(fraction * (len(sorted_samples) - 1))]
+
+
+def measure(op: str, run_one, throughput_batch: list, latency_batch: list,
+            overhead: int) -> dict:
+    """
+    Runs run_one over throughput_batch in a tight loop to get ops / sec,
+    then times each call over latency_batch on its own for p50 / p99.
+    The two batches must not depend on each other for mutating ops.
+    """
+    start = perf_counter_ns()
+    for arg in throughput_batch:
+        run_one(arg)
+    elapsed = perf_counter_ns() - start
+
+    latencies = []
+    for arg in latency_batch:
+        t0 = perf_counter_ns()
+        run_one(arg)
+        latencies.append(max(perf_counter_ns() - t0 - overhead, 0))
+    latencies.sort()
+
+    return {
+        'op': op,
+        'ops': len(throughput_batch),
+        'ops_per_sec': len(throughput_batch) / (elapsed / 1e9) if elapsed else 0.0,
+        'p50_ns': percentile(latencies, 0.50),
+        'p99_ns': percentile(latencies, 0.99),
+    }
+
+
+def estimate(timings: list, size: int) -> float:
+    """
+    Estimates the seconds a case of the given size will take from the
+    (size, seconds) of earlier cases, assuming time grows like size ** k.
+    k is fitted to the last two cases and is at least 1.
+    """
+    if (not timings):
+        return 0.0
+    last_size, last_time = timings[-1]
+    exponent = 1.0
+    if (len(timings) > 1):
+        prev_size, prev_time = timings[-2]
+        if (prev_time > 0 and last_time > prev_time):
+            exponent = max(log(last_time / prev_time) / log(last_size / prev_size), 1.0)
+    return last_time * (size / last_size) ** exponent
+
+
+# ------------------- Benchmark cases ------------------- #
+
+def run_case(impl: str, function: str, size: int, hit_ratios: list,
+             max_ops: int, samples: int, seed: int, overhead: int) -> list:
+    """
+    Builds one map of the given size and measures every operation on it:
+    put (build), get / contains_key at each hit ratio, put (update),
+    delete-heavy churn and remove. Returns one result dict per operation.
+    """
+    rng = random.Random(seed)
+    keys = ['key' + str(i) for i in range(size)]
+    rng.shuffle(keys)
+    n_ops = min(size, max_ops)
+    n_samples = min(n_ops, samples)
+    results = []
+
+    # put (build): filling the map from empty, so resizes are included.
+    # Every stride-th put is timed on its own for the latency samples.
+    map = IMPLEMENTATIONS[impl](11, function)
+    stride = max(size // n_samples, 1)
+    build_latencies = []
+    start = perf_counter_ns()
+    for i in range(size):
+        if (i % stride == 0):
+            t0 = perf_counter_ns()
+            map.put(keys[i], None)
+            build_latencies.append(max(perf_counter_ns() - t0 - overhead, 0))
+        else:
+            map.put(keys[i], None)
+    elapsed = perf_counter_ns() - start - len(build_latencies) * overhead
+    build_latencies.sort()
+    results.append({
+        'op': 'put',
+        'ops': size,
+        'ops_per_sec': size / (elapsed / 1e9) if elapsed > 0 else 0.0,
+        'p50_ns': percentile(build_latencies, 0.50),
+        'p99_ns': percentile(build_latencies, 0.99),
+    })
+
+    # get / contains_key with a mix of present and absent keys
+    for hit_ratio in hit_ratios:
+        lookups = []
+        for i in range(n_ops):
+            if (rng.random() < hit_ratio):
+                lookups.append(keys[rng.randrange(size)])
+            else:
+                lookups.append('miss' + str(i))
+        for op, method in (('get', map.get), ('contains', map.contains_key)):
+            result = measure(op, method, lookups, lookups[:n_samples], overhead)
+            result['hit_ratio'] = hit_ratio
+            results.append(result)
+
+    # put (update): every key is already present
+    updates = rng.sample(keys, n_ops)
+    results.append(measure('update', lambda key: map.put(key, 1),
+                           updates, updates[:n_samples], overhead))
+
+    # churn: remove a live key and put a brand new one, so the size stays
+    # the same while tombstones / freed nodes pile up
+    victims = rng.sample(keys, n_ops)
+    churn = [(victims[i], 'churn' + str(i)) for i in range(n_ops)]
+    split = n_ops - min(n_ops // 2, n_samples)
+
+    def churn_one(pair):
+        map.remove(pair[0])
+        map.put(pair[1], None)
+
+    results.append(measure('churn', churn_one, churn[:split], churn[split:], overhead))
+
+    # remove: the keys churn put in are all still live, split between passes
+    survivors = [pair[1] for pair in churn]
+    split = n_ops - min(n_ops // 2, n_samples)
+    results.append(measure('remove', map.remove, survivors[:split],
+                           survivors[split:], overhead))
+
+    for result in results:
+        result['impl'] = impl
+        result['hash'] = function
+        result['size'] = size
+        result.setdefault('hit_ratio', None)
+    return results
+
+
+def run_all(args) -> dict:
+    """
+    Runs every (implementation, hash function, size) combination. Once a
+    combination is expected to take longer than the time budget, its larger
+    sizes are skipped and recorded as such. The estimate scales the last run
+    by the growth rate seen between the last two, so a hash function that
+    degrades to O(n) per operation is caught before it runs for hours.
+    """
+    overhead = timer_overhead()
+    results = []
+    skipped = []
+
+    for impl in args.impl:
+        for function in args.hash:
+            timings = []
+            for size in args.sizes:
+                if (estimate(timings, size) > args.budget):
+                    skipped.append({'impl': impl, 'hash': function, 'size': size})
+                    print(f"{impl:>10} {function:>15} {size:>9}  skipped (over budget)")
+                    continue
+
+                start = time.perf_counter()
+                case = run_case(impl, function, size, args.hit_ratio, args.max_ops,
+                                args.samples, args.seed, overhead)
+                elapsed = time.perf_counter() - start
+                results.extend(case)
+                print_case(case, elapsed)
+                timings.append((size, elapsed))
+
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'timer_overhead_ns': overhead,
+            'seed': args.seed,
+            'max_ops': args.max_ops,
+            'samples': args.samples,
+        },
+        'results': results,
+        'skipped': skipped,
+    }
+
+
+# ------------------- Reporting ------------------- #
+
+def result_key(result: dict) -> tuple:
+    """
+    Identifies a result across runs.
+    """
+    return (result['impl'], result['hash'], result['size'],
+            result['op'], result['hit_ratio'])
+
+
+def print_case(case: list, elapsed: float) -> None:
+    """
+    Prints one line per operation of a finished case.
+    """
+    for result in case:
+        hit = '' if result['hit_ratio'] is None else f"hit={result['hit_ratio']:g}"
+        print(f"{result['impl']:>10} {result['hash']:>15} {result['size']:>9} "
+              f"{result['op']:>8} {hit:>7} {result['ops_per_sec']:>12,.0f} op/s "
+              f"p50 {result['p50_ns']:>7} ns  p99 {result['p99_ns']:>7} ns")
+    print(f"{'':>36}({elapsed:.1f} s)")
+
+
+def compare(current: dict, baseline: dict, threshold: float,
+            latency_threshold: float) -> list:
+    """
+    Compares a run against a saved baseline. Returns a description of every
+    result whose throughput dropped by more than threshold, or whose p99
+    latency rose by more than latency_threshold (fractions, e.g. 0.1 for
+    10%). p99 is much noisier than throughput, hence its own threshold.
+    """
+    previous = {result_key(result): result for result in baseline['results']}
+    regressions = []
+
+    for result in current['results']:
+        old = previous.get(result_key(result))
+        if (old is None):
+            continue
+
+        name = ' '.join(str(part) for part in result_key(result) if part is not None)
+        if (old['ops_per_sec'] and
+                result['ops_per_sec'] < old['ops_per_sec'] * (1 - threshold)):
+            regressions.append(f"{name}: throughput {old['ops_per_sec']:,.0f} -> "
+                               f"{result['ops_per_sec']:,.0f} op/s")
+        if (old['p99_ns'] and result['p99_ns'] > old['p99_ns'] * (1 + latency_threshold)):
+            regressions.append(f"{name}: p99 {old['p99_ns']} -> {result['p99_ns']} ns")
+
+    return regressions
+
+
+def parse_args(argv=None):
+    """
+    Command line options. Lists are comma separated.
+    """
+    parser = argparse.ArgumentParser(description="HashMap benchmarks")
+    parser.add_argument('--impl', default=','.join(IMPLEMENTATIONS),
+                        help="implementations to run (%(default)s)")
+    parser.add_argument('--hash', default='hash_function_1,hash_function_2',
+                        help="hash function names from a6_include.HASH_FUNCTIONS "
+                             "(%(default)s)")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help=f"map sizes (%(default)s; --full runs {FULL_SIZES})")
+    parser.add_argument('--full', action='store_true',
+                        help="run every size from 1K up to 10M")
+    parser.add_argument('--hit-ratio', default='1.0,0.5,0.0',
+                        help="fractions of lookups that find their key (%(default)s)")
+    parser.add_argument('--max-ops', type=int, default=200000,
+                        help="operations timed per phase (%(default)s)")
+    parser.add_argument('--samples', type=int, default=20000,
+                        help="individually timed operations per phase (%(default)s)")
+    parser.add_argument('--budget', type=float, default=60.0,
+                        help="seconds after which larger sizes of a combination "
+                             "are skipped (%(default)s)")
+    parser.add_argument('--seed', type=int, default=2022)
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="JSON file from an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="allowed throughput drop vs the baseline (%(default)s)")
+    parser.add_argument('--latency-threshold', type=float, default=0.50,
+                        help="allowed p99 latency rise vs the baseline (%(default)s)")
+    args = parser.parse_args(argv)
+
+    args.impl = args.impl.split(',')
+    for impl in args.impl:
+        if (impl not in IMPLEMENTATIONS):
+            parser.error(f"unknown implementation {impl!r}")
+    args.hash = args.hash.split(',')
+    args.sizes = [int(size) for size in (FULL_SIZES if args.full else args.sizes).split(',')]
+    args.hit_ratio = [float(ratio) for ratio in args.hit_ratio.split(',')]
+    return args
+
+
+def main(argv=None) -> int:
+    """
+    Runs the benchmarks, saves them and checks them against the baseline.
+    Returns 1 if any regression was found, so CI can fail the build.
+    """
+    args = parse_args(argv)
+    report = run_all(args)
+
+    if (args.output):
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Results written to {args.output}")
+
+    if (args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.threshold,
+                              args.latency_threshold)
+        if (regressions):
+            print(f"\n{len(regressions)} regression(s) vs {args.baseline}:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print(f"\nNo regressions vs {args.baseline}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# Name: Patrick Kramer
+# OSU Email: kramepat@oregonstate.edu
+# Course: CS261 - Data Structures
+# Assignment: 6 - HashMap Implementation
+# Due Date: 8/9/22
+# Description: asyncio front end for the Open Addressing HashMap whose
+#              resizes never block the event loop
+
+
+import asyncio
+from time import perf_counter
+
+from a6_include import DynamicArray, hash_function_1
+from hash_map_oa import CompactHashMap, HashMap
+
+
+# Default for arguments where None is a legitimate value
+_MISSING = object()
+
+
+class AsyncHashMap:
+    def __init__(self,
+                 capacity: int = 11,
+                 function=hash_function_1,
+                 slice_time: float = 0.001,
+                 slice_size: int = 256,
+                 compact: bool = True,
+                 **kwargs) -> None:
+        """
+        Initialize new AsyncHashMap, an open addressing HashMap for use from
+        asyncio code. Other keyword arguments go to hash_map_oa.HashMap.
+
+        Resizes are incremental: put only swaps in the bigger table (whose
+        slots are allocated a page at a time as they fill), and a background
+        task moves the entries over, yielding to the event loop once it has
+        run for slice_time seconds. Until it is done, every operation still
+        sees every entry. Iteration, update and get_keys_and_values yield
+        to the loop on the same time budget. The clock is checked every
+        slice_size slots or entries.
+
+        compact: if True, the entries are kept in a CompactHashMap. Its flat
+                 arrays give the garbage collector nothing to traverse,
+                 whereas the one HashEntry per entry of a HashMap makes each
+                 full collection block the loop for as long as it takes to
+                 visit every entry.
+
+        Lookups never do more than a few slots of work, so get,
+        contains_key and their dunders are plain (non async) methods.
+        """
+        if (slice_time <= 0):
+            raise ValueError("slice_time must be greater than 0")
+        if (slice_size < 1):
+            raise ValueError("slice_size must be at least 1")
+
+        map_type = CompactHashMap if compact else HashMap
+        self._map = map_type(capacity, function, incremental=True, **kwargs)
+        self._slice_time = slice_time
+        self._slice_size = slice_size
+        self._rehash_task = None
+
+    def __str__(self) -> str:
+        """
+        Override string method to provide more readable output
+        """
+        return str(self._map)
+
+    def get_size(self) -> int:
+        """
+        Return size of map
+        """
+        return self._map.get_size()
+
+    def get_capacity(self) -> int:
+        """
+        Return capacity of map
+        """
+        return self._map.get_capacity()
+
+    def table_load(self) -> float:
+        """
+        Returns the current hash table load factor.
+        """
+        return self._map.table_load()
+
+    def is_rehashing(self) -> bool:
+        """
+        Returns True while a resize is still migrating slots.
+        """
+        return self._map.is_rehashing()
+
+    # ------------------------------------------------------------------ #
+
+    def _schedule_rehash(self) -> None:
+        """
+        Starts the background task that finishes a running resize, unless
+        it is already going.
+        """
+        if (self._map.is_rehashing()
+                and (self._rehash_task is None or self._rehash_task.done())):
+            self._rehash_task = asyncio.get_running_loop().create_task(self._rehash())
+
+    async def _rehash(self) -> None:
+        """
+        Migrates the rest of a running resize, for up to slice_time seconds
+        per pass of the event loop.
+        """
+        while (True):
+            deadline = perf_counter() + self._slice_time
+            while (self._map.rehash(self._slice_size)):
+                if (perf_counter() >= deadline):
+                    break
+            else:
+                return
+            await asyncio.sleep(0)
+
+    async def rehash(self) -> None:
+        """
+        Waits until any running resize has been finished.
+        """
+        self._schedule_rehash()
+        if (self._rehash_task is not None):
+            await self._rehash_task
+
+    async def put(self, key: str, value: object) -> None:
+        """
+        Updates the given key/value pair. If the key is already present,
+        update the value to the new value. If not, add to hash map. Never
+        waits for a resize it starts.
+        """
+        self._map.put(key, value)
+        self._schedule_rehash()
+
+    async def update(self, other=(), **kwargs) -> None:
+        """
+        Puts every (key, value) pair of other (a mapping or iterable of
+        pairs) and kwargs, yielding to the loop every slice_time seconds.
+        """
+        if (hasattr(other, 'items')):
+            other = other.items()
+
+        count = 0
+        deadline = perf_counter() + self._slice_time
+        for pairs in (other, kwargs.items()):
+            for key, value in pairs:
+                self._map.put(key, value)
+                count += 1
+                if (count % self._slice_size == 0 and perf_counter() >= deadline):
+                    self._schedule_rehash()
+                    await asyncio.sleep(0)
+                    deadline = perf_counter() + self._slice_time
+        self._schedule_rehash()
+
+    async def resize_table(self, new_capacity: int) -> None:
+        """
+        Update capacity of hash table. Returns once the new table is in
+        place; the entries are moved over in the background.
+        """
+        # Only one resize can be in flight at a time
+        await self.rehash()
+        self._map.begin_resize(new_capacity)
+        self._schedule_rehash()
+
+    def get(self, key: str, default: object = None) -> object:
+        """
+        Return value associated with provided key, or default (None unless
+        given) if key not present.
+        """
+        return self._map.get(key, default)
+
+    def contains_key(self, key: str) -> bool:
+        """
+        Returns True if the key is in the map. Else returns False.
+        """
+        return self._map.contains_key(key)
+
+    async def remove(self, key: str) -> None:
+        """
+        Removes key / value pair from Hash Map using given key.
+        """
+        self._map.remove(key)
+
+    async def pop(self, key: str, default: object = _MISSING) -> object:
+        """
+        Remove key and return its value. If key is not present, return
+        default, or raise KeyError if no default was given.
+        """
+        if (default is _MISSING):
+            return self._map.pop(key)
+        return self._map.pop(key, default)
+
+    async def clear(self, capacity: int = None) -> None:
+        """
+        Clears all contents of map. Capacity remains unchanged unless
+        capacity is given. The work is proportional to the entries removed,
+        and any running resize is dropped with them.
+        """
+        self._map.clear(capacity)
+
+    # ------------------- Mapping protocol ------------------- #
+
+    __contains__ = contains_key
+    __len__ = get_size
+
+    def __getitem__(self, key: str) -> object:
+        """
+        Return value associated with key. Raise KeyError if not present.
+        """
+        return self._map[key]
+
+    def __aiter__(self):
+        """
+        Iterate over the keys of the map with async for.
+        """
+        return self._iter_keys()
+
+    async def _iter_keys(self):
+        """
+        Generates the keys of the map, see items.
+        """
+        async for key, _ in self.items():
+            yield key
+
+    async def items(self):
+        """
+        Generates the (key, value) pairs of the map for async for, yielding
+        to the loop every slice_time seconds. As with a dict, RuntimeError
+        is raised if another task adds or removes entries meanwhile.
+        """
+        # Finish any resize first so no entry moves mid-iteration
+        await self.rehash()
+
+        count = 0
+        deadline = perf_counter() + self._slice_time
+        for pair in self._map.items():
+            yield pair
+            count += 1
+            if (count % self._slice_size == 0 and perf_counter() >= deadline):
+                await asyncio.sleep(0)
+                deadline = perf_counter() + self._slice_time
+
+    async def get_keys_and_values(self) -> DynamicArray:
+        """
+        Create and return a dynamic array of all elements in the HashMap.
+        """
+        keys_with_values = DynamicArray()
+        async for pair in self.items():
+            keys_with_values.append(pair)
+        return keys_with_values
+
+
+# ------------------- BASIC TESTING ---------------------------------------- #
+
+if __name__ == "__main__":
+    async def ticker(samples):
+        # Measures how long the event loop is blocked at a time
+        last = perf_counter()
+        while (True):
+            await asyncio.sleep(0)
+            now = perf_counter()
+            samples.append(now - last)
+            last = now
+
+    async def main():
+        print("\nPut 200000 keys while another task is running")
+        print("---------------------------------------------")
+        samples = []
+        tick = asyncio.create_task(ticker(samples))
+        m = AsyncHashMap(11, 'fnv1a')
+        for i in range(200000):
+            await m.put('key' + str(i), i)
+            if (i % 100 == 0):
+                await asyncio.sleep(0)
+        await m.rehash()
+        tick.cancel()
+        print(m.get_size(), m.get_capacity(), m.get('key199999'))
+        print("longest stall (ms):", round(max(samples) * 1000, 2))
+
+        pairs = await m.get_keys_and_values()
+        print(pairs.length())
+        await m.resize_table(1000003)
+        print(m.is_rehashing(), m.get('key123'))
+        await m.rehash()
+        print(m.is_rehashing(), m.get_capacity(), m.get('key123'))
+
+    asyncio.run(main())
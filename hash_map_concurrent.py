@@ -0,0 +1,439 @@
+# Name: Patrick Kramer
+# OSU Email: kramepat@oregonstate.edu
+# Course: CS261 - Data Structures
+# Assignment: 6 - HashMap Implementation
+# Due Date: 8/9/22
+# Description: Thread safe Separate Chaining HashMap with lock striping
+
+
+from collections.abc import MutableMapping
+from threading import Lock
+
+from a6_include import (DynamicArray, LinkedList, get_hash_function,
+                        hash_function_1, next_prime)
+
+
+# Default for arguments where None is a legitimate value
+_MISSING = object()
+
+
+class _Forward:
+    """
+    Left in a bucket of a table once its entries have been moved to the
+    next table of a resize. Writers and readers that land on it carry on in
+    table. bucket is the moved LinkedList, which is never changed again, so
+    iterators over the old table can still read it.
+    """
+
+    __slots__ = ('table', 'bucket')
+
+    def __init__(self, table, bucket: LinkedList) -> None:
+        self.table = table
+        self.bucket = bucket
+
+
+class _Table:
+    """
+    One bucket array of a ConcurrentHashMap. Bucket idx is guarded by
+    locks[idx % len(locks)], and counts[stripe] is the number of entries in
+    the buckets of that stripe. next is the table a resize is moving the
+    entries to, and transfer_idx / migrated track how far that has got.
+    """
+
+    __slots__ = ('buckets', 'capacity', 'locks', 'counts', 'next',
+                 'transfer_idx', 'migrated')
+
+    def __init__(self, capacity: int, concurrency: int) -> None:
+        self.capacity = capacity
+        self.buckets = [LinkedList() for _ in range(capacity)]
+        n_stripes = min(concurrency, capacity)
+        self.locks = [Lock() for _ in range(n_stripes)]
+        self.counts = [0] * n_stripes
+        self.next = None
+        self.transfer_idx = 0
+        self.migrated = 0
+
+
+class ConcurrentHashMap(MutableMapping):
+    def __init__(self,
+                 capacity: int = 11,
+                 function: callable = hash_function_1,
+                 max_load: float = 1.0,
+                 concurrency: int = 16,
+                 rehash_step: int = 16) -> None:
+        """
+        Initialize new ConcurrentHashMap, a separate chaining HashMap that
+        can be shared between threads.
+
+        Writers lock only the stripe of buckets their key falls in, so up to
+        concurrency of them run at once. get and contains_key take no lock.
+        Once the load factor passes max_load the table grows, and each later
+        write moves rehash_step buckets to the new table, so no call ever
+        waits for the whole table to be rehashed.
+        """
+        if (max_load <= 0):
+            raise ValueError("max_load must be greater than 0")
+        if (concurrency < 1):
+            raise ValueError("concurrency must be at least 1")
+        if (rehash_step < 1):
+            raise ValueError("rehash_step must be at least 1")
+
+        self._hash_function = get_hash_function(function)
+        self._max_load = max_load
+        self._concurrency = concurrency
+        self._rehash_step = rehash_step
+        self._initial_capacity = next_prime(capacity)
+        self._table = _Table(self._initial_capacity, concurrency)
+
+        # Only guards starting a resize, handing out ranges of buckets to
+        # move and switching tables, never a get / put itself
+        self._resize_lock = Lock()
+
+    def __str__(self) -> str:
+        """
+        Override string method to provide more readable output
+        """
+        # Finish any resize so every entry is in the table printed
+        self.rehash()
+        out = ''
+        for i, bucket in enumerate(self._table.buckets):
+            if (type(bucket) is _Forward):
+                bucket = bucket.bucket
+            out += str(i) + ': ' + str(bucket) + '\n'
+        return out
+
+    def get_size(self) -> int:
+        """
+        Return size of map. While other threads are writing, this is only
+        a snapshot and may already be out of date.
+        """
+        table = self._table
+        size = 0
+        while (table is not None):
+            size += sum(table.counts)
+            table = table.next
+        return size
+
+    def get_capacity(self) -> int:
+        """
+        Return capacity of map
+        """
+        return self._table.capacity
+
+    def table_load(self) -> float:
+        """
+        Returns the current hash table load factor.
+        """
+        return self.get_size() / self._table.capacity
+
+    # ------------------------------------------------------------------ #
+
+    def put(self, key: str, value: object) -> None:
+        """
+        Updates the given key/value pair. If the key is already present,
+        update the value to the new value. If not, add to hash map.
+        """
+        self._put(key, value, True)
+
+    def setdefault(self, key: str, default: object = None) -> object:
+        """
+        Returns the value for key. If the key is not present, it is added
+        with the given default value first. The check and the insert are a
+        single atomic step.
+        """
+        return self._put(key, default, False)
+
+    def _put(self, key: str, value: object, overwrite: bool) -> object:
+        """
+        Adds key with value, or if key is present replaces its value when
+        overwrite is True. Returns the value key ends up with.
+        """
+        hash_value = self._hash_function(key)
+        grow = None
+        table = self._table
+        while (True):
+            idx = hash_value % table.capacity
+            stripe = idx % len(table.locks)
+            with table.locks[stripe]:
+                bucket = table.buckets[idx]
+                if (type(bucket) is not _Forward):
+                    node = bucket.contains(key, hash_value)
+                    if (node is not None):
+                        if (overwrite):
+                            node.value = value
+                        else:
+                            value = node.value
+                        break
+
+                    bucket.insert(key, value, hash_value)
+                    table.counts[stripe] += 1
+
+                    # Grow once this stripe is past its share of max_load.
+                    # Reading one counter keeps the check O(1).
+                    if (table.counts[stripe] * len(table.locks)
+                            > self._max_load * table.capacity):
+                        grow = table
+                    break
+
+            # Bucket already moved to the next table of a resize
+            table = bucket.table
+
+        if (grow is not None):
+            self._start_resize(grow)
+        self._help_resize()
+        return value
+
+    def get(self, key: str, default: object = None) -> object:
+        """
+        Return value associated with provided key, or default (None unless
+        given) if key not present. Takes no lock.
+        """
+        node = self._find(key)
+        if (node is None):
+            return default
+        return node.value
+
+    def contains_key(self, key: str) -> bool:
+        """
+        Returns True if the key is in the map. Else returns False.
+        Takes no lock.
+        """
+        return self._find(key) is not None
+
+    def _find(self, key: str):
+        """
+        Returns the node holding key, or None. Safe without a lock because
+        writers only ever publish a change with a single reference store,
+        and a resize copies nodes rather than relinking them.
+        """
+        hash_value = self._hash_function(key)
+        table = self._table
+        while (True):
+            bucket = table.buckets[hash_value % table.capacity]
+            if (type(bucket) is not _Forward):
+                return bucket.contains(key, hash_value)
+            table = bucket.table
+
+    def remove(self, key: str) -> None:
+        """
+        Removes key / value pair from Hash Map using given key.
+        """
+        self._remove(key)
+
+    def _remove(self, key: str) -> object:
+        """
+        Removes key and returns its value, or _MISSING if it was not present.
+        """
+        hash_value = self._hash_function(key)
+        table = self._table
+        while (True):
+            idx = hash_value % table.capacity
+            stripe = idx % len(table.locks)
+            with table.locks[stripe]:
+                bucket = table.buckets[idx]
+                if (type(bucket) is not _Forward):
+                    node = bucket.pop(key, hash_value)
+                    if (node is not None):
+                        table.counts[stripe] -= 1
+                    break
+
+            # Bucket already moved to the next table of a resize
+            table = bucket.table
+
+        self._help_resize()
+        return _MISSING if node is None else node.value
+
+    def clear(self) -> None:
+        """
+        Clears all contents. Leaves capacity as is. Entries other threads
+        put while the clear is running may or may not survive it.
+        """
+        table = self._table
+        while (table is not None):
+            for idx in range(table.capacity):
+                stripe = idx % len(table.locks)
+                with table.locks[stripe]:
+                    bucket = table.buckets[idx]
+                    if (type(bucket) is not _Forward):
+                        table.counts[stripe] -= bucket.length()
+                        # A fresh list, so lock-free readers still walking
+                        # the old one are not cut off mid-chain
+                        table.buckets[idx] = LinkedList()
+            table = table.next
+
+    # ------------------------- Resizing ------------------------- #
+
+    def is_rehashing(self) -> bool:
+        """
+        Returns True while a resize is still moving buckets.
+        """
+        return self._table.next is not None
+
+    def _start_resize(self, table: _Table) -> None:
+        """
+        Sets up the next, twice as large, table for table. Does nothing if
+        another thread got there first or a resize is already running.
+        """
+        with self._resize_lock:
+            if (table is not self._table or table.next is not None):
+                return
+            table.next = _Table(next_prime(table.capacity * 2), self._concurrency)
+
+    def _help_resize(self) -> None:
+        """
+        Moves the next rehash_step buckets of a running resize, if any.
+        Several threads can help at once; each claims its own range.
+        """
+        table = self._table
+        if (table.next is None):
+            return
+
+        with self._resize_lock:
+            start = table.transfer_idx
+            end = min(start + self._rehash_step, table.capacity)
+            table.transfer_idx = end
+
+        for idx in range(start, end):
+            self._transfer(table, idx)
+
+        with self._resize_lock:
+            table.migrated += end - start
+            if (table.migrated == table.capacity and self._table is table):
+                self._table = table.next
+
+    def rehash(self) -> None:
+        """
+        Finishes a running resize in the calling thread.
+        """
+        while (self._table.next is not None):
+            self._help_resize()
+
+    @staticmethod
+    def _transfer(table: _Table, idx: int) -> None:
+        """
+        Copies every entry of bucket idx into the next table and leaves a
+        _Forward in its place. The old table's lock is always taken before
+        the new one's, and writers never hold a new table lock while taking
+        an old one, so this cannot deadlock.
+        """
+        new_table = table.next
+        stripe = idx % len(table.locks)
+        with table.locks[stripe]:
+            bucket = table.buckets[idx]
+            if (type(bucket) is _Forward):
+                return
+
+            for node in bucket:
+                new_idx = node.hash % new_table.capacity
+                new_stripe = new_idx % len(new_table.locks)
+                with new_table.locks[new_stripe]:
+                    new_table.buckets[new_idx].insert(node.key, node.value, node.hash)
+                    new_table.counts[new_stripe] += 1
+
+            table.counts[stripe] -= bucket.length()
+            table.buckets[idx] = _Forward(new_table, bucket)
+
+    # ------------------- Mapping protocol ------------------- #
+
+    __setitem__ = put
+    __contains__ = contains_key
+    __len__ = get_size
+
+    def __getitem__(self, key: str) -> object:
+        """
+        Return value associated with key. Raise KeyError if not present.
+        """
+        node = self._find(key)
+        if (node is None):
+            raise KeyError(key)
+        return node.value
+
+    def __delitem__(self, key: str) -> None:
+        """
+        Remove key from the map. Raise KeyError if not present.
+        """
+        if (self._remove(key) is _MISSING):
+            raise KeyError(key)
+
+    def pop(self, key: str, default: object = _MISSING) -> object:
+        """
+        Remove key and return its value. If key is not present, return
+        default, or raise KeyError if no default was given.
+        """
+        value = self._remove(key)
+        if (value is _MISSING):
+            if (default is _MISSING):
+                raise KeyError(key)
+            return default
+        return value
+
+    def __iter__(self):
+        """
+        Iterate over the keys of the map.
+        """
+        for key, _ in self._iter_items():
+            yield key
+
+    def _iter_items(self):
+        """
+        Generates the (key, value) pairs of the map. Never raises because
+        of other threads' writes: each key is seen at most once, but
+        entries added, changed or removed during the iteration may or may
+        not be reflected.
+        """
+        return self._iter_table(self._table, 0, None)
+
+    def _iter_table(self, table: _Table, start: int, previous):
+        """
+        Generates the pairs in buckets start onwards of table, keeping only
+        keys whose hash passes previous (None keeps every key). Once it
+        reaches a bucket already moved by a resize, it helps finish the
+        resize and carries on in the next table, where the keys of that
+        bucket and every later one now live.
+        """
+        for idx in range(start, table.capacity):
+            bucket = table.buckets[idx]
+            if (type(bucket) is _Forward):
+                self.rehash()
+
+                # Skip keys of the buckets of table already visited
+                capacity = table.capacity
+
+                def belongs(hash_value, idx=idx):
+                    return (hash_value % capacity >= idx
+                            and (previous is None or previous(hash_value)))
+
+                yield from self._iter_table(bucket.table, 0, belongs)
+                return
+
+            for node in bucket:
+                if (previous is None or previous(node.hash)):
+                    yield node.key, node.value
+
+    def get_keys_and_values(self) -> DynamicArray:
+        """
+        Create and return a dynamic array of all elements in the HashMap.
+        """
+        return DynamicArray(list(self._iter_items()))
+
+
+# ------------------- BASIC TESTING ---------------------------------------- #
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    print("\nConcurrent put / get from 8 threads")
+    print("-----------------------------------")
+    m = ConcurrentHashMap(11, 'fnv1a')
+
+    def worker(n):
+        for i in range(2000):
+            m.put('key' + str(n * 2000 + i), i)
+            m.get('key' + str(i))
+        return n
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(worker, range(8)))
+    m.rehash()
+    print(m.get_size(), m.get_capacity(), round(m.table_load(), 2))
+    print(all(m.get('key' + str(n * 2000 + i)) == i for n in range(8) for i in range(2000)))
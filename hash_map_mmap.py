@@ -0,0 +1,566 @@
+# Name: Patrick Kramer
+# OSU Email: kramepat@oregonstate.edu
+# Course: CS261 - Data Structures
+# Assignment: 6 - HashMap Implementation
+# Due Date: 8/9/22
+# Description: Open Addressing HashMap kept in a memory-mapped file, so it
+#              survives restarts and opens without re-inserting anything
+
+
+import mmap
+import os
+import struct
+from collections.abc import MutableMapping
+
+from a6_include import DynamicArray, HASH_FUNCTIONS, STABLE_HASH_FUNCTIONS, next_prime
+from snapshot import VALUE_CODECS
+
+
+# File layout: a fixed header, then capacity fixed-width slots, then a heap
+# the key and value bytes of each entry are appended to.
+#
+# header: magic, capacity, size, tombstones, heap end, garbage (bytes of
+#         the heap no slot points to any more), hash function name, value
+#         codec
+# slot:   hash, file offset of the key in the heap, key length, value
+#         length, state. The value bytes follow the key bytes.
+#
+# Entries are written to the heap before the slot that points to them, so
+# a crash mid-put at worst loses that put. flush() (and close()) make
+# everything written so far durable.
+
+_MAGIC = b'A6MMAP01'
+_HEADER = struct.Struct('<8sQQQQQ16sB')
+_HEADER_SIZE = 128
+_SIZE_OFFSET = 16
+_TOMBSTONES_OFFSET = 24
+_HEAP_END_OFFSET = 32
+_GARBAGE_OFFSET = 40
+_U64 = struct.Struct('<Q')
+
+_SLOT = struct.Struct('<QQIIB7x')
+_STATE_OFFSET = 24
+_EMPTY = 0
+_FULL = 1
+_DELETED = 2
+
+_HASH_MASK = (1 << 64) - 1
+
+# Heap bytes a new file starts out with (it doubles as it fills up)
+_MIN_HEAP = 4096
+
+# The file is rewritten to clear out tombstones once live entries plus
+# tombstones fill this fraction of the slots and the tombstones are a real
+# share of them, as for hash_map_oa.HashMap
+_MAX_OCCUPANCY = 0.75
+
+_CODEC_NAMES = list(VALUE_CODECS)
+
+# Default for arguments where None is a legitimate value
+_MISSING = object()
+
+
+class PersistentHashMap(MutableMapping):
+    def __init__(self,
+                 path: str,
+                 capacity: int = 11,
+                 function: str = None,
+                 values: str = None) -> None:
+        """
+        Open the PersistentHashMap stored in the file at path, or create it
+        there with the given capacity if the file does not exist yet.
+        Opening only maps the file; the operating system pages in just the
+        slots and entries that are actually used.
+
+        Keys are str. Values are stored encoded as given by values:
+        'bytes', 'str', 'int', 'float' or 'pickle'. function must be the
+        name of a hash function that gives the same result in every
+        process ('blake2b' by default for new files); 'builtin' is salted per
+        process and so is refused. For an existing file the hash function
+        and encoding are read from it, and giving different ones is an
+        error. New files store 'bytes' values unless told otherwise.
+
+        The table uses linear probing and doubles once the load factor
+        reaches 0.5, like hash_map_oa.HashMap.
+        """
+        if (function is not None and function not in STABLE_HASH_FUNCTIONS):
+            raise ValueError("function must name a hash function that is "
+                             "stable across processes, e.g. 'blake2b' or 'fnv1a'")
+        if (values is not None and values not in VALUE_CODECS):
+            raise ValueError(f"Unknown value encoding: {values!r}")
+
+        self._path = path
+        self._version = 0
+        if (not os.path.exists(path) or os.path.getsize(path) == 0):
+            self._create(path, next_prime(capacity), function or 'blake2b',
+                         values or 'bytes', _MIN_HEAP)
+        self._open(path)
+
+        if (function is not None and function != self._function_name):
+            self.close()
+            raise ValueError(f"{path} was written with hash function "
+                             f"{self._function_name!r}, not {function!r}")
+        if (values is not None and values != self._values):
+            self.close()
+            raise ValueError(f"{path} stores {self._values!r} values, not {values!r}")
+
+    @staticmethod
+    def _create(path: str, capacity: int, function: str, values: str, heap_size: int) -> None:
+        """
+        Writes an empty table file.
+        """
+        heap_start = _HEADER_SIZE + capacity * _SLOT.size
+        with open(path, 'wb') as file:
+            file.write(_HEADER.pack(_MAGIC, capacity, 0, 0, heap_start, 0,
+                                    function.encode(), _CODEC_NAMES.index(values)))
+            # Slots and heap start out as zeros (all slots EMPTY)
+            file.truncate(heap_start + heap_size)
+
+    def _open(self, path: str) -> None:
+        """
+        Maps the file at path and reads its header.
+        """
+        self._file = open(path, 'r+b')
+        self._mm = mmap.mmap(self._file.fileno(), 0)
+        if (len(self._mm) < _HEADER_SIZE):
+            self.close()
+            raise ValueError(f"{path} is not a PersistentHashMap file")
+
+        (magic, self._capacity, self._size, self._tombstones, self._heap_end,
+         self._garbage, function, codec) = _HEADER.unpack_from(self._mm, 0)
+        if (magic != _MAGIC):
+            self.close()
+            raise ValueError(f"{path} is not a PersistentHashMap file")
+
+        self._function_name = function.rstrip(b'\0').decode('utf-8', 'replace')
+        if (self._capacity < 1
+                or self._size + self._tombstones > self._capacity
+                or not self._heap_start() <= self._heap_end <= len(self._mm)
+                or self._garbage > self._heap_end - self._heap_start()
+                or self._function_name not in STABLE_HASH_FUNCTIONS
+                or codec >= len(_CODEC_NAMES)):
+            self.close()
+            raise ValueError(f"{path} has a corrupt header")
+
+        self._hash_function = HASH_FUNCTIONS[self._function_name]
+        self._values = _CODEC_NAMES[codec]
+        self._encode, self._decode = VALUE_CODECS[self._values]
+
+    def flush(self) -> None:
+        """
+        Writes all changes through to the file.
+        """
+        self._mm.flush()
+
+    def close(self) -> None:
+        """
+        Flushes and closes the file. Raises BufferError while memoryviews
+        returned by get_view are still in use.
+        """
+        if (self._mm is not None):
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def __enter__(self) -> "PersistentHashMap":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __str__(self) -> str:
+        """
+        Override string method to provide more readable output
+        """
+        out = ''
+        for i in range(self._capacity):
+            state = self._mm[_HEADER_SIZE + i * _SLOT.size + _STATE_OFFSET]
+            if (state == _FULL):
+                key, value = self._entry_at(i)
+                out += str(i) + ': ' + str(key) + ' -> ' + str(value) + '\n'
+            else:
+                out += str(i) + ': ' + ('None' if state == _EMPTY else 'TS') + '\n'
+        return out
+
+    def get_size(self) -> int:
+        """
+        Return size of map
+        """
+        return self._size
+
+    def get_capacity(self) -> int:
+        """
+        Return capacity of map
+        """
+        return self._capacity
+
+    def table_load(self) -> float:
+        """
+        Returns the current hash table load factor.
+        """
+        return self._size / self._capacity
+
+    def empty_buckets(self) -> int:
+        """
+        Returns the number of empty buckets (tombstones included)
+        """
+        return self._capacity - self._size
+
+    # ------------------------------------------------------------------ #
+
+    def _hash(self, key: str) -> int:
+        """
+        Returns the 64-bit hash of key that is stored in its slot.
+        """
+        return self._hash_function(key) & _HASH_MASK
+
+    def _find_slot(self, key_bytes: bytes, hash_value: int) -> (int, bool):
+        """
+        Linear probe for key. Returns (idx, True) for the slot holding the
+        key, otherwise (idx, False) for the first empty or deleted slot it
+        could go in.
+        """
+        mm = self._mm
+        capacity = self._capacity
+        key_len = len(key_bytes)
+        idx = hash_value % capacity
+        free = -1
+        for _ in range(capacity):
+            slot_hash, offset, slot_key_len, _, state = _SLOT.unpack_from(
+                mm, _HEADER_SIZE + idx * _SLOT.size)
+            if (state == _EMPTY):
+                return (idx if free == -1 else free), False
+            elif (state == _DELETED):
+                if (free == -1):
+                    free = idx
+            elif (slot_hash == hash_value and slot_key_len == key_len
+                    and mm[offset:offset + key_len] == key_bytes):
+                return idx, True
+
+            idx += 1
+            if (idx == capacity):
+                idx = 0
+
+        return free, False
+
+    def _set_header(self, offset: int, value: int) -> None:
+        """
+        Writes one of the header counters.
+        """
+        _U64.pack_into(self._mm, offset, value)
+
+    def _append(self, data: bytes) -> int:
+        """
+        Appends data to the heap, growing the file if needed, and returns
+        its offset.
+        """
+        end = self._heap_end + len(data)
+        if (end > len(self._mm)):
+            # Double the file so appends stay amortized O(1). Remapping
+            # fails with BufferError while get_view results are in use.
+            self._mm.flush()
+            self._mm.close()
+            self._mm = None
+            self._file.truncate(2 * end - self._heap_start())
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+
+        offset = self._heap_end
+        self._mm[offset:end] = data
+        self._heap_end = end
+        self._set_header(_HEAP_END_OFFSET, end)
+        return offset
+
+    def put(self, key: str, value: object) -> None:
+        """
+        Updates key/value pair in hash map. Updates value if key already
+        exits, if not, add the key/value pair. Resize to double
+        if load factor >= 0.5.
+        """
+        key_bytes = key.encode('utf-8')
+        value_bytes = self._encode(value)
+        hash_value = self._hash(key)
+
+        if (self.table_load() >= 0.5):
+            self.resize_table(self._capacity * 2)
+        elif (self._tombstones >= max(self._size, self._capacity // 8)
+                and (self._size + self._tombstones) / self._capacity >= _MAX_OCCUPANCY):
+            # Mostly tombstones. Rewrite the file to clear them out.
+            self.resize_table(self._capacity)
+
+        idx, found = self._find_slot(key_bytes, hash_value)
+        slot_offset = _HEADER_SIZE + idx * _SLOT.size
+        if (found):
+            _, offset, key_len, value_len, _ = _SLOT.unpack_from(self._mm, slot_offset)
+            if (len(value_bytes) <= value_len):
+                # New value fits where the old one was
+                start = offset + key_len
+                self._mm[start:start + len(value_bytes)] = value_bytes
+                _SLOT.pack_into(self._mm, slot_offset, hash_value, offset,
+                                key_len, len(value_bytes), _FULL)
+                self._add_garbage(value_len - len(value_bytes))
+                return
+        else:
+            reused = self._mm[slot_offset + _STATE_OFFSET] == _DELETED
+
+        # May raise BufferError, so nothing is changed before it
+        offset = self._append(key_bytes + value_bytes)
+        _SLOT.pack_into(self._mm, slot_offset, hash_value, offset,
+                        len(key_bytes), len(value_bytes), _FULL)
+        if (found):
+            # The old key and value bytes are left behind in the heap
+            self._add_garbage(key_len + value_len)
+        else:
+            self._size += 1
+            self._set_header(_SIZE_OFFSET, self._size)
+            if (reused):
+                self._tombstones -= 1
+                self._set_header(_TOMBSTONES_OFFSET, self._tombstones)
+            self._version += 1
+
+        # Rewrite the file once most of the heap is dead entries
+        if (self._garbage > _MIN_HEAP and 2 * self._garbage > self._heap_end - self._heap_start()):
+            self.resize_table(self._capacity)
+
+    def _add_garbage(self, n_bytes: int) -> None:
+        """
+        Counts n_bytes more of the heap as no longer used.
+        """
+        self._garbage += n_bytes
+        self._set_header(_GARBAGE_OFFSET, self._garbage)
+
+    def _heap_start(self) -> int:
+        """
+        Returns the file offset the heap starts at.
+        """
+        return _HEADER_SIZE + self._capacity * _SLOT.size
+
+    def _value_location(self, key: str) -> (int, int):
+        """
+        Returns the file offset and length of key's value bytes, or
+        (-1, 0) if key is not present.
+        """
+        idx, found = self._find_slot(key.encode('utf-8'), self._hash(key))
+        if (not found):
+            return -1, 0
+        _, offset, key_len, value_len, _ = _SLOT.unpack_from(
+            self._mm, _HEADER_SIZE + idx * _SLOT.size)
+        return offset + key_len, value_len
+
+    def get(self, key: str, default: object = None) -> object:
+        """
+        Return value associated with provided key, or default (None unless
+        given) if key not present.
+        """
+        start, length = self._value_location(key)
+        if (start == -1):
+            return default
+        return self._decode(self._mm[start:start + length])
+
+    def get_view(self, key: str) -> memoryview:
+        """
+        Returns a read-only memoryview of key's stored value bytes straight
+        out of the mapped file, without copying them, or None if key is not
+        present. The view is only valid until the map is next changed, and
+        must be released before the file has to grow or be rewritten.
+        """
+        start, length = self._value_location(key)
+        if (start == -1):
+            return None
+        return memoryview(self._mm)[start:start + length].toreadonly()
+
+    def contains_key(self, key: str) -> bool:
+        """
+        Returns True if the key is in the map. Else returns False.
+        """
+        return self._find_slot(key.encode('utf-8'), self._hash(key))[1]
+
+    def remove(self, key: str) -> None:
+        """
+        Removes key / value pair from Hash Map using given key.
+        """
+        self._remove(key)
+
+    def _remove(self, key: str) -> object:
+        """
+        Removes key and returns its value, or _MISSING if it was not present.
+        """
+        idx, found = self._find_slot(key.encode('utf-8'), self._hash(key))
+        if (not found):
+            return _MISSING
+
+        slot_offset = _HEADER_SIZE + idx * _SLOT.size
+        _, offset, key_len, value_len, _ = _SLOT.unpack_from(self._mm, slot_offset)
+        value = self._decode(self._mm[offset + key_len:offset + key_len + value_len])
+
+        self._mm[slot_offset + _STATE_OFFSET] = _DELETED
+        self._size -= 1
+        self._tombstones += 1
+        self._set_header(_SIZE_OFFSET, self._size)
+        self._set_header(_TOMBSTONES_OFFSET, self._tombstones)
+        self._add_garbage(key_len + value_len)
+        self._version += 1
+        return value
+
+    def clear(self) -> None:
+        """
+        Clears all contents of map. Capacity remains unchanged.
+        """
+        heap_start = self._heap_start()
+        self._mm[_HEADER_SIZE:heap_start] = bytes(heap_start - _HEADER_SIZE)
+        self._size = 0
+        self._tombstones = 0
+        self._heap_end = heap_start
+        self._garbage = 0
+        for offset, value in ((_SIZE_OFFSET, 0), (_TOMBSTONES_OFFSET, 0),
+                              (_HEAP_END_OFFSET, heap_start), (_GARBAGE_OFFSET, 0)):
+            self._set_header(offset, value)
+        self._version += 1
+
+    def resize_table(self, new_capacity: int) -> None:
+        """
+        Update capacity of hash table. The live entries are written to a
+        new, compacted file which then replaces the current one, so a crash
+        part way through leaves the old file intact.
+        """
+        # Do nothing if new_capacity is less than num of elements
+        if (new_capacity < self._size):
+            return
+        new_capacity = next_prime(new_capacity)
+
+        tmp_path = self._path + '.resize'
+        live_heap = self._heap_end - self._heap_start() - self._garbage
+        self._create(tmp_path, new_capacity, self._function_name, self._values,
+                     max(live_heap, _MIN_HEAP))
+        new_map = type(self)(tmp_path)
+
+        # Copy entries over with their cached hashes, without decoding them
+        mm = self._mm
+        for i in range(self._capacity):
+            slot_hash, offset, key_len, value_len, state = _SLOT.unpack_from(
+                mm, _HEADER_SIZE + i * _SLOT.size)
+            if (state == _FULL):
+                new_map._insert_new(mm[offset:offset + key_len + value_len],
+                                    key_len, value_len, slot_hash)
+        new_map.close()
+
+        try:
+            self.close()
+        except BufferError:
+            # A get_view result still points into the current file
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, self._path)
+        self._open(self._path)
+        self._version += 1
+
+    def _insert_new(self, data: bytes, key_len: int, value_len: int, hash_value: int) -> None:
+        """
+        Adds an entry whose key is known not to be present, without any
+        resize checks. Used to fill a fresh table.
+        """
+        idx = hash_value % self._capacity
+        while (self._mm[_HEADER_SIZE + idx * _SLOT.size + _STATE_OFFSET] != _EMPTY):
+            idx += 1
+            if (idx == self._capacity):
+                idx = 0
+
+        offset = self._append(data)
+        _SLOT.pack_into(self._mm, _HEADER_SIZE + idx * _SLOT.size, hash_value,
+                        offset, key_len, value_len, _FULL)
+        self._size += 1
+        self._set_header(_SIZE_OFFSET, self._size)
+
+    # ------------------- Mapping protocol ------------------- #
+
+    __setitem__ = put
+    __contains__ = contains_key
+    __len__ = get_size
+
+    def __getitem__(self, key: str) -> object:
+        """
+        Return value associated with key. Raise KeyError if not present.
+        """
+        value = self.get(key, _MISSING)
+        if (value is _MISSING):
+            raise KeyError(key)
+        return value
+
+    def __delitem__(self, key: str) -> None:
+        """
+        Remove key from the map. Raise KeyError if not present.
+        """
+        if (self._remove(key) is _MISSING):
+            raise KeyError(key)
+
+    def pop(self, key: str, default: object = _MISSING) -> object:
+        """
+        Remove key and return its value. If key is not present, return
+        default, or raise KeyError if no default was given.
+        """
+        value = self._remove(key)
+        if (value is _MISSING):
+            if (default is _MISSING):
+                raise KeyError(key)
+            return default
+        return value
+
+    def __iter__(self):
+        """
+        Iterate over the keys of the map.
+        """
+        for key, _ in self._iter_items():
+            yield key
+
+    def _entry_at(self, idx: int) -> tuple:
+        """
+        Returns the decoded (key, value) of the full slot idx.
+        """
+        _, offset, key_len, value_len, _ = _SLOT.unpack_from(
+            self._mm, _HEADER_SIZE + idx * _SLOT.size)
+        value_start = offset + key_len
+        return (str(self._mm[offset:value_start], 'utf-8'),
+                self._decode(self._mm[value_start:value_start + value_len]))
+
+    def _iter_items(self):
+        """
+        Generates the (key, value) pairs of the map one slot at a time.
+        Raises RuntimeError if the map has entries added, removed or moved
+        while the generator is in use.
+        """
+        version = self._version
+        for i in range(self._capacity):
+            if (self._mm[_HEADER_SIZE + i * _SLOT.size + _STATE_OFFSET] == _FULL):
+                yield self._entry_at(i)
+                if (self._version != version):
+                    raise RuntimeError("HashMap changed during iteration")
+
+    def get_keys_and_values(self) -> DynamicArray:
+        """
+        Create and return a dynamic array of all elements in the HashMap.
+        """
+        return DynamicArray(list(self._iter_items()))
+
+
+# ------------------- BASIC TESTING ---------------------------------------- #
+
+if __name__ == "__main__":
+    import tempfile
+    from time import perf_counter
+
+    print("\nWrite 100000 entries, reopen, read")
+    print("-----------------------------------")
+    path = os.path.join(tempfile.mkdtemp(), 'table.a6')
+    with PersistentHashMap(path, 11, 'fnv1a') as m:
+        for i in range(100000):
+            m.put('key' + str(i), b'value' + str(i).encode())
+        print(m.get_size(), m.get_capacity())
+
+    start = perf_counter()
+    with PersistentHashMap(path) as m:
+        print("open (ms):", round((perf_counter() - start) * 1000, 3))
+        print(m.get('key99999'), m.contains_key('key100000'))
+        view = m.get_view('key42')
+        print(bytes(view))
+        view.release()
+    os.remove(path)
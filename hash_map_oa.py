@@ -6,27 +6,265 @@
 # Description: Implementation of Open Addressing HashMap
 
 
-from a6_include import (DynamicArray, HashEntry,
-                        hash_function_1, hash_function_2)
+from abc import ABC, abstractmethod
+from array import array
+from collections.abc import Mapping, MutableMapping
+from copy import copy
+from time import perf_counter_ns
 
+from a6_include import (CompactBuckets, DynamicArray, HASH_FUNCTIONS, HashEntry,
+                        ItemsView, KeysView, MapStats, PagedArray, ValuesView, bucket_order,
+                        get_hash_function, hash_batch, hash_function_1, hash_function_2,
+                        is_prime, next_prime, to_list)
+from snapshot import read_snapshot, stable_hash_name, write_snapshot
 
-class HashMap:
-    def __init__(self, capacity: int, function) -> None:
+
+# Default for arguments where None is a legitimate value
+_MISSING = object()
+
+# Hashes are stored as unsigned 64-bit integers by CompactHashMap
+_HASH_MASK = (1 << 64) - 1
+
+# Put in place of each entry an incremental resize moves out of the old
+# table. It reads as a tombstone, so old probe sequences still run through
+# the slot, and the moved HashEntry is freed there and then instead of all
+# at once when the old table is dropped.
+_RETIRED = HashEntry(None, None, 0)
+_RETIRED.is_tombstone = True
+
+
+# ----------------------- Probing strategies ----------------------- #
+
+class ProbingStrategy(ABC):
+    """
+    Decides the sequence of slots the OA HashMap looks at for a key.
+    Subclasses implement probe(), which yields at most capacity indexes
+    starting at the key's home slot.
+    """
+
+    name = None
+
+    # True if the table capacity must be a power of two instead of a prime
+    power_of_two = False
+
+    # True if the HashMap should insert with Robin Hood displacement and
+    # delete with backward shifting instead of tombstones
+    robin_hood = False
+
+    @abstractmethod
+    def probe(self, hash_value: int, capacity: int):
         """
-        Initialize new HashMap that uses
-        quadratic probing for collision resolution
-        DO NOT CHANGE THIS METHOD IN ANY WAY
+        Yields the slots to look at for a key with hash_value in a table
+        of capacity slots, starting at its home slot. Yields at most
+        capacity indexes, and must reach a free slot whenever the table is
+        at most half full.
+        """
+
+    def __repr__(self) -> str:
+        """
+        Returns the strategy's class name as a constructor call.
         """
-        self._buckets = DynamicArray()
+        return f"{type(self).__name__}()"
 
-        # capacity must be a prime number
-        self._capacity = self._next_prime(capacity)
-        for _ in range(self._capacity):
-            self._buckets.append(None)
 
-        self._hash_function = function
+class QuadraticProbing(ProbingStrategy):
+    """
+    Probes home, home + 1, home + 4, home + 9, ... (the original scheme).
+    Each square is reached by adding the next odd number to the previous
+    index, so j ** 2 is never computed.
+    """
+
+    name = 'quadratic'
+
+    def probe(self, hash_value: int, capacity: int):
+        idx = hash_value % capacity
+        step = 1
+        for _ in range(capacity):
+            yield idx
+            idx = (idx + step) % capacity
+            step += 2
+
+
+class LinearProbing(ProbingStrategy):
+    """
+    Probes home, home + 1, home + 2, ... Best cache behaviour, but the
+    most prone to clustering.
+    """
+
+    name = 'linear'
+
+    def probe(self, hash_value: int, capacity: int):
+        idx = hash_value % capacity
+        for _ in range(capacity):
+            yield idx
+            idx += 1
+            if (idx == capacity):
+                idx = 0
+
+
+class DoubleHashing(ProbingStrategy):
+    """
+    Probes home, home + step, home + 2 * step, ... where step is derived
+    from the upper part of the hash. Because the capacity is prime, every
+    step visits every slot, and keys sharing a home slot still take
+    different paths.
+    """
+
+    name = 'double'
+
+    def probe(self, hash_value: int, capacity: int):
+        idx = hash_value % capacity
+        step = 1
+        if (capacity > 2):
+            step = 1 + (hash_value // capacity) % (capacity - 1)
+        for _ in range(capacity):
+            yield idx
+            idx = (idx + step) % capacity
+
+
+class TriangularProbing(ProbingStrategy):
+    """
+    Probes home, home + 1, home + 3, home + 6, ... (triangular numbers).
+    Requires a power of two capacity, where it is guaranteed to visit every
+    slot and the index can be masked instead of taken modulo capacity.
+    """
+
+    name = 'triangular'
+    power_of_two = True
+
+    def probe(self, hash_value: int, capacity: int):
+        mask = capacity - 1
+        idx = hash_value & mask
+        for step in range(1, capacity + 1):
+            yield idx
+            idx = (idx + step) & mask
+
+
+class RobinHoodProbing(LinearProbing):
+    """
+    Linear probing where an inserted key takes over the slot of any entry
+    that is closer to its own home slot, which keeps the variance of
+    probe lengths low. Deletes shift the following entries back instead of
+    leaving tombstones.
+    """
+
+    name = 'robin_hood'
+    robin_hood = True
+
+
+PROBING_STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (QuadraticProbing, LinearProbing, DoubleHashing,
+                     TriangularProbing, RobinHoodProbing)
+}
+
+
+def _next_power_of_two(capacity: int) -> int:
+    """
+    Returns the smallest power of two that is at least capacity.
+    """
+    return 1 << max(capacity - 1, 0).bit_length()
+
+
+class HashMap(MutableMapping):
+    def __init__(self,
+                 capacity: int,
+                 function,
+                 incremental: bool = False,
+                 rehash_step: int = 8,
+                 max_occupancy: float = 0.75,
+                 probing='quadratic',
+                 stats: bool = False,
+                 debug: bool = False) -> None:
+        """
+        Initialize new HashMap that uses
+        open addressing (quadratic probing by default) for collision resolution
+
+        function: a hash function, or the name of one from
+                  a6_include.HASH_FUNCTIONS (e.g. 'blake2b', 'fnv1a').
+        incremental: if True, the resize triggered by put migrates
+                     rehash_step slots per operation instead of rehashing
+                     the whole table inside a single put.
+        max_occupancy: once live entries plus tombstones fill this fraction
+                       of the table, and tombstones are a real share of it
+                       (see _needs_compaction), put rehashes it in place to
+                       clear them out. Must be above 0.5, the load factor
+                       the table grows at, so live entries alone never
+                       trigger it.
+        probing: a ProbingStrategy, or the name of one from
+                 PROBING_STRATEGIES ('quadratic', 'linear', 'double',
+                 'triangular' or 'robin_hood').
+        stats: if True, keep a probe length histogram, hit / miss counts
+               and resize timings, readable through get_stats().
+        debug: if True, empty_buckets() checks its count against a full
+               scan of the table and raises RuntimeError if they differ.
+        """
+        if (rehash_step < 1):
+            raise ValueError("rehash_step must be at least 1")
+        if (not 0.5 < max_occupancy <= 1):
+            raise ValueError("max_occupancy must be in (0.5, 1]")
+
+        if (isinstance(probing, str)):
+            if (probing not in PROBING_STRATEGIES):
+                raise ValueError(f"Unknown probing strategy: {probing!r}")
+            probing = PROBING_STRATEGIES[probing]()
+        if (probing.robin_hood and incremental):
+            raise ValueError("Robin Hood probing does not support incremental resizing")
+        self._probing = probing
+
+        # capacity must be a prime number (or a power of two, if the
+        # probing strategy asks for one)
+        if (probing.power_of_two):
+            self._capacity = _next_power_of_two(capacity)
+        else:
+            self._capacity = next_prime(capacity)
+        self._buckets = self._new_buckets(self._capacity)
+
+        self._hash_function = get_hash_function(function)
         self._size = 0
 
+        # Incremental rehashing. While a resize is in progress the previous
+        # bucket array is kept in _old_buckets and migrated a few slots at a
+        # time by each put / get / contains_key / remove.
+        self._incremental = incremental
+        self._rehash_step = rehash_step
+        self._old_buckets = None
+        self._old_capacity = 0
+        self._rehash_idx = 0
+
+        # Capacity of a resize asked for while another was still migrating.
+        # It is started once that one is done rather than finishing it on
+        # the spot, so no single operation migrates a whole table.
+        self._pending_capacity = None
+
+        # Number of entries still waiting in _old_buckets, so the number of
+        # live entries in _buckets is always _size - _old_size
+        self._old_size = 0
+        self._debug = debug
+
+        # Indexes of the slots of _buckets that have been filled since the
+        # last clear (each listed once, flagged in _used_flags), so clear can
+        # reset just those when they are a small part of the table. Kept as
+        # a flat array of machine ints, and no longer than clear can use.
+        self._used = array('l')
+        self._used_flags = bytearray(self._capacity)
+
+        # Number of tombstones in _buckets. They are reclaimed by rehashing
+        # the table in place once they make up too much of it.
+        self._tombstones = 0
+        self._max_occupancy = max_occupancy
+
+        # Bumped whenever entries are added, removed or moved to a new table,
+        # so iterators can tell the map changed underneath them
+        self._version = 0
+
+        # Slot popitem carries on scanning from, so draining the map with
+        # popitem does not walk the emptied slots again on every call
+        self._pop_cursor = 0
+
+        # Optional instrumentation
+        self._stats = MapStats() if stats else None
+
     def __str__(self) -> str:
         """
         Override string method to provide more readable output
@@ -92,38 +330,71 @@ class HashMap:
         exits, if not, add the key/value pair. Resize to double
         if load factor >= 0.5.
         """
+        self._put(key, value, self._hash(key))
+
+    def _put(self, key: str, value: object, hash_value: int) -> None:
+        """
+        put for a key whose hash has already been computed.
+        """
+        if (self._old_buckets is not None):
+            self.rehash(self._rehash_step)
+
         # remember, if the load factor is greater than or equal to 0.5,
         # resize the table before putting the new key/value pair
         if (self.table_load() >= 0.5):
-            self.resize_table(self._capacity * 2)
-
-        # Get initial index
-        init_idx = self._hash_function(key) % self._capacity
-
-        # Quadratic probing until element is added
-        updated = False
-        j = 0
-        while (updated == False):
-            cur_idx = (init_idx + (j ** 2)) % self._capacity
-            if (self._buckets[cur_idx] == None):
-                # No item at index. Add new item.
-                new_entry = HashEntry(key, value)
-                self._buckets[cur_idx] = new_entry
-                self._size += 1
-                updated = True
-            elif (self._buckets[cur_idx].is_tombstone == True):
-                # Deleted item at index. Add new item
-                new_entry = HashEntry(key, value)
-                self._buckets[cur_idx] = new_entry
-                self._size += 1
-                updated = True
-            elif (self._buckets[cur_idx].key == key):
-                # Key already in array. Update value.
-                self._buckets[cur_idx].value = value
-                updated = True
+            if (self._incremental):
+                self._start_rehash(self._capacity * 2)
+            else:
+                self.resize_table(self._capacity * 2)
+        elif (self._needs_compaction()):
+            # Mostly tombstones. Rehash at the same capacity to clear them
+            # out so probe sequences stay short.
+            if (self._incremental):
+                self._start_rehash(self._capacity)
             else:
-                # Different item occupying index. Continue quadratic probing.
-                j += 1
+                self.resize_table(self._capacity)
+
+        # Probe until the key or a free slot is found
+        idx, found = self._find_slot(self._buckets, self._capacity, key, hash_value)
+        if (found):
+            # Key already in array. Update value.
+            self._set_value_at(self._buckets, idx, value)
+            return
+
+        if (self._probing.robin_hood):
+            # New key. Insert it, displacing entries closer to home.
+            self._robin_hood_insert(self._buckets, self._capacity, key, value, hash_value)
+            self._size += 1
+            self._version += 1
+            return
+
+        # Key may still be waiting in the old table of an incremental resize
+        if (self._old_buckets is not None):
+            old_idx, old_found = self._find_slot(self._old_buckets, self._old_capacity,
+                                                 key, hash_value)
+            if (old_found):
+                self._set_value_at(self._old_buckets, old_idx, value)
+                return
+
+        # Empty or deleted slot. Add new item.
+        if (self._store_at(self._buckets, idx, key, value, hash_value)):
+            self._tombstones -= 1
+        else:
+            self._mark_used(idx)
+        if (self._stats is not None):
+            self._stats.add(self._probe_length(hash_value, self._capacity, idx))
+        self._size += 1
+        self._version += 1
+
+    def _needs_compaction(self) -> bool:
+        """
+        Returns True if the table is full enough of tombstones to be
+        rehashed at the same capacity. There must be at least as many
+        tombstones as live entries, and an eighth of the table, so every
+        compaction is paid for by Θ(capacity) removes since the last one.
+        """
+        return (self._tombstones >= max(self._size, self._capacity // 8)
+                and (self._size + self._tombstones) / self._capacity >= self._max_occupancy)
 
     def table_load(self) -> float:
         """
@@ -132,15 +403,62 @@ class HashMap:
         """
         return self._size / self._capacity
 
+    def tombstone_count(self) -> int:
+        """
+        Returns the number of deleted (tombstone) slots in the table.
+        """
+        return self._tombstones
+
+    def tombstone_ratio(self) -> float:
+        """
+        Returns the fraction of the table taken up by tombstones.
+        table_load() + tombstone_ratio() is the share of slots lookups
+        have to probe past.
+        """
+        return self._tombstones / self._capacity
+
+    def get_stats(self) -> dict:
+        """
+        Returns the instrumentation counters as a dict, or None if the map
+        was not created with stats=True. histogram maps a probe length to
+        the number of entries of the current table that take that many
+        probes to find.
+        """
+        if (self._stats is None):
+            return None
+
+        stats = self._stats.as_dict()
+        stats['size'] = self._size
+        stats['capacity'] = self._capacity
+        stats['load'] = self._size / self._capacity
+        stats['tombstones'] = self._tombstones
+        stats['tombstone_ratio'] = self._tombstones / self._capacity
+        stats['rehashing'] = self._old_buckets is not None
+        return stats
+
     def empty_buckets(self) -> int:
         """
-        Returns the number of empty buckets in the table.
+        Returns the number of empty buckets in the table, counting
+        tombstones as empty. Worked out from the entry counts, so this is
+        O(1).
+        """
+        count = self._capacity - (self._size - self._old_size)
+        if (self._debug):
+            scanned = self._scan_empty_buckets()
+            if (scanned != count):
+                raise RuntimeError(f"empty bucket count is {count}, "
+                                   f"but a scan found {scanned}")
+        return count
+
+    def _scan_empty_buckets(self) -> int:
+        """
+        Counts the empty buckets the slow way.
         Iterate through all indexes and increment empty bucket count
-        for each None or is_tombstone = True.
+        for each empty or deleted (tombstone) slot.
         """
         count = 0
         for i in range(self._capacity):
-            if (self._buckets[i] == None or self._buckets[i].is_tombstone == True):
+            if (self._entry_at(self._buckets, i) is None):
                 count += 1
 
         return count
@@ -155,199 +473,635 @@ class HashMap:
         if (new_capacity < self._size):
             return
 
+        # Finish any incremental resize first so every entry is in _buckets.
+        # A resize waiting for it is superseded by this one.
+        self._pending_capacity = None
+        self.rehash()
+        start = perf_counter_ns()
+
         # Check that new_capacity is prime. If not, make it the next largest prime.
-        if (self._is_prime(new_capacity) == False):
-            new_capacity = self._next_prime(new_capacity)
+        new_capacity = self._round_capacity(new_capacity)
 
-        # Make new HashMap
-        new_map = HashMap(new_capacity, self._hash_function)
+        # Make new HashMap using the same storage and probing as this one
+        new_map = type(self)(new_capacity, self._hash_function, probing=self._probing,
+                             stats=self._stats is not None)
 
-        # Rehash using put method
+        # Rehash using put method, skipping empty slots and tombstones
         for i in range(self._capacity):
-            if (self._buckets[i] == None):
-                # Move along
-                continue
-            elif (self._buckets[i].is_tombstone == True):
-                # Move along
-                continue
-            else:
-                # Add element to new_map
-                key = self._buckets[i].key
-                value = self._buckets[i].value
-                new_map.put(key, value)
+            entry = self._entry_at(self._buckets, i)
+            if (entry is not None):
+                # Add element to new_map, reusing its cached hash
+                key, value, hash_value = entry
+                new_map._put(key, value, hash_value)
 
         # Update info to equal new_map info
         self._buckets = new_map._buckets
         self._capacity = new_map._capacity
         self._size = new_map._size
+        self._tombstones = new_map._tombstones
+        self._used = new_map._used
+        self._used_flags = new_map._used_flags
+        self._version += 1
+        self._pop_cursor = 0
+
+        if (self._stats is not None):
+            # new_map built the histogram of the new table as it went
+            self._stats.histogram = new_map._stats.histogram
+            self._stats.record_resize(perf_counter_ns() - start)
+
+    @classmethod
+    def with_expected_size(cls, n_items: int, function: callable = hash_function_1,
+                           load_factor: float = 0.5, **kwargs) -> "HashMap":
+        """
+        Returns an empty HashMap with enough slots for n_items keys at the
+        given load factor (at most 0.5, where put resizes), so loading them
+        never resizes the table. Other keyword arguments (probing, stats,
+        ...) go to the constructor.
+        """
+        if (not 0 < load_factor <= 0.5):
+            raise ValueError("load_factor must be in (0, 0.5]")
 
-        # # Make new bucket array with new_capacity size
-        # new_buckets = DynamicArray()
-        # for _ in range(new_capacity):
-        #     new_buckets.append(None)
-
-        # # remember to rehash non-deleted entries into new table
-        # for i in range(self._capacity):
-        #     if (self._buckets[i] == None):
-        #         # Keep moving
-        #         continue
-        #     elif (self._buckets[i].is_tombstone == True):
-        #         # Keep moving
-        #         continue
-        #     else:
-        #         # Add item to new array
-        #         new_entry = HashEntry(self._buckets[i].key, self._buckets[i].value)
-        #         init_idx = self._hash_function(self._buckets[i].key) % new_capacity
-        #         j = 0
-        #         added = False
-        #         while (added == False):
-        #             cur_idx = (init_idx + (j ** 2)) % new_capacity
-        #             if (new_buckets[cur_idx] == None):
-        #                 # No item at index. Add new item.
-        #                 new_buckets[cur_idx] = new_entry
-        #                 added = True
-        #             else:
-        #                 # Different item occupying index. Continue quadratic probing.
-        #                 j += 1
-
-        # self._buckets = new_buckets
-        # self._capacity = new_capacity
-
-        # # Check the load factor and do it all again if >= 0.5
-        # if (self.table_load() >= 0.5):
-        #     # Here we go again...
-        #     new_capacity = self._capacity * 2
-        #     if (self._is_prime(new_capacity) == False):
-        #         new_capacity = self._next_prime(new_capacity)
-            
-        #     # Make new bucket array with new_capacity size
-        #     new_buckets = DynamicArray()
-        #     for _ in range(new_capacity):
-        #         new_buckets.append(None)
-
-        #     # remember to rehash non-deleted entries into new table
-        #     for i in range(self._capacity):
-        #         if (self._buckets[i] == None):
-        #             # Keep moving
-        #             continue
-        #         elif (self._buckets[i].is_tombstone == True):
-        #             # Keep moving
-        #             continue
-        #         else:
-        #             # Add item to new array
-        #             new_entry = HashEntry(self._buckets[i].key, self._buckets[i].value)
-        #             init_idx = self._hash_function(self._buckets[i].key) % new_capacity
-        #             j = 0
-        #             added = False
-        #             while (added == False):
-        #                 cur_idx = (init_idx + (j ** 2)) % new_capacity
-        #                 if (new_buckets[cur_idx] == None):
-        #                     # No item at index. Add new item.
-        #                     new_buckets[cur_idx] = new_entry
-        #                     added = True
-        #                 else:
-        #                     # Different item occupying index. Continue quadratic probing.
-        #                     j += 1
-
-        #     self._buckets = new_buckets
-        #     self._capacity = new_capacity
-
-    def get(self, key: str) -> object:
-        """
-        Returns value associated with key. Return None if not in hash map.
-        """
-        value = None
-
-        init_idx = self._hash_function(key) % self._capacity
-        j = 0
-        done = False
-        # Search via quadratic probing until key is found or an empty spot is found
-        while (done == False):
-            cur_idx = (init_idx + (j ** 2)) % self._capacity
-            if (self._buckets[cur_idx] == None):
-                # Item not in array
-                done = True
-            elif (self._buckets[cur_idx].key == key):
-                # Key found. Check if it's a tombstone.
-                if (self._buckets[cur_idx].is_tombstone == True):
-                    # Item existed but was deleted. Continue quadratic probing.
-                    j += 1
+        capacity = max(int(n_items / load_factor) + 1, 2 * (n_items - 1) + 1)
+        return cls(capacity, function, **kwargs)
+
+    def reserve(self, n_items: int) -> None:
+        """
+        Grows the table (it never shrinks it) so it can hold n_items keys in
+        total without the load factor reaching 0.5. Putting that many keys
+        then causes no resizes.
+        """
+        # put resizes when the load is >= 0.5 before inserting, so the
+        # last key is inserted with n_items - 1 entries already in the table
+        needed = 2 * (n_items - 1) + 1
+        if (needed > self._capacity):
+            self.resize_table(needed)
+
+    def shrink_to_fit(self) -> None:
+        """
+        Resizes the table to the smallest capacity that keeps the load
+        factor below 0.5, e.g. after many removes. This also clears out
+        every tombstone.
+        """
+        needed = self._round_capacity(2 * self._size + 1)
+        if (needed < self._capacity or self._tombstones > 0):
+            self.resize_table(needed)
+
+    def _round_capacity(self, capacity: int) -> int:
+        """
+        Returns capacity if it is usable as a table size, otherwise the next
+        prime (or power of two, depending on the probing strategy).
+        """
+        if (self._probing.power_of_two):
+            return _next_power_of_two(capacity)
+        if (is_prime(capacity) == False):
+            return next_prime(capacity)
+        return capacity
+
+    def is_rehashing(self) -> bool:
+        """
+        Returns True while an incremental resize is still migrating slots.
+        """
+        return self._old_buckets is not None
+
+    def rehash(self, n_slots: int = None) -> bool:
+        """
+        Migrates up to n_slots slots of an in-progress incremental resize
+        into the new table (all remaining slots, and those of any resize
+        waiting for it, if n_slots is None).
+        Returns True if slots are still left to migrate.
+        """
+        if (self._old_buckets is None):
+            return False
+
+        if (n_slots is None):
+            while (self.rehash(self._old_capacity)):
+                pass
+            return False
+
+        while (n_slots > 0 and self._rehash_idx < self._old_capacity):
+            entry = self._entry_at(self._old_buckets, self._rehash_idx)
+            if (entry is not None):
+                # Copy the entry over, then tombstone it in the old table so
+                # old probe sequences running through this slot still work.
+                key, value, hash_value = entry
+                idx, _ = self._find_slot(self._buckets, self._capacity, key, hash_value)
+                if (self._store_at(self._buckets, idx, key, value, hash_value)):
+                    self._tombstones -= 1
                 else:
-                    # Key found
-                    value = self._buckets[cur_idx].value
-                    done = True
-            else:
-                # Different key occupying index. Continue quadratic probing
-                j += 1
+                    self._mark_used(idx)
+                self._retire_at(self._old_buckets, self._rehash_idx)
+                self._old_size -= 1
+                if (self._stats is not None):
+                    self._stats.add(self._probe_length(hash_value, self._capacity, idx))
+            self._rehash_idx += 1
+            n_slots -= 1
+
+        if (self._rehash_idx == self._old_capacity):
+            self._old_buckets = None
+            if (self._pending_capacity is not None):
+                # Start the resize that was waiting for this one
+                new_capacity = self._pending_capacity
+                self._pending_capacity = None
+                self._start_rehash(new_capacity)
+                return True
+            return False
+        return True
+
+    def begin_resize(self, new_capacity: int) -> None:
+        """
+        Like resize_table, but only swaps in the new table. The entries are
+        then migrated a few slots at a time by later operations, or by
+        calling rehash. If a resize is still migrating, the new one starts
+        once it is done.
+        """
+        if (self._probing.robin_hood):
+            raise ValueError("Robin Hood probing does not support incremental resizing")
+
+        # Do nothing if new_capacity is less than num of elements
+        if (new_capacity < self._size):
+            return
+        self._start_rehash(new_capacity)
+
+    def _start_rehash(self, new_capacity: int) -> None:
+        """
+        Swaps in an empty table of (at least) new_capacity slots and keeps
+        the current one around to be migrated incrementally.
+        """
+        # Only one resize can be in flight at a time. Rather than finishing
+        # the running one here, queue this one (the largest asked for) to
+        # start when it is done.
+        if (self._old_buckets is not None):
+            if (self._pending_capacity is None or new_capacity > self._pending_capacity):
+                self._pending_capacity = new_capacity
+            return
+        start = perf_counter_ns()
+
+        new_capacity = self._round_capacity(new_capacity)
+
+        self._old_buckets = self._buckets
+        self._old_capacity = self._capacity
+        self._old_size = self._size
+        self._rehash_idx = 0
+        self._buckets = self._new_incremental_buckets(new_capacity)
+        self._capacity = new_capacity
+        self._version += 1
+        self._pop_cursor = 0
+        self._tombstones = 0
+        self._used = array('l')
+        self._used_flags = bytearray(new_capacity)
+
+        # The histogram only covers the new table, which starts out empty.
+        # Only the swap is timed; the migration is spread over later calls.
+        if (self._stats is not None):
+            self._stats.histogram = {}
+            self._stats.record_resize(perf_counter_ns() - start)
+
+    def get(self, key: str, default: object = None) -> object:
+        """
+        Returns value associated with key. Return default (None unless
+        given) if not in hash map.
+        """
+        return self._get(key, self._hash(key), default)
 
+    def setdefault(self, key: str, default: object = None) -> object:
+        """
+        Returns value associated with key. If key is not in the map, puts
+        key with value default first and returns default.
+        """
+        hash_value = self._hash(key)
+        value = self._get(key, hash_value, _MISSING)
+        if (value is _MISSING):
+            self._put(key, default, hash_value)
+            return default
         return value
 
+    def _get(self, key: str, hash_value: int, default: object) -> object:
+        """
+        get for a key whose hash has already been computed, returning
+        default if the key is not in the map.
+        """
+        if (self._old_buckets is not None):
+            self.rehash(self._rehash_step)
+
+        # Search via probing until key is found or an empty spot is found
+        idx, found = self._find_slot(self._buckets, self._capacity, key, hash_value)
+        if (found):
+            if (self._stats is not None):
+                self._stats.lookup(True)
+            return self._value_at(self._buckets, idx)
+
+        # Check the old table of an incremental resize
+        if (self._old_buckets is not None):
+            idx, found = self._find_slot(self._old_buckets, self._old_capacity,
+                                         key, hash_value)
+            if (found):
+                if (self._stats is not None):
+                    self._stats.lookup(True)
+                return self._value_at(self._old_buckets, idx)
+
+        if (self._stats is not None):
+            self._stats.lookup(False)
+        return default
+
     def contains_key(self, key: str) -> bool:
         """
         Returns True if the key is in the map. Else returns false.
         """
-        value = False
-
-        init_idx = self._hash_function(key) % self._capacity
-        j = 0
-        done = False
-        # Search via quadratic probing until key is found or an empty spot is found
-        while (done == False):
-            cur_idx = (init_idx + (j ** 2)) % self._capacity
-            if (self._buckets[cur_idx] == None):
-                # Item not in array
-                done = True
-            elif (self._buckets[cur_idx].key == key):
-                # Key found. Check if it's a tombstone.
-                if (self._buckets[cur_idx].is_tombstone == True):
-                    # Item existed but was deleted. Continue quadratic probing.
-                    j += 1
-                else:
-                    # Key found
-                    value = True
-                    done = True
-            else:
-                # Different key occupying index. Continue quadratic probing
-                j += 1
+        if (self._old_buckets is not None):
+            self.rehash(self._rehash_step)
 
-        return value
+        hash_value = self._hash(key)
+
+        # Search via probing until key is found or an empty spot is found
+        _, found = self._find_slot(self._buckets, self._capacity, key, hash_value)
+        if (not found and self._old_buckets is not None):
+            # Check the old table of an incremental resize
+            _, found = self._find_slot(self._old_buckets, self._old_capacity,
+                                       key, hash_value)
+
+        if (self._stats is not None):
+            self._stats.lookup(found)
+        return found
 
     def remove(self, key: str) -> None:
         """
         Removes the given key and its value from the map.
         If key not in hash map, does nothing.
         """
-        init_idx = self._hash_function(key) % self._capacity
-        j = 0
-        done = False
-        # Search via quadratic probing until key is found or an empty spot is found
-        while (done == False):
-            cur_idx = (init_idx + (j ** 2)) % self._capacity
-            if (self._buckets[cur_idx] == None):
-                # Item not in array
-                done = True
-            elif (self._buckets[cur_idx].key == key):
-                # Key found. Check if it's a tombstone.
-                if (self._buckets[cur_idx].is_tombstone == True):
-                    # Item existed but was deleted. Continue quadratic probing.
-                    j += 1
-                else:
-                    # Key found, delete it.
-                    self._buckets[cur_idx].is_tombstone = True
-                    self._size -= 1
-                    done = True
+        self._remove(key, self._hash(key))
+
+    def _remove(self, key: str, hash_value: int) -> object:
+        """
+        remove for a key whose hash has already been computed.
+        Returns the removed value, or _MISSING if the key was not present.
+        """
+        if (self._old_buckets is not None):
+            self.rehash(self._rehash_step)
+
+        # Search via probing until key is found or an empty spot is found
+        idx, found = self._find_slot(self._buckets, self._capacity, key, hash_value)
+        if (found):
+            value = self._value_at(self._buckets, idx)
+            if (self._stats is not None):
+                self._stats.discard(self._probe_length(hash_value, self._capacity, idx))
+            if (self._probing.robin_hood):
+                # Key found, shift the entries after it back over it.
+                self._robin_hood_delete(self._buckets, self._capacity, idx)
             else:
-                # Different key occupying index. Continue quadratic probing
-                j += 1
+                # Key found, delete it.
+                self._delete_at(self._buckets, idx)
+                self._tombstones += 1
+            self._size -= 1
+            self._version += 1
+            return value
+
+        if (self._old_buckets is not None):
+            # Check the old table of an incremental resize. Its tombstones
+            # go away with it, so they are not counted.
+            idx, found = self._find_slot(self._old_buckets, self._old_capacity,
+                                         key, hash_value)
+            if (found):
+                value = self._value_at(self._old_buckets, idx)
+                self._delete_at(self._old_buckets, idx)
+                self._old_size -= 1
+                self._size -= 1
+                self._version += 1
+                return value
+
+        return _MISSING
+
+    def clear(self, capacity: int = None) -> None:
+        """
+        Clears all contents of map. Capacity remains unchanged, unless
+        capacity is given, in which case the table is replaced by an empty
+        one of that capacity (rounded up to a prime, or a power of two) to
+        release the memory.
+        """
+        # Anything not yet migrated is simply dropped with the old table
+        self._old_buckets = None
+        self._old_size = 0
+        self._pending_capacity = None
+
+        if (capacity is None and len(self._used) * 4 < self._capacity):
+            # Few slots were filled since the last clear. Empty just those
+            # (tombstones included, as they were filled slots once).
+            for idx in self._used:
+                self._clear_at(self._buckets, idx)
+                self._used_flags[idx] = 0
+        else:
+            if (capacity is not None):
+                self._capacity = self._round_capacity(capacity)
+
+            # Swapping in a fresh table is a single block allocation, which
+            # is much cheaper than emptying most slots one at a time
+            self._buckets = self._new_buckets(self._capacity)
+            self._used_flags = bytearray(self._capacity)
+        self._used = array('l')
+        self._size = 0
+        self._version += 1
+        self._pop_cursor = 0
+        self._tombstones = 0
+
+        if (self._stats is not None):
+            self._stats.histogram = {}
+
+    # ------------------- Mapping protocol ------------------- #
+    # put, contains_key and get_size already do exactly what the matching
+    # dunders need, so they are aliased rather than wrapped.
+
+    __setitem__ = put
+    __contains__ = contains_key
+    __len__ = get_size
 
-    def clear(self) -> None:
+    def __getitem__(self, key: str) -> object:
         """
-        Clears all contents of map. Capacity remains unchanged.
+        Returns value associated with key. Raises KeyError if not present.
         """
+        value = self._get(key, self._hash(key), _MISSING)
+        if (value is _MISSING):
+            raise KeyError(key)
+        return value
+
+    def __delitem__(self, key: str) -> None:
+        """
+        Removes key from the map. Raises KeyError if not present.
+        """
+        if (self._remove(key, self._hash(key)) is _MISSING):
+            raise KeyError(key)
+
+    def pop(self, key: str, default: object = _MISSING) -> object:
+        """
+        Removes key and returns its value. If key is not present, returns
+        default, or raises KeyError if no default was given.
+        """
+        value = self._remove(key, self._hash(key))
+        if (value is _MISSING):
+            if (default is _MISSING):
+                raise KeyError(key)
+            return default
+        return value
+
+    def popitem(self) -> tuple:
+        """
+        Removes and returns some (key, value) pair. Raises KeyError if the
+        map is empty.
+        The scan for a live slot resumes where the last call stopped
+        (wrapping around), so draining the map is O(n + capacity).
+        """
+        if (self._size == 0):
+            raise KeyError('popitem(): HashMap is empty')
+
+        # Finish an incremental resize so every entry is in _buckets
+        self.rehash()
+
+        idx = self._pop_cursor % self._capacity
+        entry = self._entry_at(self._buckets, idx)
+        while (entry is None):
+            idx = (idx + 1) % self._capacity
+            entry = self._entry_at(self._buckets, idx)
+        self._pop_cursor = idx
+
+        key, value, hash_value = entry
+        self._remove(key, hash_value)
+        return key, value
+
+    def __eq__(self, other: object) -> bool:
+        """
+        Returns True if other is a mapping with the same keys and values,
+        like dict equality. Each key is looked up in other once.
+        """
+        if (not isinstance(other, Mapping)):
+            return NotImplemented
+        if (len(other) != self._size):
+            return False
+        for key, value in self._iter_items():
+            other_value = other.get(key, _MISSING)
+            if (other_value is _MISSING):
+                return False
+            if (other_value is not value and other_value != value):
+                return False
+        return True
+
+    def update(self, other=(), **kwargs) -> None:
+        """
+        Puts every pair from other (a mapping or an iterable of pairs) and
+        then every keyword argument, like dict.update.
+        """
+        self.put_many(other)
+        if (kwargs):
+            self.put_many(kwargs)
+
+    def copy(self) -> "HashMap":
+        """
+        Returns a shallow copy of the map with the same capacity, probing
+        and settings. Entries are copied with their cached hashes, so no
+        key is hashed again, and tombstones are left behind.
+        """
+        self.rehash()
+
+        new_map = copy(self)
+        new_map._buckets = self._new_buckets(self._capacity)
+        new_map._size = 0
+        new_map._tombstones = 0
+        new_map._version = 0
+        new_map._used = array('l')
+        new_map._used_flags = bytearray(self._capacity)
+
+        # The copy gets its own counters. Its histogram is filled by _put.
+        if (self._stats is not None):
+            new_map._stats = MapStats()
         for i in range(self._capacity):
-            self._buckets[i] = None
+            entry = self._entry_at(self._buckets, i)
+            if (entry is not None):
+                new_map._put(entry[0], entry[1], entry[2])
 
-        self._size = 0
+        return new_map
+
+    def dump(self, file) -> None:
+        """
+        Writes a snapshot of the map to file (a path or a binary file
+        object) that load can rebuild it from. The slots are streamed out
+        in chunks with their indexes and cached hashes, tombstones included
+        so probe sequences come back exactly as they were.
+        """
+        self.rehash()
+        header = {
+            'kind': 'oa',
+            'capacity': self._capacity,
+            'size': self._size,
+            'function': stable_hash_name(self._hash_function),
+            'probing': self._probing_name(),
+        }
+        write_snapshot(file, header, self._snapshot_records())
+
+    def _snapshot_records(self):
+        """
+        Generates the (slot index, hash, key, value) of every entry, and
+        (slot index, None, None, None) for every tombstone.
+        """
+        for i in range(self._capacity):
+            entry = self._entry_at(self._buckets, i)
+            if (entry is not None):
+                yield i, entry[2], entry[0], entry[1]
+            elif (self._is_tombstone_at(self._buckets, i)):
+                yield i, None, None, None
+
+    def _probing_name(self) -> str:
+        """
+        Returns the PROBING_STRATEGIES name of the map's probing strategy,
+        or None if it is a strategy of its own.
+        """
+        if (PROBING_STRATEGIES.get(self._probing.name) is type(self._probing)):
+            return self._probing.name
+        return None
+
+    @classmethod
+    def load(cls, file, function: callable = None, **kwargs) -> "HashMap":
+        """
+        Returns a HashMap rebuilt from a snapshot written by dump. Other
+        keyword arguments (probing, stats, ...) go to the constructor.
+
+        If the snapshot was made with the same named hash function and
+        probing strategy, every slot is filled straight from its record
+        without hashing or probing. Otherwise (a different function or
+        probing is given, or the snapshot's were not named ones) the keys
+        are hashed again with function.
+
+        Only load snapshots from a trusted source: the keys and values are
+        unpickled, which can run arbitrary code.
+        """
+        records = read_snapshot(file)
+        header = next(records)
+        if (header['kind'] != 'oa'):
+            raise ValueError("snapshot is not of an open addressing HashMap")
+
+        if (function is None):
+            if (header['function'] is None):
+                raise ValueError("snapshot was made with a hash function that "
+                                 "may differ between processes; pass function")
+            function = header['function']
+        function = get_hash_function(function)
+        kwargs.setdefault('probing', header['probing'] or 'quadratic')
+
+        hash_map = cls(header['capacity'], function, **kwargs)
+        if (function is not HASH_FUNCTIONS.get(header['function'])
+                or header['probing'] is None
+                or hash_map._probing_name() != header['probing']
+                or hash_map._capacity != header['capacity']):
+            # Stored slots are no use. Put every key again, sized up front.
+            hash_map = cls.with_expected_size(header['size'], function, **kwargs)
+            for _, hash_value, key, value in records:
+                if (hash_value is not None):
+                    hash_map.put(key, value)
+            return hash_map
+
+        buckets = hash_map._buckets
+        for idx, hash_value, key, value in records:
+            if (not 0 <= idx < hash_map._capacity):
+                raise ValueError("snapshot has a slot index past the end of the table")
+            hash_map._store_at(buckets, idx, key, value, hash_value or 0)
+            hash_map._mark_used(idx)
+            if (hash_value is None):
+                hash_map._delete_at(buckets, idx)
+                hash_map._tombstones += 1
+            else:
+                hash_map._size += 1
+                if (hash_map._stats is not None):
+                    hash_map._stats.add(hash_map._probe_length(hash_value, hash_map._capacity, idx))
+        return hash_map
+
+    def __iter__(self):
+        """
+        Iterate over the keys of the map.
+        """
+        return iter(self.keys())
+
+    def keys(self) -> KeysView:
+        """
+        Returns a lazy view of the keys in the map.
+        """
+        return KeysView(self)
+
+    def values(self) -> ValuesView:
+        """
+        Returns a lazy view of the values in the map.
+        """
+        return ValuesView(self)
+
+    def items(self) -> ItemsView:
+        """
+        Returns a lazy view of the (key, value) pairs in the map.
+        """
+        return ItemsView(self)
+
+    def _iter_items(self):
+        """
+        Generates the (key, value) pairs of the map one slot at a time,
+        without copying them. Raises RuntimeError if the map has entries
+        added, removed or moved while the generator is in use.
+        """
+        # Finish an incremental resize first so no entry moves mid-iteration
+        self.rehash()
+
+        version = self._version
+        buckets = self._buckets
+        for i in range(self._capacity):
+            entry = self._entry_at(buckets, i)
+            if (entry is not None):
+                yield entry[0], entry[1]
+                if (self._version != version):
+                    raise RuntimeError("HashMap changed during iteration")
+
+    def put_many(self, items) -> None:
+        """
+        Puts every (key, value) pair from items, which may be a DynamicArray
+        or any iterable of pairs, or a mapping. All keys are hashed in one
+        pass and the table is resized at most once up front (sized as if
+        every key were new) instead of every time the load reaches 0.5.
+        """
+        if (hasattr(items, 'items')):
+            items = items.items()
+        pairs = to_list(items)
+        hashes = self._hash_batch([pair[0] for pair in pairs])
+
+        self._reserve_for(len(pairs))
+
+        # Insert bucket by bucket. Pairs with the same key keep their order,
+        # so the last value for a key still wins.
+        for i in bucket_order(hashes, self._capacity):
+            self._put(pairs[i][0], pairs[i][1], hashes[i])
+
+    def get_many(self, keys, default: object = None) -> DynamicArray:
+        """
+        Returns a DynamicArray holding the value of each key in keys (a
+        DynamicArray or any iterable), or default for keys not in the map.
+        """
+        keys = to_list(keys)
+        hashes = self._hash_batch(keys)
+
+        values = []
+        for key, hash_value in zip(keys, hashes):
+            values.append(self._get(key, hash_value, default))
+
+        return DynamicArray(values)
+
+    def remove_many(self, keys) -> None:
+        """
+        Removes each key in keys (a DynamicArray or any iterable) from the
+        map. Keys that are not present are ignored.
+        """
+        keys = to_list(keys)
+        hashes = self._hash_batch(keys)
+
+        for key, hash_value in zip(keys, hashes):
+            self._remove(key, hash_value)
+
+    def _reserve_for(self, n_items: int) -> None:
+        """
+        Resizes the table once so that n_items more keys can be put without
+        the load factor reaching 0.5.
+        """
+        self.reserve(self._size + n_items)
 
     def get_keys_and_values(self) -> DynamicArray:
         """
@@ -358,12 +1112,365 @@ class HashMap:
 
         # Search through all buckets. Add all key/value pairs that aren't tombstones.
         for i in range(self._capacity):
-            if (self._buckets[i] != None):
-                if (self._buckets[i].is_tombstone == False):
-                    keys_with_values.append((self._buckets[i].key, self._buckets[i].value))
+            entry = self._entry_at(self._buckets, i)
+            if (entry is not None):
+                keys_with_values.append((entry[0], entry[1]))
+
+        # Include entries still waiting in the old table of a resize
+        if (self._old_buckets is not None):
+            for i in range(self._rehash_idx, self._old_capacity):
+                entry = self._entry_at(self._old_buckets, i)
+                if (entry is not None):
+                    keys_with_values.append((entry[0], entry[1]))
 
         return keys_with_values
 
+    def _robin_hood_insert(self, buckets, capacity: int,
+                           key: str, value: object, hash_value: int) -> None:
+        """
+        Inserts a key known not to be in buckets with Robin Hood linear
+        probing: whenever the entry in a slot is closer to its home slot
+        than the entry being inserted, they trade places and the displaced
+        entry continues probing.
+        """
+        idx = hash_value % capacity
+        distance = 0
+        while (True):
+            entry = self._entry_at(buckets, idx)
+            if (entry is None):
+                self._store_at(buckets, idx, key, value, hash_value)
+                self._mark_used(idx)
+                if (self._stats is not None):
+                    self._stats.add(distance + 1)
+                return
+
+            entry_distance = (idx - entry[2]) % capacity
+            if (entry_distance < distance):
+                # Take the slot and carry on inserting the displaced entry
+                self._store_at(buckets, idx, key, value, hash_value)
+                if (self._stats is not None):
+                    self._stats.move(entry_distance + 1, distance + 1)
+                key, value, hash_value = entry
+                distance = entry_distance
+
+            idx = (idx + 1) % capacity
+            distance += 1
+
+    def _robin_hood_delete(self, buckets, capacity: int, idx: int) -> None:
+        """
+        Removes the entry at idx by shifting each following entry that is
+        not in its home slot back by one, so no tombstone is needed.
+        """
+        next_idx = (idx + 1) % capacity
+        entry = self._entry_at(buckets, next_idx)
+        while (entry is not None and (next_idx - entry[2]) % capacity != 0):
+            self._store_at(buckets, idx, entry[0], entry[1], entry[2])
+            if (self._stats is not None):
+                distance = (next_idx - entry[2]) % capacity
+                self._stats.move(distance + 1, distance)
+            idx = next_idx
+            next_idx = (idx + 1) % capacity
+            entry = self._entry_at(buckets, next_idx)
+
+        self._clear_at(buckets, idx)
+
+    def _mark_used(self, idx: int) -> None:
+        """
+        Records that the slot at idx of _buckets went from empty to filled,
+        unless a quarter of the table is listed already (clear then swaps in
+        a fresh table anyway).
+        """
+        if (not self._used_flags[idx] and len(self._used) * 4 < self._capacity):
+            self._used_flags[idx] = 1
+            self._used.append(idx)
+
+    def _probe_length(self, hash_value: int, capacity: int, idx: int) -> int:
+        """
+        Returns how many probes it takes to reach idx from the home slot of
+        hash_value (1 if idx is the home slot). Only used for stats.
+        """
+        probes = 1
+        for cur_idx in self._probing.probe(hash_value, capacity):
+            if (cur_idx == idx):
+                return probes
+            probes += 1
+        return probes
+
+    # ------------------------- Slot storage ------------------------- #
+    # Everything that reads or writes individual slots goes through the
+    # methods below, so CompactHashMap only has to override these.
+
+    @staticmethod
+    def _new_buckets(capacity: int) -> DynamicArray:
+        """
+        Returns a bucket array of capacity empty slots.
+        """
+        return DynamicArray([None] * capacity)
+
+    @staticmethod
+    def _new_incremental_buckets(capacity: int) -> PagedArray:
+        """
+        Returns the empty table an incremental resize swaps in. Its slots
+        are only allocated a page at a time as they are filled, so the put
+        that starts the resize stays cheap.
+        """
+        return PagedArray(capacity, None)
+
+    def _hash(self, key: str) -> int:
+        """
+        Returns the hash of key that is stored with its entry.
+        """
+        return self._hash_function(key)
+
+    def _hash_batch(self, keys: list) -> list:
+        """
+        Returns the stored hash of every key in keys.
+        """
+        return hash_batch(keys, self._hash_function)
+
+    def _find_slot(self, buckets: DynamicArray, capacity: int,
+                   key: str, hash_value: int) -> (int, bool):
+        """
+        Probe buckets for key. Returns (index, True) if a live
+        entry with the key was found, otherwise (index, False) where index is
+        the first empty or deleted slot the key could be stored in.
+        """
+        free_idx = -1
+        for cur_idx in self._probing.probe(hash_value, capacity):
+            entry = buckets[cur_idx]
+            if (entry is None):
+                # End of the probe sequence. Key not in array.
+                if (free_idx == -1):
+                    free_idx = cur_idx
+                return free_idx, False
+            elif (entry.is_tombstone):
+                # Deleted item. Remember the first one so it can be reused.
+                if (free_idx == -1):
+                    free_idx = cur_idx
+            elif (entry.hash == hash_value and entry.key == key):
+                # Only compare keys when the cached hashes match
+                return cur_idx, True
+
+        return free_idx, False
+
+    @staticmethod
+    def _entry_at(buckets: DynamicArray, idx: int) -> tuple:
+        """
+        Returns (key, value, hash) of the live entry at idx, or None if the
+        slot is empty or a tombstone.
+        """
+        entry = buckets[idx]
+        if (entry is None or entry.is_tombstone):
+            return None
+        return entry.key, entry.value, entry.hash
+
+    @staticmethod
+    def _value_at(buckets: DynamicArray, idx: int) -> object:
+        """
+        Returns the value of the live entry at idx.
+        """
+        return buckets[idx].value
+
+    @staticmethod
+    def _set_value_at(buckets: DynamicArray, idx: int, value: object) -> None:
+        """
+        Replaces the value of the live entry at idx.
+        """
+        buckets[idx].value = value
+
+    @staticmethod
+    def _store_at(buckets: DynamicArray, idx: int,
+                  key: str, value: object, hash_value: int) -> bool:
+        """
+        Stores a new entry in the empty or deleted slot at idx.
+        Returns True if the slot was a tombstone.
+        """
+        reused = buckets[idx] is not None
+        buckets[idx] = HashEntry(key, value, hash_value)
+        return reused
+
+    @staticmethod
+    def _delete_at(buckets: DynamicArray, idx: int) -> None:
+        """
+        Turns the live entry at idx into a tombstone.
+        """
+        buckets[idx].is_tombstone = True
+
+    @staticmethod
+    def _retire_at(buckets: DynamicArray, idx: int) -> None:
+        """
+        Tombstones the slot at idx of the old table of an incremental
+        resize once its entry has been moved to the new table.
+        """
+        buckets[idx] = _RETIRED
+
+    @staticmethod
+    def _clear_at(buckets: DynamicArray, idx: int) -> None:
+        """
+        Turns the slot at idx back into an empty slot.
+        """
+        buckets[idx] = None
+
+    @staticmethod
+    def _is_tombstone_at(buckets: DynamicArray, idx: int) -> bool:
+        """
+        Returns True if the slot at idx is a tombstone.
+        """
+        return buckets[idx] is not None and buckets[idx].is_tombstone
+
+
+class CompactHashMap(HashMap):
+    """
+    Open addressing HashMap that keeps its table in a6_include.CompactBuckets:
+    parallel flat arrays of control bytes, hashes, keys and values rather
+    than a DynamicArray holding one HashEntry object per slot. Behaves
+    exactly like HashMap but needs far less memory per entry.
+    """
+
+    def __str__(self) -> str:
+        """
+        Override string method to provide the same output as HashMap
+        """
+        buckets = self._buckets
+        out = ''
+        for i in range(buckets.length()):
+            if (buckets.control[i] == CompactBuckets.EMPTY):
+                slot = 'None'
+            else:
+                slot = (f"K: {buckets.keys[i]} V: {buckets.values[i]} "
+                        f"TS: {buckets.control[i] == CompactBuckets.DELETED}")
+            out += str(i) + ': ' + slot + '\n'
+        return out
+
+    @staticmethod
+    def _new_buckets(capacity: int) -> CompactBuckets:
+        """
+        Returns a table of capacity empty slots.
+        """
+        return CompactBuckets(capacity)
+
+    @staticmethod
+    def _new_incremental_buckets(capacity: int) -> CompactBuckets:
+        """
+        Returns the empty table an incremental resize swaps in, with its
+        arrays allocated a page at a time as the slots are filled.
+        """
+        return CompactBuckets(capacity, paged=True)
+
+    def _hash(self, key: str) -> int:
+        """
+        Returns the hash of key, reduced to 64 bits so it fits in the
+        table's hash array.
+        """
+        return self._hash_function(key) & _HASH_MASK
+
+    def _hash_batch(self, keys: list) -> list:
+        """
+        Returns the stored hash of every key in keys.
+        """
+        return [hash_value & _HASH_MASK
+                for hash_value in hash_batch(keys, self._hash_function)]
+
+    def _find_slot(self, buckets: CompactBuckets, capacity: int,
+                   key: str, hash_value: int) -> (int, bool):
+        """
+        Probe buckets for key. Returns (index, True) if a live
+        entry with the key was found, otherwise (index, False) where index is
+        the first empty or deleted slot the key could be stored in.
+        """
+        control, hashes, keys = buckets.control, buckets.hashes, buckets.keys
+        free_idx = -1
+        for cur_idx in self._probing.probe(hash_value, capacity):
+            state = control[cur_idx]
+            if (state == CompactBuckets.EMPTY):
+                # End of the probe sequence. Key not in array.
+                if (free_idx == -1):
+                    free_idx = cur_idx
+                return free_idx, False
+            elif (state == CompactBuckets.DELETED):
+                # Deleted item. Remember the first one so it can be reused.
+                if (free_idx == -1):
+                    free_idx = cur_idx
+            elif (hashes[cur_idx] == hash_value and keys[cur_idx] == key):
+                # Only compare keys when the cached hashes match
+                return cur_idx, True
+
+        return free_idx, False
+
+    @staticmethod
+    def _entry_at(buckets: CompactBuckets, idx: int) -> tuple:
+        """
+        Returns (key, value, hash) of the live entry at idx, or None if the
+        slot is empty or a tombstone.
+        """
+        if (buckets.control[idx] != CompactBuckets.FULL):
+            return None
+        return buckets.keys[idx], buckets.values[idx], buckets.hashes[idx]
+
+    @staticmethod
+    def _value_at(buckets: CompactBuckets, idx: int) -> object:
+        """
+        Returns the value of the live entry at idx.
+        """
+        return buckets.values[idx]
+
+    @staticmethod
+    def _set_value_at(buckets: CompactBuckets, idx: int, value: object) -> None:
+        """
+        Replaces the value of the live entry at idx.
+        """
+        buckets.values[idx] = value
+
+    @staticmethod
+    def _store_at(buckets: CompactBuckets, idx: int,
+                  key: str, value: object, hash_value: int) -> bool:
+        """
+        Stores a new entry in the empty or deleted slot at idx.
+        Returns True if the slot was a tombstone.
+        """
+        reused = buckets.control[idx] == CompactBuckets.DELETED
+        buckets.control[idx] = CompactBuckets.FULL
+        buckets.hashes[idx] = hash_value
+        buckets.keys[idx] = key
+        buckets.values[idx] = value
+        return reused
+
+    @staticmethod
+    def _delete_at(buckets: CompactBuckets, idx: int) -> None:
+        """
+        Turns the live entry at idx into a tombstone, releasing its key and
+        value right away.
+        """
+        buckets.control[idx] = CompactBuckets.DELETED
+        buckets.keys[idx] = None
+        buckets.values[idx] = None
+
+    @staticmethod
+    def _retire_at(buckets: CompactBuckets, idx: int) -> None:
+        """
+        Tombstones the slot at idx of the old table of an incremental
+        resize once its entry has been moved to the new table.
+        """
+        buckets.control[idx] = CompactBuckets.DELETED
+        buckets.keys[idx] = None
+        buckets.values[idx] = None
+
+    @staticmethod
+    def _clear_at(buckets: CompactBuckets, idx: int) -> None:
+        """
+        Turns the slot at idx back into an empty slot.
+        """
+        buckets.control[idx] = CompactBuckets.EMPTY
+        buckets.keys[idx] = None
+        buckets.values[idx] = None
+
+    @staticmethod
+    def _is_tombstone_at(buckets: CompactBuckets, idx: int) -> bool:
+        """
+        Returns True if the slot at idx is a tombstone.
+        """
+        return buckets.control[idx] == CompactBuckets.DELETED
+
 
 # ------------------- BASIC TESTING ---------------------------------------- #
 
@@ -6,29 +6,123 @@
 # Description: Implementation of Separate Chaining HashMap
 
 
-from a6_include import (DynamicArray, LinkedList,
-                        hash_function_1, hash_function_2)
-
-
-class HashMap:
+import itertools
+from array import array
+from collections import deque
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from heapq import heapify, heappop, heappush
+from itertools import islice
+from math import ceil, e, log
+from os import PathLike
+from time import perf_counter_ns
+
+from a6_include import (DynamicArray, HASH_FUNCTIONS, ItemsView, KeysView, LinkedList,
+                        MapStats, PagedArray, ValuesView, bucket_order,
+                        get_hash_function, hash_batch, hash_function_1, hash_function_2,
+                        hash_xx64, is_prime, next_prime, to_list)
+from snapshot import read_snapshot, stable_hash_name, write_snapshot
+
+
+# Default for arguments where None is a legitimate value
+_MISSING = object()
+
+# Stands in for every bucket of a table swapped in by an incremental
+# resize, so the swap does not create a LinkedList per bucket. It is never
+# inserted into: the first insert into such a bucket puts a real
+# LinkedList in its place.
+_EMPTY_BUCKET = LinkedList()
+
+
+class HashMap(MutableMapping):
     def __init__(self,
                  capacity: int = 11,
-                 function: callable = hash_function_1) -> None:
+                 function: callable = hash_function_1,
+                 max_load: float = None,
+                 min_load: float = None,
+                 incremental: bool = False,
+                 rehash_step: int = 8,
+                 stats: bool = False,
+                 debug: bool = False) -> None:
         """
         Initialize new HashMap that uses
         separate chaining for collision resolution
-        DO NOT CHANGE THIS METHOD IN ANY WAY
+
+        function: a hash function, or the name of one from
+                  a6_include.HASH_FUNCTIONS (e.g. 'blake2b', 'fnv1a').
+        max_load: if given, the table grows once the load factor exceeds it.
+        min_load: if given, the table shrinks (never below its initial
+                  capacity) once a remove drops the load factor below it.
+        Both default to None, which keeps the table at a fixed capacity.
+        incremental: if True, resizes triggered by the load factor policy
+                     migrate rehash_step buckets per operation instead of
+                     rehashing the whole table inside a single put/remove.
+        stats: if True, keep a chain length histogram, hit / miss counts
+               and resize timings, readable through get_stats().
+        debug: if True, empty_buckets() checks its counter against a full
+               scan of the table and raises RuntimeError if they differ.
         """
+        if (max_load is not None and max_load <= 0):
+            raise ValueError("max_load must be greater than 0")
+        if (min_load is not None and min_load < 0):
+            raise ValueError("min_load must not be negative")
+        if (max_load is not None and min_load is not None
+                and min_load * 2 >= max_load):
+            # Halving the table doubles the load, so this gap keeps a
+            # shrink from immediately triggering another grow.
+            raise ValueError("min_load must be less than half of max_load")
+        if (rehash_step < 1):
+            raise ValueError("rehash_step must be at least 1")
+
         self._buckets = DynamicArray()
 
         # capacity must be a prime number
-        self._capacity = self._next_prime(capacity)
+        self._capacity = next_prime(capacity)
         for _ in range(self._capacity):
             self._buckets.append(LinkedList())
 
-        self._hash_function = function
+        self._hash_function = get_hash_function(function)
         self._size = 0
 
+        # Load factor policy
+        self._max_load = max_load
+        self._min_load = min_load
+        self._min_capacity = self._capacity
+
+        # Incremental rehashing. While a resize is in progress the previous
+        # bucket array is kept in _old_buckets and migrated a few buckets
+        # at a time by each put / get / contains_key / remove.
+        self._incremental = incremental
+        self._rehash_step = rehash_step
+        self._old_buckets = None
+        self._old_capacity = 0
+        self._rehash_idx = 0
+
+        # Bumped whenever entries are added, removed or moved to a new table,
+        # so iterators can tell the map changed underneath them
+        self._version = 0
+
+        # Bucket popitem carries on scanning from, so draining the map with
+        # popitem does not walk the emptied buckets again on every call
+        self._pop_cursor = 0
+
+        # Number of empty buckets in _buckets, kept up to date by every
+        # operation so empty_buckets() does not have to scan the table
+        self._empty_count = self._capacity
+        self._debug = debug
+
+        # Indexes of the buckets that have held an entry since the last
+        # clear (each listed once, flagged in _used_flags), so clear only
+        # has to visit those instead of every bucket. Kept as a flat array
+        # of machine ints, and only until it covers a quarter of the table:
+        # past that, clear just swaps in a fresh table.
+        self._used = array('l')
+        self._used_flags = bytearray(self._capacity)
+
+        # Optional instrumentation. Every bucket starts out empty.
+        self._stats = MapStats({0: self._capacity}) if stats else None
+
     def __str__(self) -> str:
         """
         Override string method to provide more readable output
@@ -93,22 +187,138 @@ class HashMap:
         Updates the given key/value pair. If the key is already present,
         update the value to the new value. If not, add to hash map.
         """
+        bucket, node, hash_value = self._find(key)
+        if (node is not None):
+            # Found node in SLL
+            node.value = value
+        else:
+            # Key not found. Create new Node
+            self._insert(bucket, key, value, hash_value)
+
+    def setdefault(self, key: str, default: object = None) -> object:
+        """
+        Returns the value for key. If the key is not present, it is added
+        with the given default value first.
+        """
+        bucket, node, hash_value = self._find(key)
+        if (node is not None):
+            return node.value
+
+        self._insert(bucket, key, default, hash_value)
+        return default
+
+    def get_or_insert(self, key: str, factory: callable) -> object:
+        """
+        Returns the value for key. If the key is not present, factory() is
+        called to create its value, which is added and returned. Unlike
+        setdefault, the value is only built when it is actually needed.
+        """
+        bucket, node, hash_value = self._find(key)
+        if (node is not None):
+            return node.value
+
+        value = factory()
+        self._insert(bucket, key, value, hash_value)
+        return value
+
+    def upsert(self, key: str, func: callable, default: object = None) -> object:
+        """
+        Stores func(current value) for key, using default as the current
+        value if the key is not present. Returns the stored value.
+        """
+        bucket, node, hash_value = self._find(key)
+        if (node is not None):
+            node.value = func(node.value)
+            return node.value
+
+        value = func(default)
+        self._insert(bucket, key, value, hash_value)
+        return value
+
+    def increment(self, key: str, delta: int = 1) -> int:
+        """
+        Adds delta to the value for key, treating a missing key as 0.
+        Returns the new value.
+        """
+        return self._increment(key, delta, None)
+
+    def _increment(self, key: str, delta: int, hash_value: int) -> int:
+        """
+        increment for a key whose hash may already have been computed.
+        """
+        bucket, node, hash_value = self._find(key, hash_value)
+        if (node is not None):
+            node.value += delta
+            return node.value
+
+        self._insert(bucket, key, delta, hash_value)
+        return delta
+
+    def _find(self, key: str, hash_value: int = None) -> (LinkedList, object, int):
+        """
+        Hashes key once (unless its hash is given) and walks its chain once.
+        Returns (bucket, node, hash) where bucket is the SLL a new node for
+        key belongs in, node is the node holding key (or None if the key is
+        not present) and hash is the key's hash.
+        """
+        if (self._old_buckets is not None):
+            self.rehash(self._rehash_step)
+
         # Get index by hashing key and modding by array size
-        hash_value = self._hash_function(key)
-        idx = hash_value % self._capacity
+        if (hash_value is None):
+            hash_value = self._hash_function(key)
+        bucket = self._buckets[hash_value % self._capacity]
 
         # Check the bucket at found index for key
-        if (self._buckets[idx].contains(key) != None):
-            # Found node in SLL at idx
-            self._buckets[idx].contains(key).value = value
-        else:
-            # Key not found. Create new Node
-            self._buckets[idx].insert(key, value)
-            self._size += 1
+        node = bucket.contains(key, hash_value)
+        if (node is None):
+            # Key may still be waiting in the old table of an incremental resize
+            old_bucket = self._old_bucket(hash_value)
+            if (old_bucket is not None):
+                node = old_bucket.contains(key, hash_value)
+
+        return bucket, node, hash_value
+
+    def _insert(self, bucket: LinkedList, key: str, value: object,
+                hash_value: int) -> None:
+        """
+        Adds a key known not to be in the map to bucket, growing the table
+        if that pushes the load factor past max_load.
+        """
+        if (self._stats is not None):
+            self._stats.move(bucket.length(), bucket.length() + 1)
+        if (bucket.length() == 0):
+            self._empty_count -= 1
+            idx = hash_value % self._capacity
+            if (bucket is _EMPTY_BUCKET):
+                bucket = LinkedList()
+                self._buckets[idx] = bucket
+            self._mark_used(idx)
+        bucket.insert(key, value, hash_value)
+        self._size += 1
+        self._version += 1
+
+        # Grow if the new element pushed us past the max load factor.
+        # Doubling keeps the cost of rehashing amortized O(1) per put.
+        if (self._max_load is not None
+                and self._size / self._capacity > self._max_load):
+            self._grow_or_shrink(self._capacity * 2)
 
     def empty_buckets(self) -> int:
         """
-        Returns number of empty buckets in the table.
+        Returns number of empty buckets in the table. The count is kept up
+        to date as buckets fill and empty, so this is O(1).
+        """
+        if (self._debug):
+            scanned = self._scan_empty_buckets()
+            if (scanned != self._empty_count):
+                raise RuntimeError(f"empty bucket count is {self._empty_count}, "
+                                   f"but a scan found {scanned}")
+        return self._empty_count
+
+    def _scan_empty_buckets(self) -> int:
+        """
+        Counts the empty buckets the slow way.
         Iterate through all indexes and increment empty bucket count
         for each SLL with length 0.
         """
@@ -126,16 +336,57 @@ class HashMap:
         """
         return self._size / self._capacity
 
-    def clear(self) -> None:
+    def get_stats(self) -> dict:
         """
-        Clears all contents. Leaves capacity as is.
-        Iterate through all indexes and set each bucket head to None and size
-        to 0.
+        Returns the instrumentation counters as a dict, or None if the map
+        was not created with stats=True. histogram maps a chain length to
+        the number of buckets of the current table with that length.
         """
-        for i in range(self._capacity):
-            self._buckets[i]._head = None
-            self._buckets[i]._size = 0
+        if (self._stats is None):
+            return None
+
+        stats = self._stats.as_dict()
+        stats['size'] = self._size
+        stats['capacity'] = self._capacity
+        stats['load'] = self._size / self._capacity
+        stats['rehashing'] = self._old_buckets is not None
+        return stats
+
+    def clear(self, capacity: int = None) -> None:
+        """
+        Clears all contents. Leaves capacity as is, unless capacity is
+        given, in which case the table is replaced by an empty one of that
+        capacity (rounded up to a prime) to release the memory.
+        Only the buckets used since the last clear are emptied, so the cost
+        is paid for by the puts that filled them rather than the capacity.
+        """
+        # Anything not yet migrated is simply dropped with the old table
+        self._old_buckets = None
+
+        if (capacity is None and len(self._used) * 4 < self._capacity):
+            for i in self._used:
+                self._buckets[i].clear()
+                self._used_flags[i] = 0
+        else:
+            if (capacity is not None):
+                if (is_prime(capacity) == False):
+                    capacity = next_prime(capacity)
+                self._capacity = capacity
+
+            # A new capacity, or too many used buckets to have listed them.
+            # Swap in a fresh table, whose buckets are only made once
+            # something goes in them.
+            self._buckets = PagedArray(self._capacity, _EMPTY_BUCKET)
+            self._used_flags = bytearray(self._capacity)
+        self._used = array('l')
+
         self._size = 0
+        self._version += 1
+        self._pop_cursor = 0
+        self._empty_count = self._capacity
+
+        if (self._stats is not None):
+            self._stats.histogram = {0: self._capacity}
 
     def resize_table(self, new_capacity: int) -> None:
         """
@@ -146,9 +397,13 @@ class HashMap:
         if (new_capacity < 1):
             return
 
+        # Finish any incremental resize first so every entry is in _buckets
+        self.rehash()
+        start = perf_counter_ns()
+
         # Check that new_capacity is prime. If not, make it the next largest prime.
-        if (self._is_prime(new_capacity) == False):
-            new_capacity = self._next_prime(new_capacity)
+        if (is_prime(new_capacity) == False):
+            new_capacity = next_prime(new_capacity)
 
         # Make new bucket array with new_capacity size
         new_buckets = DynamicArray()
@@ -158,56 +413,523 @@ class HashMap:
         # Iterate through current hash_map and rehash into new bucket array
         for i in range(self._capacity):
             for j in self._buckets[i]:
-                new_idx = self._hash_function(j.key) % new_capacity
-                new_buckets[new_idx].insert(j.key, j.value)
+                # Reuse the cached hash instead of hashing the key again
+                new_idx = j.hash % new_capacity
+                new_buckets[new_idx].insert(j.key, j.value, j.hash)
 
         self._buckets = new_buckets
         self._capacity = new_capacity
+        self._version += 1
+        self._pop_cursor = 0
 
-    def get(self, key: str) -> object:
+        # Every entry moved, so the counts are worked out again
+        self._recount_buckets()
+        if (self._stats is not None):
+            self._stats.record_resize(perf_counter_ns() - start)
+
+    def _recount_buckets(self) -> None:
         """
-        Return value associated with provided key.
-        Return None if key not present.
+        Works out the empty count, the used buckets and the chain length
+        histogram from scratch after the buckets were filled directly.
         """
-        # Get index by hashing key and modding by array size
-        hash_value = self._hash_function(key)
-        idx = hash_value % self._capacity
+        self._empty_count = 0
+        self._used = array('l')
+        self._used_flags = bytearray(self._capacity)
+        for i in range(self._capacity):
+            if (self._buckets[i].length() == 0):
+                self._empty_count += 1
+            else:
+                self._mark_used(i)
+
+        if (self._stats is not None):
+            self._stats.histogram = {}
+            for i in range(self._capacity):
+                self._stats.add(self._buckets[i].length())
+
+    @classmethod
+    def with_expected_size(cls, n_items: int, function: callable = hash_function_1,
+                           load_factor: float = 1.0, **kwargs) -> "HashMap":
+        """
+        Returns an empty HashMap with enough buckets for n_items keys at the
+        given load factor, so loading them never resizes the table.
+        Other keyword arguments (max_load, stats, ...) go to the constructor.
+        """
+        if (load_factor <= 0):
+            raise ValueError("load_factor must be greater than 0")
 
-        # Check the bucket at found index for key
-        if (self._buckets[idx].contains(key) != None):
-            # Found node in SLL at idx
-            return self._buckets[idx].contains(key).value
-        else:
-            # Key not found.
+        # A max_load below load_factor would still grow the table
+        max_load = kwargs.get('max_load')
+        if (max_load is not None and max_load < load_factor):
+            load_factor = max_load
+
+        return cls(int(n_items / load_factor) + 1, function, **kwargs)
+
+    def reserve(self, n_items: int) -> None:
+        """
+        Grows the table (it never shrinks it) so it can hold n_items keys in
+        total without the load factor passing max_load, or 1.0 if the map
+        has no max_load. Putting that many keys then causes no resizes.
+        """
+        load = self._max_load if self._max_load is not None else 1.0
+        needed = int(n_items / load) + 1
+        if (needed > self._capacity):
+            self.resize_table(needed)
+
+    def shrink_to_fit(self) -> None:
+        """
+        Resizes the table to the smallest prime capacity that holds the
+        current keys at max_load (or 1.0), e.g. after many removes. Unlike
+        the min_load policy, this may go below the initial capacity.
+        """
+        load = self._max_load if self._max_load is not None else 1.0
+        needed = next_prime(int(self._size / load) + 1)
+        if (needed < self._capacity):
+            self.resize_table(needed)
+
+    def is_rehashing(self) -> bool:
+        """
+        Returns True while an incremental resize is still migrating buckets.
+        """
+        return self._old_buckets is not None
+
+    def rehash(self, n_buckets: int = None) -> bool:
+        """
+        Migrates up to n_buckets buckets of an in-progress incremental resize
+        into the new table (all remaining buckets if n_buckets is None).
+        Returns True if buckets are still left to migrate.
+        """
+        if (self._old_buckets is None):
+            return False
+
+        if (n_buckets is None):
+            n_buckets = self._old_capacity
+
+        # Move every node of the next old bucket into the new table
+        while (n_buckets > 0 and self._rehash_idx < self._old_capacity):
+            for node in self._old_buckets[self._rehash_idx]:
+                new_idx = node.hash % self._capacity
+                bucket = self._buckets[new_idx]
+                if (self._stats is not None):
+                    self._stats.move(bucket.length(), bucket.length() + 1)
+                if (bucket.length() == 0):
+                    self._empty_count -= 1
+                    if (bucket is _EMPTY_BUCKET):
+                        bucket = LinkedList()
+                        self._buckets[new_idx] = bucket
+                    self._mark_used(new_idx)
+                bucket.insert(node.key, node.value, node.hash)
+            self._old_buckets[self._rehash_idx] = None
+            self._rehash_idx += 1
+            n_buckets -= 1
+
+        if (self._rehash_idx == self._old_capacity):
+            self._old_buckets = None
+            return False
+        return True
+
+    def _grow_or_shrink(self, new_capacity: int) -> None:
+        """
+        Resizes the table for the load factor policy, either all at once or
+        incrementally depending on how the map was configured.
+        """
+        if (not self._incremental):
+            self.resize_table(new_capacity)
+            return
+
+        # Only one resize can be in flight at a time
+        self.rehash()
+        start = perf_counter_ns()
+
+        if (is_prime(new_capacity) == False):
+            new_capacity = next_prime(new_capacity)
+
+        # Buckets (and the pages holding them) are only made when something
+        # is first put in them, so the put starting the resize stays cheap
+        new_buckets = PagedArray(new_capacity, _EMPTY_BUCKET)
+
+        self._old_buckets = self._buckets
+        self._old_capacity = self._capacity
+        self._rehash_idx = 0
+        self._buckets = new_buckets
+        self._capacity = new_capacity
+        self._version += 1
+        self._pop_cursor = 0
+        self._empty_count = new_capacity
+        self._used = array('l')
+        self._used_flags = bytearray(new_capacity)
+
+        # The histogram only covers the new table, which starts out empty.
+        # Only the swap is timed; the migration is spread over later calls.
+        if (self._stats is not None):
+            self._stats.histogram = {0: new_capacity}
+            self._stats.record_resize(perf_counter_ns() - start)
+
+    def _mark_used(self, idx: int) -> None:
+        """
+        Records that bucket idx of _buckets went from empty to filled,
+        unless a quarter of the table is listed already.
+        """
+        if (not self._used_flags[idx] and len(self._used) * 4 < self._capacity):
+            self._used_flags[idx] = 1
+            self._used.append(idx)
+
+    def _old_bucket(self, hash_value: int) -> LinkedList:
+        """
+        Returns the not yet migrated old bucket for hash_value, or None if
+        there is no resize in progress or that bucket was already moved.
+        """
+        if (self._old_buckets is None):
             return None
+        return self._old_buckets[hash_value % self._old_capacity]
+
+    def get(self, key: str, default: object = None) -> object:
+        """
+        Return value associated with provided key.
+        Return default (None unless given) if key not present.
+        """
+        _, node, _ = self._find(key)
+        if (self._stats is not None):
+            self._stats.lookup(node is not None)
+        if (node is None):
+            # Key not found.
+            return default
+        return node.value
 
     def contains_key(self, key: str) -> bool:
         """
         Returns True if the key is in the map. Else returns False.
         """
-        # Get index by hashing key and modding by array size
-        hash_value = self._hash_function(key)
+        _, node, _ = self._find(key)
+        if (self._stats is not None):
+            self._stats.lookup(node is not None)
+        return node is not None
+
+    def remove(self, key: str) -> None:
+        """
+        Removes key / value pair from Hash Map using given key.
+        """
+        self._remove(key, self._hash_function(key))
+
+    def _remove(self, key: str, hash_value: int) -> object:
+        """
+        remove for a key whose hash has already been computed.
+        Returns the removed value, or _MISSING if the key was not present.
+        """
+        if (self._old_buckets is not None):
+            self.rehash(self._rehash_step)
+
+        # Get index by modding hash by array size
         idx = hash_value % self._capacity
 
-        # Check the bucket at found index for key
-        if (self._buckets[idx].contains(key) != None):
-            # Found node in SLL at idx
-            return True
+        # Try to remove key from LL at that idx, then from the old table
+        bucket = self._buckets[idx]
+        node = bucket.pop(key, hash_value)
+        if (node is not None):
+            if (self._stats is not None):
+                self._stats.move(bucket.length() + 1, bucket.length())
+            if (bucket.length() == 0):
+                self._empty_count += 1
         else:
-            # Key not found.
+            old_bucket = self._old_bucket(hash_value)
+            if (old_bucket is not None):
+                node = old_bucket.pop(key, hash_value)
+
+        if (node is None):
+            return _MISSING
+
+        self._size -= 1
+        self._version += 1
+
+        # Shrink if the load factor dropped below the min load factor,
+        # but never below the capacity the map was created with.
+        if (self._min_load is not None
+                and self._capacity > self._min_capacity
+                and self._size / self._capacity < self._min_load):
+            self._grow_or_shrink(max(self._capacity // 2, self._min_capacity))
+
+        return node.value
+
+    # ------------------- Mapping protocol ------------------- #
+    # put, contains_key and get_size already do exactly what the matching
+    # dunders need, so they are aliased rather than wrapped.
+
+    __setitem__ = put
+    __contains__ = contains_key
+    __len__ = get_size
+
+    def __getitem__(self, key: str) -> object:
+        """
+        Return value associated with key. Raise KeyError if not present.
+        """
+        _, node, _ = self._find(key)
+        if (self._stats is not None):
+            self._stats.lookup(node is not None)
+        if (node is None):
+            raise KeyError(key)
+        return node.value
+
+    def __delitem__(self, key: str) -> None:
+        """
+        Remove key from the map. Raise KeyError if not present.
+        """
+        if (self._remove(key, self._hash_function(key)) is _MISSING):
+            raise KeyError(key)
+
+    def pop(self, key: str, default: object = _MISSING) -> object:
+        """
+        Remove key and return its value. If key is not present, return
+        default, or raise KeyError if no default was given.
+        """
+        value = self._remove(key, self._hash_function(key))
+        if (value is _MISSING):
+            if (default is _MISSING):
+                raise KeyError(key)
+            return default
+        return value
+
+    def popitem(self) -> tuple:
+        """
+        Remove and return some (key, value) pair. Raise KeyError if the
+        map is empty.
+        The scan for a non-empty bucket resumes where the last call
+        stopped (wrapping around), so draining the map is O(n + capacity).
+        """
+        if (self._size == 0):
+            raise KeyError('popitem(): HashMap is empty')
+
+        # Finish an incremental resize so every entry is in _buckets
+        self.rehash()
+
+        idx = self._pop_cursor % self._capacity
+        while (self._buckets[idx].length() == 0):
+            idx = (idx + 1) % self._capacity
+        self._pop_cursor = idx
+
+        node = next(iter(self._buckets[idx]))
+        key, value = node.key, node.value
+        self._remove(key, node.hash)
+        return key, value
+
+    def __eq__(self, other: object) -> bool:
+        """
+        Returns True if other is a mapping with the same keys and values,
+        like dict equality. Each key is looked up in other once.
+        """
+        if (not isinstance(other, Mapping)):
+            return NotImplemented
+        if (len(other) != self._size):
             return False
+        for key, value in self._iter_items():
+            other_value = other.get(key, _MISSING)
+            if (other_value is _MISSING):
+                return False
+            if (other_value is not value and other_value != value):
+                return False
+        return True
 
-    def remove(self, key: str) -> None:
+    def update(self, other=(), **kwargs) -> None:
         """
-        Removes key / value pair from Hash Map using given key.
+        Put every pair from other (a mapping or an iterable of pairs) and
+        then every keyword argument, like dict.update.
         """
-        # Get index by hashing key and modding by array size
-        hash_value = self._hash_function(key)
-        idx = hash_value % self._capacity
+        self.put_many(other)
+        if (kwargs):
+            self.put_many(kwargs)
+
+    def copy(self) -> "HashMap":
+        """
+        Return a shallow copy of the map with the same capacity and
+        settings. Entries are copied with their cached hashes, so no key
+        is hashed again.
+        """
+        self.rehash()
+
+        new_map = copy(self)
+        new_map._buckets = DynamicArray()
+        for i in range(self._capacity):
+            bucket = LinkedList()
+            for node in self._buckets[i]:
+                bucket.insert(node.key, node.value, node.hash)
+            new_map._buckets.append(bucket)
+        new_map._version = 0
+        new_map._used = self._used[:]
+        new_map._used_flags = self._used_flags.copy()
+
+        # The copy gets its own counters, starting from the same table shape
+        if (self._stats is not None):
+            new_map._stats = MapStats(dict(self._stats.histogram))
+
+        return new_map
+
+    def dump(self, file) -> None:
+        """
+        Writes a snapshot of the map to file (a path or a binary file
+        object) that load can rebuild it from. The entries are streamed out
+        in chunks with their bucket indexes and cached hashes.
+        """
+        self.rehash()
+        header = {
+            'kind': 'sc',
+            'capacity': self._capacity,
+            'size': self._size,
+            'function': stable_hash_name(self._hash_function),
+        }
+        write_snapshot(file, header, self._snapshot_records())
+
+    def _snapshot_records(self):
+        """
+        Generates the (bucket index, hash, key, value) of every entry.
+        """
+        for i in range(self._capacity):
+            # Newest node last, so inserting in order rebuilds the chain
+            for node in reversed(list(self._buckets[i])):
+                yield i, node.hash, node.key, node.value
+
+    @classmethod
+    def load(cls, file, function: callable = None, **kwargs) -> "HashMap":
+        """
+        Returns a HashMap rebuilt from a snapshot written by dump. Other
+        keyword arguments (max_load, stats, ...) go to the constructor.
+
+        If the snapshot was made with the same named hash function, every
+        entry goes straight back into its recorded bucket without being
+        hashed again. Otherwise (a different function is given, or the
+        snapshot's function was not one of STABLE_HASH_FUNCTIONS) the keys
+        are hashed again with function.
+
+        Only load snapshots from a trusted source: the keys and values are
+        unpickled, which can run arbitrary code.
+        """
+        records = read_snapshot(file)
+        header = next(records)
+        if (header['kind'] != 'sc'):
+            raise ValueError("snapshot is not of a separate chaining HashMap")
+
+        if (function is None):
+            if (header['function'] is None):
+                raise ValueError("snapshot was made with a hash function that "
+                                 "may differ between processes; pass function")
+            function = header['function']
+        function = get_hash_function(function)
+
+        if (function is not HASH_FUNCTIONS.get(header['function'])):
+            # Stored hashes are no use. Put every key again, sized up front.
+            hash_map = cls.with_expected_size(header['size'], function, **kwargs)
+            for _, _, key, value in records:
+                hash_map.put(key, value)
+            return hash_map
+
+        hash_map = cls(header['capacity'], function, **kwargs)
+        buckets = hash_map._buckets
+        for idx, hash_value, key, value in records:
+            if (not 0 <= idx < hash_map._capacity):
+                raise ValueError("snapshot has a bucket index past the end of the table")
+            buckets[idx].insert(key, value, hash_value)
+            hash_map._size += 1
+        hash_map._recount_buckets()
+        return hash_map
+
+    def __iter__(self):
+        """
+        Iterate over the keys of the map.
+        """
+        return iter(self.keys())
+
+    def keys(self) -> KeysView:
+        """
+        Returns a lazy view of the keys in the map.
+        """
+        return KeysView(self)
+
+    def values(self) -> ValuesView:
+        """
+        Returns a lazy view of the values in the map.
+        """
+        return ValuesView(self)
+
+    def items(self) -> ItemsView:
+        """
+        Returns a lazy view of the (key, value) pairs in the map.
+        """
+        return ItemsView(self)
+
+    def _iter_items(self):
+        """
+        Generates the (key, value) pairs of the map one bucket at a time,
+        without copying them. Raises RuntimeError if the map has entries
+        added, removed or moved while the generator is in use.
+        """
+        # Finish an incremental resize first so no entry moves mid-iteration
+        self.rehash()
+
+        version = self._version
+        buckets = self._buckets
+        for i in range(self._capacity):
+            for node in buckets[i]:
+                yield node.key, node.value
+                if (self._version != version):
+                    raise RuntimeError("HashMap changed during iteration")
+
+    def put_many(self, items) -> None:
+        """
+        Puts every (key, value) pair from items, which may be a DynamicArray
+        or any iterable of pairs, or a mapping. All keys are hashed in one
+        pass and the table is grown at most once up front, sized as if
+        every key were new.
+        """
+        if (hasattr(items, 'items')):
+            items = items.items()
+        pairs = to_list(items)
+        hashes = hash_batch([pair[0] for pair in pairs], self._hash_function)
+
+        self._reserve_for(len(pairs))
+
+        # Insert bucket by bucket. Pairs with the same key keep their order,
+        # so the last value for a key still wins.
+        for i in bucket_order(hashes, self._capacity):
+            key, value = pairs[i]
+            hash_value = hashes[i]
+            bucket, node, _ = self._find(key, hash_value)
+            if (node is not None):
+                node.value = value
+            else:
+                self._insert(bucket, key, value, hash_value)
+
+    def get_many(self, keys, default: object = None) -> DynamicArray:
+        """
+        Returns a DynamicArray holding the value of each key in keys (a
+        DynamicArray or any iterable), or default for keys not in the map.
+        """
+        keys = to_list(keys)
+        hashes = hash_batch(keys, self._hash_function)
 
-        # Try to remove key from LL at that idx
-        if (self._buckets[idx].remove(key)):
-            self._size -= 1
+        values = []
+        for key, hash_value in zip(keys, hashes):
+            _, node, _ = self._find(key, hash_value)
+            if (self._stats is not None):
+                self._stats.lookup(node is not None)
+            values.append(default if node is None else node.value)
+
+        return DynamicArray(values)
+
+    def remove_many(self, keys) -> None:
+        """
+        Removes each key in keys (a DynamicArray or any iterable) from the
+        map. Keys that are not present are ignored.
+        """
+        keys = to_list(keys)
+        hashes = hash_batch(keys, self._hash_function)
+
+        for key, hash_value in zip(keys, hashes):
+            self._remove(key, hash_value)
+
+    def _reserve_for(self, n_items: int) -> None:
+        """
+        If the load factor policy would make the table grow while n_items
+        more keys are added, grow it once now to the size it would end at.
+        """
+        if (self._max_load is not None):
+            self.reserve(self._size + n_items)
 
     def get_keys_and_values(self) -> DynamicArray:
         """
@@ -221,6 +943,12 @@ class HashMap:
             for j in self._buckets[i]:
                 keys_with_values.append((j.key, j.value))
 
+        # Include entries still waiting in the old table of a resize
+        if (self._old_buckets is not None):
+            for i in range(self._rehash_idx, self._old_capacity):
+                for j in self._old_buckets[i]:
+                    keys_with_values.append((j.key, j.value))
+
         return keys_with_values
 
 
@@ -241,18 +969,16 @@ def find_mode(da: DynamicArray) -> (DynamicArray, int):
     map = HashMap(da.length())
     max_count = 0
 
-    for i in range(da.length()):
-        if (map.contains_key(da[i])):
-            # Item already in map. Incrememnt value and update max_count if necessary.
-            cur_freq = map.get(da[i])
-            map.put(da[i], cur_freq + 1)
-            if (cur_freq + 1 > max_count):
-                max_count = cur_freq + 1
-        else:
-            # Item not in map. Add with value of 1
-            map.put(da[i], 1)
-            if (max_count == 0):
-                max_count = 1
+    # Hash every item in one batch, then count them bucket by bucket
+    items = to_list(da)
+    hashes = hash_batch(items, map._hash_function)
+
+    for i in bucket_order(hashes, map._capacity):
+        # Add item with a count of 1, or increment its count if already in
+        # the map. Update max_count if necessary.
+        cur_freq = map._increment(items[i], 1, hashes[i])
+        if (cur_freq > max_count):
+            max_count = cur_freq
 
     # Iterate through map and add all elements with value equal to max to mode_list
     modes = DynamicArray()
@@ -264,6 +990,275 @@ def find_mode(da: DynamicArray) -> (DynamicArray, int):
     return (modes, max_count)
 
 
+def find_mode_stream(items, chunk_size: int = 65536, processes: int = None,
+                     function='builtin') -> (DynamicArray, int):
+    """
+    Same result as find_mode, but for inputs too large to hold in memory.
+
+    items can be any iterable (a generator, a DynamicArray, read_tokens()
+    over a file, ...) and is consumed chunk_size items at a time, so only
+    the counts themselves are kept. With processes > 1, chunks are counted
+    in that many worker processes and the partial counts merged here.
+
+    The modes are tracked while counting: a count that passes the current
+    max starts a new mode list and a count that reaches it joins the list,
+    so no final scan over the table is needed. Modes are returned in the
+    order they reached the max frequency.
+    """
+    counts = HashMap(1024, function, max_load=1.0)
+    modes = []
+    max_count = 0
+
+    for chunk_counts in _chunk_counts(items, chunk_size, processes, function):
+        for key, count in chunk_counts:
+            cur_freq = counts.increment(key, count)
+            if (cur_freq > max_count):
+                max_count = cur_freq
+                modes = [key]
+            elif (cur_freq == max_count):
+                modes.append(key)
+
+    return (DynamicArray(modes), max_count)
+
+
+def read_tokens(source):
+    """
+    Generates the whitespace separated tokens of a file, one line at a time.
+    source may be a path or an open text file.
+    """
+    if (isinstance(source, (str, PathLike))):
+        with open(source) as file:
+            yield from read_tokens(file)
+        return
+
+    for line in source:
+        yield from line.split()
+
+
+def _chunk_counts(items, chunk_size: int, processes: int, function):
+    """
+    Splits items into chunks and generates the (key, count) pairs of each
+    chunk, counting them in a process pool if processes > 1. At most two
+    chunks per process are in flight, so the input is never read ahead
+    further than that.
+    """
+    if (isinstance(items, DynamicArray)):
+        items = to_list(items)
+    iterator = iter(items)
+    chunks = iter(lambda: list(islice(iterator, chunk_size)), [])
+
+    if (processes is None or processes <= 1):
+        for chunk in chunks:
+            yield _count_chunk(chunk, function)
+        return
+
+    with ProcessPoolExecutor(processes) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_count_chunk, chunk, function))
+            if (len(pending) >= 2 * processes):
+                yield pending.popleft().result()
+        while (pending):
+            yield pending.popleft().result()
+
+
+def _count_chunk(chunk: list, function) -> list:
+    """
+    Counts the items of one chunk. Returns a list of (item, count) pairs.
+    Runs in a worker process when find_mode_stream uses a pool.
+    """
+    counts = HashMap(len(chunk), function)
+    hashes = hash_batch(chunk, counts._hash_function)
+    for item, hash_value in zip(chunk, hashes):
+        counts._increment(item, 1, hash_value)
+
+    return to_list(counts.get_keys_and_values())
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters summary. Keeps at most k counters no matter
+    how many distinct items are added. Once all counters are taken, a new
+    item replaces the item with the smallest count and inherits that count
+    (recorded as its possible error). Every count is an overestimate by at
+    most n / k for a stream of n items, and any item seen more than n / k
+    times is guaranteed to have a counter.
+    """
+
+    def __init__(self, k: int) -> None:
+        """Initialize a summary with k counters."""
+        if (k < 1):
+            raise ValueError("k must be at least 1")
+        self._k = k
+        self._n = 0
+
+        # item -> [count, error]
+        self._counters = HashMap(k, 'builtin')
+
+        # Min-heap of (count, seq, item), where seq only breaks ties so
+        # items are never compared. Entries go stale when an item's count
+        # changes and are skipped (and periodically purged) instead.
+        self._heap = []
+        self._seq = itertools.count()
+
+    def add(self, item: object, count: int = 1) -> None:
+        """Record count more occurrences of item."""
+        self._n += count
+        counter = self._counters.get(item)
+        if (counter is not None):
+            counter[0] += count
+        elif (self._counters.get_size() < self._k):
+            counter = [count, 0]
+            self._counters.put(item, counter)
+        else:
+            # Replace the item with the smallest count
+            min_count, min_item = self._pop_min()
+            self._counters.remove(min_item)
+            counter = [min_count + count, min_count]
+            self._counters.put(item, counter)
+
+        heappush(self._heap, (counter[0], next(self._seq), item))
+        if (len(self._heap) > 4 * self._k):
+            self._rebuild_heap()
+
+    def estimate(self, item: object) -> (int, int):
+        """
+        Returns (count, error) for item: item occurred between
+        count - error and count times. Untracked items return (0, 0).
+        """
+        counter = self._counters.get(item)
+        if (counter is None):
+            return (0, 0)
+        return (counter[0], counter[1])
+
+    def items(self) -> list:
+        """Returns (item, count, error) for every tracked item."""
+        return [(item, counter[0], counter[1])
+                for item, counter in to_list(self._counters.get_keys_and_values())]
+
+    def _pop_min(self) -> (int, object):
+        """Removes and returns the (count, item) with the smallest count."""
+        while (True):
+            count, _, item = heappop(self._heap)
+            counter = self._counters.get(item)
+            if (counter is not None and counter[0] == count):
+                return count, item
+
+    def _rebuild_heap(self) -> None:
+        """Replaces the heap with one up-to-date entry per counter."""
+        self._heap = [(count, next(self._seq), item) for item, count, _ in self.items()]
+        heapify(self._heap)
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch: depth rows of width counters. Adding an item bumps
+    one counter per row and its estimate is the smallest of those
+    counters. Estimates never undercount, and overcount by more than
+    epsilon * n only with probability delta, using
+    ceil(e / epsilon) * ceil(ln(1 / delta)) counters in total.
+    """
+
+    def __init__(self, epsilon: float = 0.001, delta: float = 0.01) -> None:
+        """Initialize a sketch for the given error bounds."""
+        if (not 0 < epsilon < 1 or not 0 < delta < 1):
+            raise ValueError("epsilon and delta must be in (0, 1)")
+        self._width = ceil(e / epsilon)
+        self._depth = ceil(log(1 / delta))
+        self._rows = [array('Q', bytes(8 * self._width)) for _ in range(self._depth)]
+
+    def add(self, item: object, count: int = 1) -> int:
+        """Record count more occurrences of item. Returns its new estimate."""
+        estimate = None
+        for row, idx in zip(self._rows, self._indexes(item)):
+            row[idx] += count
+            if (estimate is None or row[idx] < estimate):
+                estimate = row[idx]
+        return estimate
+
+    def estimate(self, item: object) -> int:
+        """Returns the estimated count of item."""
+        return min(row[idx] for row, idx in zip(self._rows, self._indexes(item)))
+
+    def _indexes(self, item: object) -> list:
+        """
+        Returns the counter index of item in each row, derived from one
+        stable 64-bit hash split into two halves (h1 + i * h2).
+        """
+        hash_value = hash_xx64(item)
+        h1, h2 = hash_value & 0xFFFFFFFF, (hash_value >> 32) | 1
+        return [(h1 + i * h2) % self._width for i in range(self._depth)]
+
+
+def find_mode_approx(items, method: str = 'space_saving',
+                     epsilon: float = 0.001, delta: float = 0.01,
+                     candidates: int = 64) -> (DynamicArray, int):
+    """
+    Approximate find_mode in fixed memory, for streams with too many
+    distinct values to count exactly. items can be any iterable.
+    Returns (modes, frequency) like find_mode, where frequency is the
+    estimated count of the modes and may be off by up to epsilon * n.
+
+    method 'space_saving' keeps ceil(1 / epsilon) counters.
+    method 'count_min' uses a CountMinSketch(epsilon, delta) and keeps the
+    candidates items with the highest estimates.
+    """
+    if (candidates < 1):
+        raise ValueError("candidates must be at least 1")
+    if (isinstance(items, DynamicArray)):
+        items = to_list(items)
+
+    if (method == 'space_saving'):
+        summary = SpaceSaving(ceil(1 / epsilon))
+        for item in items:
+            summary.add(item)
+        estimates = [(item, count) for item, count, _ in summary.items()]
+    elif (method == 'count_min'):
+        estimates = _count_min_top(items, CountMinSketch(epsilon, delta), candidates)
+    else:
+        raise ValueError(f"Unknown method: {method!r}")
+
+    # Collect every item tied for the highest estimate
+    modes = DynamicArray()
+    max_count = max((count for _, count in estimates), default=0)
+    for item, count in estimates:
+        if (count == max_count):
+            modes.append(item)
+
+    return (modes, max_count)
+
+
+def _count_min_top(items, sketch: CountMinSketch, k: int) -> list:
+    """
+    Feeds items to sketch while keeping the k items with the highest
+    estimates. Returns their (item, estimate) pairs.
+    """
+    top = HashMap(k, 'builtin')
+    heap = []
+    seq = itertools.count()
+    for item in items:
+        estimate = sketch.add(item)
+        if (top.contains_key(item)):
+            top.put(item, estimate)
+        elif (top.get_size() < k):
+            top.put(item, estimate)
+        else:
+            # Pop stale heap entries to find the smallest kept estimate
+            while (heap[0][0] != top.get(heap[0][2])):
+                heappop(heap)
+            if (estimate <= heap[0][0]):
+                continue
+            top.remove(heappop(heap)[2])
+            top.put(item, estimate)
+        heappush(heap, (estimate, next(seq), item))
+        if (len(heap) > 4 * k):
+            heap = [(count, next(seq), key)
+                    for key, count in to_list(top.get_keys_and_values())]
+            heapify(heap)
+
+    return [(item, count) for item, count in to_list(top.get_keys_and_values())]
+
+
 # ------------------- BASIC TESTING ---------------------------------------- #
 
 if __name__ == "__main__":
@@ -0,0 +1,587 @@
+# Name: Patrick Kramer
+# OSU Email: kramepat@oregonstate.edu
+# Course: CS261 - Data Structures
+# Assignment: 6 - HashMap Implementation
+# Due Date: 8/9/22
+# Description: Sharded Open Addressing HashMap in shared memory, usable from
+#              several processes at once
+
+
+import multiprocessing
+import secrets
+import struct
+import time
+from collections.abc import MutableMapping
+from math import ceil
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from a6_include import DynamicArray, HASH_FUNCTIONS, STABLE_HASH_FUNCTIONS, next_prime
+from snapshot import VALUE_CODECS
+
+
+# Default for arguments where None is a legitimate value
+_MISSING = object()
+
+
+# Every shard is one shared memory block: a fixed header followed by
+# capacity fixed-width slots.
+#
+# header: magic, seq, size, tombstones, capacity, key_size, value_size,
+#         n_shards, value codec, hash function name
+# slot:   state, key length, value length, hash, key bytes, value bytes
+#
+# seq is the shard's sequence lock. A writer (holding the shard's Lock)
+# makes it odd before changing the shard and even again afterwards, so a
+# reader that saw the same even seq before and after its lookup knows it
+# read a consistent shard, and otherwise simply retries. The stores and
+# loads involved are plain memory accesses, which x86 keeps in order; on
+# weaker memory models reads are best effort. A reader that finds seq odd
+# spins on it only _SPIN_LIMIT times, then gives up the CPU between checks
+# so it cannot hold off the very writer it waits for.
+
+_MAGIC = b'A6SHMAP1'
+_HEADER = struct.Struct('<8sQQQQIIIB15s')
+_HEADER_SIZE = 128
+_SEQ_OFFSET = 8
+_SIZE_OFFSET = 16
+_TOMBSTONES_OFFSET = 24
+_U64 = struct.Struct('<Q')
+
+_SLOT = struct.Struct('<BHIQ')
+_EMPTY = 0
+_FULL = 1
+_DELETED = 2
+
+_SPIN_LIMIT = 100
+
+_HASH_MASK = (1 << 64) - 1
+
+_CODEC_NAMES = list(VALUE_CODECS)
+
+# Blocks this process created, and so its resource tracker already owns
+_created = set()
+
+
+def _open_block(name: str, shared_tracker: bool) -> SharedMemory:
+    """
+    Attaches to an existing shared memory block. Processes started by the
+    creator share its resource tracker, which already knows the block. Any
+    other process must keep its own tracker from deleting the block when
+    the process exits.
+    """
+    if (shared_tracker or name in _created):
+        return SharedMemory(name)
+    try:
+        return SharedMemory(name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the block. Undo that.
+        block = SharedMemory(name)
+        resource_tracker.unregister(block._name, 'shared_memory')
+        return block
+
+
+def _even_seq(buf) -> int:
+    """
+    Returns the sequence number of the shard in buf once no write is under
+    way (it is even).
+    """
+    spins = 0
+    while (True):
+        seq = _U64.unpack_from(buf, _SEQ_OFFSET)[0]
+        if (not seq & 1):
+            return seq
+        spins += 1
+        if (spins >= _SPIN_LIMIT):
+            time.sleep(0)
+
+
+class SharedHashMap(MutableMapping):
+    def __init__(self,
+                 capacity: int = 1024,
+                 n_shards: int = 16,
+                 key_size: int = 32,
+                 value_size: int = 32,
+                 function: str = 'blake2b',
+                 values: str = 'bytes',
+                 max_load: float = 0.75,
+                 name: str = None,
+                 context: str = None) -> None:
+        """
+        Create a new SharedHashMap holding up to about capacity * max_load
+        entries, split by hash over n_shards shared memory blocks named
+        name_0, name_1, ... (a random name is picked if none is given).
+
+        Keys are str of at most key_size bytes in UTF-8. Values are stored
+        in at most value_size bytes, encoded as given by values: 'bytes',
+        'str', 'int', 'float' or 'pickle'. The capacity is fixed; put raises
+        RuntimeError once a shard is full.
+
+        function must be the name of a hash function that gives the same
+        result in every process ('blake2b', 'fnv1a', ...), not 'builtin',
+        whose str hashes are salted per process.
+
+        Pass the map to worker processes as a Process argument (or a Pool
+        initializer argument) and they share its table and locks; context
+        is the start method ('fork', 'spawn', ...) those processes use. Any
+        other process can read it through SharedHashMap.attach(name).
+
+        Single operations are atomic; setdefault, update and the other
+        helpers inherited from MutableMapping are made of several and are
+        not.
+        """
+        if (function not in STABLE_HASH_FUNCTIONS):
+            raise ValueError("function must name a hash function that is "
+                             "stable across processes, e.g. 'blake2b' or 'fnv1a'")
+        if (values not in VALUE_CODECS):
+            raise ValueError(f"Unknown value encoding: {values!r}")
+        if (n_shards < 1):
+            raise ValueError("n_shards must be at least 1")
+        if (not 0 < max_load <= 1):
+            raise ValueError("max_load must be in (0, 1]")
+        if (not 0 < key_size < 1 << 16):
+            raise ValueError("key_size must be between 1 and 65535")
+        if (not 0 < value_size < 1 << 32):
+            raise ValueError("value_size must be between 1 and 2 ** 32 - 1")
+
+        if (name is None):
+            name = 'a6shm_' + secrets.token_hex(4)
+        shard_capacity = next_prime(ceil(capacity / n_shards))
+
+        self._name = name
+        self._max_load = max_load
+        self._owner = True
+        self._blocks = []
+        slot_size = _SLOT.size + key_size + value_size
+        for i in range(n_shards):
+            block = SharedMemory(f'{name}_{i}', create=True,
+                                 size=_HEADER_SIZE + shard_capacity * slot_size)
+            _HEADER.pack_into(block.buf, 0, _MAGIC, 0, 0, 0, shard_capacity,
+                              key_size, value_size, n_shards,
+                              _CODEC_NAMES.index(values), function.encode())
+            self._blocks.append(block)
+            _created.add(block.name)
+
+        context = multiprocessing.get_context(context)
+        self._locks = [context.Lock() for _ in range(n_shards)]
+        self._load_layout()
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedHashMap":
+        """
+        Opens the SharedHashMap called name from any process. Without the
+        creator's locks it is read only: put, remove and clear raise
+        RuntimeError.
+        """
+        map = cls.__new__(cls)
+        map._attach(name, None, 0.75, False)
+        return map
+
+    def _attach(self, name: str, locks: list, max_load: float,
+                shared_tracker: bool) -> None:
+        """
+        Opens every shard of the map called name.
+        """
+        self._name = name
+        self._max_load = max_load
+        self._owner = False
+        self._locks = locks
+
+        first = _open_block(f'{name}_0', shared_tracker)
+        header = _HEADER.unpack_from(first.buf, 0)
+        if (header[0] != _MAGIC):
+            first.close()
+            raise ValueError(f"{name!r} is not a SharedHashMap")
+        self._blocks = [first]
+        for i in range(1, header[7]):
+            self._blocks.append(_open_block(f'{name}_{i}', shared_tracker))
+        self._load_layout()
+
+    def _load_layout(self) -> None:
+        """
+        Reads the table layout back out of the first shard's header.
+        """
+        (_, _, _, _, self._capacity, self._key_size, self._value_size,
+         self._n_shards, codec, function) = _HEADER.unpack_from(self._blocks[0].buf, 0)
+
+        self._function_name = function.rstrip(b'\0').decode()
+        self._hash_function = HASH_FUNCTIONS[self._function_name]
+        self._values = _CODEC_NAMES[codec]
+        self._encode, self._decode = VALUE_CODECS[self._values]
+        self._slot_size = _SLOT.size + self._key_size + self._value_size
+        self._bufs = [block.buf for block in self._blocks]
+
+    def __getstate__(self) -> dict:
+        """
+        Sends only the name, settings and locks to a child process, which
+        reattaches to the same shared memory.
+        """
+        return {'name': self._name, 'locks': self._locks, 'max_load': self._max_load}
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Reattaches to the shared memory in a child process.
+        """
+        self._attach(state['name'], state['locks'], state['max_load'], True)
+
+    def close(self) -> None:
+        """
+        Detaches this process from the shared memory. The map lives on
+        until the creating process calls unlink().
+        """
+        self._bufs = []
+        for block in self._blocks:
+            block.close()
+        self._blocks = []
+
+    def unlink(self) -> None:
+        """
+        Closes the map and frees its shared memory (creator only).
+        """
+        blocks = self._blocks
+        self.close()
+        if (self._owner):
+            for block in blocks:
+                block.unlink()
+                _created.discard(block.name)
+
+    def __enter__(self) -> "SharedHashMap":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if (self._owner):
+            self.unlink()
+        else:
+            self.close()
+
+    @property
+    def name(self) -> str:
+        """Name to pass to SharedHashMap.attach."""
+        return self._name
+
+    def get_size(self) -> int:
+        """
+        Return size of map. While other processes are writing, this is only
+        a snapshot and may already be out of date.
+        """
+        size = 0
+        for buf in self._bufs:
+            size += _U64.unpack_from(buf, _SIZE_OFFSET)[0]
+        return size
+
+    def get_capacity(self) -> int:
+        """
+        Return the total number of slots over all shards
+        """
+        return self._capacity * self._n_shards
+
+    def table_load(self) -> float:
+        """
+        Returns the current hash table load factor.
+        """
+        return self.get_size() / self.get_capacity()
+
+    # ------------------------------------------------------------------ #
+
+    def _hash(self, key: str) -> int:
+        """
+        Returns the 64-bit hash of key that is stored with its entry.
+        """
+        return self._hash_function(key) & _HASH_MASK
+
+    def _find_slot(self, buf, key_bytes: bytes, hash_value: int) -> (int, bool):
+        """
+        Linear probe one shard for key. Returns (offset, True) for the slot
+        holding the key, otherwise (offset, False) for the first empty or
+        deleted slot it could go in, or (-1, False) if there is none.
+        """
+        capacity = self._capacity
+        slot_size = self._slot_size
+        key_len = len(key_bytes)
+        idx = (hash_value // self._n_shards) % capacity
+        free = -1
+        for _ in range(capacity):
+            offset = _HEADER_SIZE + idx * slot_size
+            state, slot_key_len, _, slot_hash = _SLOT.unpack_from(buf, offset)
+            if (state == _EMPTY):
+                return (offset if free == -1 else free), False
+            elif (state == _DELETED):
+                if (free == -1):
+                    free = offset
+            elif (slot_hash == hash_value and slot_key_len == key_len):
+                start = offset + _SLOT.size
+                if (buf[start:start + key_len] == key_bytes):
+                    return offset, True
+
+            idx += 1
+            if (idx == capacity):
+                idx = 0
+
+        return free, False
+
+    def _write_lock(self, shard: int):
+        """
+        Returns the lock guarding writes to shard.
+        """
+        if (self._locks is None):
+            raise RuntimeError("SharedHashMap opened with attach() is read only")
+        return self._locks[shard]
+
+    @staticmethod
+    def _bump_seq(buf) -> None:
+        """
+        Advances the shard's sequence lock (odd while a write is under way).
+        """
+        _U64.pack_into(buf, _SEQ_OFFSET, _U64.unpack_from(buf, _SEQ_OFFSET)[0] + 1)
+
+    @staticmethod
+    def _add_to(buf, offset: int, delta: int) -> None:
+        """
+        Adds delta to the header counter at offset.
+        """
+        _U64.pack_into(buf, offset, _U64.unpack_from(buf, offset)[0] + delta)
+
+    def put(self, key: str, value: object) -> None:
+        """
+        Updates the given key/value pair. If the key is already present,
+        update the value to the new value. If not, add to hash map.
+        """
+        key_bytes = key.encode('utf-8')
+        value_bytes = self._encode(value)
+        if (len(key_bytes) > self._key_size):
+            raise ValueError(f"key is {len(key_bytes)} bytes, over key_size {self._key_size}")
+        if (len(value_bytes) > self._value_size):
+            raise ValueError(f"value is {len(value_bytes)} bytes, "
+                             f"over value_size {self._value_size}")
+
+        hash_value = self._hash(key)
+        shard = hash_value % self._n_shards
+        buf = self._bufs[shard]
+        with self._write_lock(shard):
+            offset, found = self._find_slot(buf, key_bytes, hash_value)
+            if (not found):
+                size = _U64.unpack_from(buf, _SIZE_OFFSET)[0]
+                tombstones = _U64.unpack_from(buf, _TOMBSTONES_OFFSET)[0]
+                if (size + 1 > self._capacity * self._max_load):
+                    raise RuntimeError(f"shard {shard} of SharedHashMap is full")
+                if (self._needs_compaction(size, tombstones)):
+                    # Mostly tombstones. Squeeze them out first.
+                    self._compact(buf)
+                    offset, found = self._find_slot(buf, key_bytes, hash_value)
+
+            self._bump_seq(buf)
+            value_start = offset + _SLOT.size + self._key_size
+            if (found):
+                _SLOT.pack_into(buf, offset, _FULL, len(key_bytes), len(value_bytes), hash_value)
+            else:
+                reused = _SLOT.unpack_from(buf, offset)[0] == _DELETED
+                _SLOT.pack_into(buf, offset, _FULL, len(key_bytes), len(value_bytes), hash_value)
+                buf[offset + _SLOT.size:offset + _SLOT.size + len(key_bytes)] = key_bytes
+                self._add_to(buf, _SIZE_OFFSET, 1)
+                if (reused):
+                    self._add_to(buf, _TOMBSTONES_OFFSET, -1)
+            buf[value_start:value_start + len(value_bytes)] = value_bytes
+            self._bump_seq(buf)
+
+    def _needs_compaction(self, size: int, tombstones: int) -> bool:
+        """
+        Returns True if a shard holding size entries and tombstones should
+        be compacted before another entry goes in. As for
+        hash_map_oa.HashMap, there must be at least an eighth of the shard
+        in tombstones, so each O(capacity) compaction is paid for by
+        Θ(capacity) removes, and entries plus tombstones must fill it past
+        halfway from max_load to full.
+        """
+        occupancy_limit = (1 + self._max_load) / 2
+        return (tombstones >= self._capacity // 8
+                and size + tombstones + 1 > self._capacity * occupancy_limit)
+
+    def _compact(self, buf) -> None:
+        """
+        Rehashes one shard in place to clear out its tombstones. Called with
+        the shard's lock held.
+        """
+        self._bump_seq(buf)
+        entries = []
+        for offset in range(_HEADER_SIZE, _HEADER_SIZE + self._capacity * self._slot_size,
+                            self._slot_size):
+            if (buf[offset] == _FULL):
+                entries.append(bytes(buf[offset:offset + self._slot_size]))
+
+        buf[_HEADER_SIZE:] = bytes(len(buf) - _HEADER_SIZE)
+        for entry in entries:
+            _, key_len, _, hash_value = _SLOT.unpack_from(entry, 0)
+            key_bytes = entry[_SLOT.size:_SLOT.size + key_len]
+            offset, _ = self._find_slot(buf, key_bytes, hash_value)
+            buf[offset:offset + self._slot_size] = entry
+
+        _U64.pack_into(buf, _TOMBSTONES_OFFSET, 0)
+        self._bump_seq(buf)
+
+    def _read(self, key: str) -> bytes:
+        """
+        Returns the stored bytes of key's value, or None if key is not
+        present. Takes no lock; retries until it gets a consistent read.
+        """
+        key_bytes = key.encode('utf-8')
+        hash_value = self._hash(key)
+        buf = self._bufs[hash_value % self._n_shards]
+        while (True):
+            seq = _even_seq(buf)
+            offset, found = self._find_slot(buf, key_bytes, hash_value)
+            data = None
+            if (found):
+                value_len = _SLOT.unpack_from(buf, offset)[2]
+                value_start = offset + _SLOT.size + self._key_size
+                data = bytes(buf[value_start:value_start + min(value_len, self._value_size)])
+
+            if (_U64.unpack_from(buf, _SEQ_OFFSET)[0] == seq):
+                return data
+
+    def get(self, key: str, default: object = None) -> object:
+        """
+        Return value associated with provided key, or default (None unless
+        given) if key not present. Takes no lock.
+        """
+        data = self._read(key)
+        if (data is None):
+            return default
+        return self._decode(data)
+
+    def contains_key(self, key: str) -> bool:
+        """
+        Returns True if the key is in the map. Else returns False.
+        """
+        return self._read(key) is not None
+
+    def remove(self, key: str) -> None:
+        """
+        Removes key / value pair from Hash Map using given key.
+        """
+        self._remove(key)
+
+    def _remove(self, key: str) -> object:
+        """
+        Removes key and returns its value, or _MISSING if it was not present.
+        """
+        key_bytes = key.encode('utf-8')
+        hash_value = self._hash(key)
+        shard = hash_value % self._n_shards
+        buf = self._bufs[shard]
+        with self._write_lock(shard):
+            offset, found = self._find_slot(buf, key_bytes, hash_value)
+            if (not found):
+                return _MISSING
+
+            value_len = _SLOT.unpack_from(buf, offset)[2]
+            value_start = offset + _SLOT.size + self._key_size
+            data = bytes(buf[value_start:value_start + value_len])
+            self._bump_seq(buf)
+            buf[offset] = _DELETED
+            self._add_to(buf, _SIZE_OFFSET, -1)
+            self._add_to(buf, _TOMBSTONES_OFFSET, 1)
+            self._bump_seq(buf)
+        return self._decode(data)
+
+    def clear(self) -> None:
+        """
+        Clears all contents of map. Capacity remains unchanged.
+        """
+        for shard, buf in enumerate(self._bufs):
+            with self._write_lock(shard):
+                self._bump_seq(buf)
+                buf[_HEADER_SIZE:] = bytes(len(buf) - _HEADER_SIZE)
+                _U64.pack_into(buf, _SIZE_OFFSET, 0)
+                _U64.pack_into(buf, _TOMBSTONES_OFFSET, 0)
+                self._bump_seq(buf)
+
+    # ------------------- Mapping protocol ------------------- #
+
+    __setitem__ = put
+    __contains__ = contains_key
+    __len__ = get_size
+
+    def __getitem__(self, key: str) -> object:
+        """
+        Return value associated with key. Raise KeyError if not present.
+        """
+        data = self._read(key)
+        if (data is None):
+            raise KeyError(key)
+        return self._decode(data)
+
+    def __delitem__(self, key: str) -> None:
+        """
+        Remove key from the map. Raise KeyError if not present.
+        """
+        if (self._remove(key) is _MISSING):
+            raise KeyError(key)
+
+    def pop(self, key: str, default: object = _MISSING) -> object:
+        """
+        Remove key and return its value. If key is not present, return
+        default, or raise KeyError if no default was given.
+        """
+        value = self._remove(key)
+        if (value is _MISSING):
+            if (default is _MISSING):
+                raise KeyError(key)
+            return default
+        return value
+
+    def __iter__(self):
+        """
+        Iterate over the keys of the map.
+        """
+        for key, _ in self._iter_items():
+            yield key
+
+    def _iter_items(self):
+        """
+        Generates the (key, value) pairs of the map one shard at a time.
+        Each shard is copied out in one consistent read first.
+        """
+        for buf in self._bufs:
+            while (True):
+                seq = _even_seq(buf)
+                snapshot = bytes(buf)
+                if (_U64.unpack_from(buf, _SEQ_OFFSET)[0] == seq):
+                    break
+
+            for offset in range(_HEADER_SIZE, len(snapshot), self._slot_size):
+                if (snapshot[offset] == _FULL):
+                    _, key_len, value_len, _ = _SLOT.unpack_from(snapshot, offset)
+                    key_start = offset + _SLOT.size
+                    value_start = key_start + self._key_size
+                    yield (snapshot[key_start:key_start + key_len].decode('utf-8'),
+                           self._decode(snapshot[value_start:value_start + value_len]))
+
+    def get_keys_and_values(self) -> DynamicArray:
+        """
+        Create and return a dynamic array of all elements in the HashMap.
+        """
+        return DynamicArray(list(self._iter_items()))
+
+
+# ------------------- BASIC TESTING ---------------------------------------- #
+
+def _demo_worker(map: SharedHashMap, worker: int) -> None:
+    """
+    Puts 1000 keys of its own into a map shared with other processes.
+    """
+    for i in range(1000):
+        map.put('w' + str(worker) + ':' + str(i), i)
+    map.close()
+
+
+if __name__ == "__main__":
+
+    print("\nPut from 4 processes, read from the parent")
+    print("------------------------------------------")
+    with SharedHashMap(8192, n_shards=8, values='int') as m:
+        workers = [multiprocessing.Process(target=_demo_worker, args=(m, n)) for n in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        print(m.get_size(), m.get_capacity(), m.get('w3:999'), m.get('w4:0'))
@@ -0,0 +1,196 @@
+# Name: Patrick Kramer
+# OSU Email: kramepat@oregonstate.edu
+# Course: CS261 - Data Structures
+# Assignment: 6 - HashMap Implementation
+# Due Date: 8/9/22
+# Description: Storage formats shared by the HashMaps: value encodings for
+#              maps kept outside the Python heap, and the snapshot files
+#              written by HashMap.dump and read by HashMap.load
+
+
+from os import PathLike
+from pickle import HIGHEST_PROTOCOL, dumps, loads
+from struct import Struct, pack, unpack
+
+from a6_include import HASH_FUNCTIONS, STABLE_HASH_FUNCTIONS
+
+_MASK_64 = 0xFFFFFFFFFFFFFFFF
+
+
+# How values are turned into bytes for maps that store them outside the
+# Python heap, and back: name -> (encode, decode)
+_DOUBLE = Struct('<d')
+
+VALUE_CODECS = {
+    'bytes': (bytes, bytes),
+    'str': (lambda value: value.encode('utf-8'),
+            lambda data: str(data, 'utf-8')),
+    'int': (lambda value: value.to_bytes(8, 'little', signed=True),
+            lambda data: int.from_bytes(data, 'little', signed=True)),
+    'float': (_DOUBLE.pack, lambda data: _DOUBLE.unpack(data)[0]),
+    'pickle': (dumps, loads),
+}
+
+
+# Snapshots written by HashMap.dump and read by HashMap.load: a magic
+# string, the header, then the records in chunks of up to _SNAPSHOT_CHUNK,
+# and finally an empty chunk. A record is (bucket index, stored hash, key,
+# value). Writing chunk by chunk keeps a snapshot of any size from needing
+# more than one chunk of extra memory.
+#
+# The header and each chunk's indexes and hashes are plain little-endian
+# integers and strings packed with struct, so the layout of a file is read
+# and checked without unpickling anything. Only the keys and values, which
+# can be any objects, are pickled (one length-prefixed pickle per chunk).
+# Unpickling can still run arbitrary code, so only trusted snapshots may
+# be loaded.
+#
+# header: field count (H), then per field its name (B length + UTF-8), a
+#         type tag (B: 0 None, 1 int as Q, 2 str as H length + UTF-8)
+# chunk:  record count n (I), n indexes (Q), n hashes (Q), n flags (B, 1
+#         if the hash is None), pickle length (Q), pickled [key, value, ...]
+
+SNAPSHOT_MAGIC = b'A6SNAP02'
+_SNAPSHOT_CHUNK = 4096
+
+_U8 = Struct('<B')
+_U16 = Struct('<H')
+_U32 = Struct('<I')
+_U64 = Struct('<Q')
+
+
+def stable_hash_name(function: callable) -> str:
+    """
+    Returns the name function has in STABLE_HASH_FUNCTIONS, or None if it
+    is not one of them.
+    """
+    for name in STABLE_HASH_FUNCTIONS:
+        if (HASH_FUNCTIONS[name] is function):
+            return name
+    return None
+
+
+def _pack_text(text: str, length: Struct) -> bytes:
+    """Return text as UTF-8 prefixed with its length packed with length."""
+    data = text.encode('utf-8')
+    return length.pack(len(data)) + data
+
+
+def _pack_snapshot_header(header: dict) -> bytes:
+    """Return header, whose values are None, ints or strs, packed."""
+    parts = [_U16.pack(len(header))]
+    for name, value in header.items():
+        parts.append(_pack_text(name, _U8))
+        if (value is None):
+            parts.append(_U8.pack(0))
+        elif (isinstance(value, int)):
+            parts.append(_U8.pack(1) + _U64.pack(value))
+        elif (isinstance(value, str)):
+            parts.append(_U8.pack(2) + _pack_text(value, _U16))
+        else:
+            raise TypeError("snapshot header values must be None, int or str")
+    return b''.join(parts)
+
+
+def _pack_snapshot_chunk(chunk: list) -> bytes:
+    """Return the (index, hash, key, value) records of chunk packed."""
+    n = len(chunk)
+    indexes = [record[0] for record in chunk]
+    # Stored hashes are only used with STABLE_HASH_FUNCTIONS, which all fit
+    # in 64 bits. Anything else is reduced just so it can be written.
+    hashes = [0 if record[1] is None else record[1] & _MASK_64 for record in chunk]
+    flags = bytes(record[1] is None for record in chunk)
+    payload = dumps([item for record in chunk for item in record[2:]], HIGHEST_PROTOCOL)
+    return b''.join((_U32.pack(n), pack(f'<{n}Q', *indexes), pack(f'<{n}Q', *hashes),
+                     flags, _U64.pack(len(payload)), payload))
+
+
+def write_snapshot(file, header: dict, records) -> None:
+    """
+    Writes header and the (index, hash, key, value) tuples of records to
+    file, a path or a binary file object. Header values must be None, ints
+    or strs.
+    """
+    if (isinstance(file, (str, PathLike))):
+        with open(file, 'wb') as out:
+            write_snapshot(out, header, records)
+        return
+
+    file.write(SNAPSHOT_MAGIC)
+    file.write(_pack_snapshot_header(header))
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if (len(chunk) == _SNAPSHOT_CHUNK):
+            file.write(_pack_snapshot_chunk(chunk))
+            chunk = []
+    if (chunk):
+        file.write(_pack_snapshot_chunk(chunk))
+    file.write(_U32.pack(0))
+
+
+def _read_exactly(file, n: int) -> bytes:
+    """Return the next n bytes of file. Raise ValueError if it ends first."""
+    data = file.read(n)
+    if (len(data) != n):
+        raise ValueError("snapshot is truncated")
+    return data
+
+
+def _read_text(file, length: Struct) -> str:
+    """Return a string written by _pack_text with the same length."""
+    n = length.unpack(_read_exactly(file, length.size))[0]
+    return str(_read_exactly(file, n), 'utf-8')
+
+
+def _read_snapshot_header(file) -> dict:
+    """Return the header packed by _pack_snapshot_header."""
+    header = {}
+    for _ in range(_U16.unpack(_read_exactly(file, 2))[0]):
+        name = _read_text(file, _U8)
+        tag = _read_exactly(file, 1)[0]
+        if (tag == 0):
+            header[name] = None
+        elif (tag == 1):
+            header[name] = _U64.unpack(_read_exactly(file, 8))[0]
+        elif (tag == 2):
+            header[name] = _read_text(file, _U16)
+        else:
+            raise ValueError("snapshot header is corrupt")
+    return header
+
+
+def read_snapshot(file):
+    """
+    Generates the header dict of the snapshot in file (a path or a binary
+    file object), then each of its records as an (index, hash, key, value)
+    tuple.
+
+    The keys and values are unpickled, which can run arbitrary code: only
+    read snapshots from a trusted source. Everything else is checked
+    before any unpickling, and ValueError is raised if it is malformed.
+    """
+    if (isinstance(file, (str, PathLike))):
+        with open(file, 'rb') as source:
+            yield from read_snapshot(source)
+        return
+
+    if (file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC):
+        raise ValueError("not a HashMap snapshot")
+    yield _read_snapshot_header(file)
+    while (True):
+        n = _U32.unpack(_read_exactly(file, 4))[0]
+        if (n == 0):
+            return
+        if (n > _SNAPSHOT_CHUNK):
+            raise ValueError("snapshot chunk is corrupt")
+        indexes = unpack(f'<{n}Q', _read_exactly(file, 8 * n))
+        hashes = unpack(f'<{n}Q', _read_exactly(file, 8 * n))
+        flags = _read_exactly(file, n)
+        size = _U64.unpack(_read_exactly(file, 8))[0]
+        payload = loads(_read_exactly(file, size))
+        if (type(payload) is not list or len(payload) != 2 * n):
+            raise ValueError("snapshot chunk is corrupt")
+        for i in range(n):
+            yield (indexes[i], None if flags[i] else hashes[i],
+                   payload[2 * i], payload[2 * i + 1])
@@ -0,0 +1,81 @@
+# The approximate counters behind find_mode_approx have to keep the error
+# bounds they advertise. Streams come from fixed seeds, so the checks are
+# deterministic.
+
+import random
+from collections import Counter
+
+import pytest
+
+from a6_include import to_list
+from hash_map_sc import CountMinSketch, SpaceSaving, find_mode_approx
+
+N = 20000
+
+
+def _stream(seed: int) -> list:
+    """Returns N skewed picks from 3000 distinct values."""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(3000)]
+    return ['v' + str(value) for value in rng.choices(range(3000), weights, k=N)]
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+@pytest.mark.parametrize('k', [10, 50, 200])
+def test_space_saving_overestimates_by_at_most_n_over_k(seed, k):
+    stream = _stream(seed)
+    true = Counter(stream)
+    summary = SpaceSaving(k)
+    for item in stream:
+        summary.add(item)
+
+    tracked = summary.items()
+    assert len(tracked) == k
+    for item, count, error in tracked:
+        assert true[item] <= count <= true[item] + N / k
+        assert count - error <= true[item]
+    # Anything seen more than N / k times must have kept its counter
+    tracked_items = {item for item, _, _ in tracked}
+    assert {item for item, count in true.items() if count > N / k} <= tracked_items
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_count_min_stays_within_epsilon_n(seed):
+    epsilon, delta = 0.005, 0.01
+    stream = _stream(seed)
+    true = Counter(stream)
+    sketch = CountMinSketch(epsilon, delta)
+    for item in stream:
+        sketch.add(item)
+
+    over = 0
+    for item, count in true.items():
+        estimate = sketch.estimate(item)
+        assert estimate >= count
+        if (estimate > count + epsilon * N):
+            over += 1
+    # Each item misses the bound with probability at most delta
+    assert over <= delta * len(true)
+
+
+@pytest.mark.parametrize('method', ['space_saving', 'count_min'])
+def test_find_mode_approx_finds_a_clear_mode(method):
+    stream = _stream(4) + ['mode'] * 5000
+    random.Random(4).shuffle(stream)
+    modes, frequency = find_mode_approx(stream, method, epsilon=0.005)
+    assert to_list(modes) == ['mode']
+    assert 5000 <= frequency <= 5000 + 0.005 * len(stream)
+
+
+@pytest.mark.parametrize('candidates', [0, -1])
+def test_find_mode_approx_rejects_no_candidates(candidates):
+    consumed = []
+
+    def items():
+        for item in 'abc':
+            consumed.append(item)
+            yield item
+
+    with pytest.raises(ValueError):
+        find_mode_approx(items(), 'count_min', candidates=candidates)
+    assert consumed == []
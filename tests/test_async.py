@@ -0,0 +1,87 @@
+# AsyncHashMap must hand the event loop back between slices of a resize,
+# and every operation must see every entry while the resize runs.
+
+import asyncio
+
+import hash_map_oa
+from hash_map_async import AsyncHashMap
+
+N_KEYS = 50000
+
+
+async def _filled_map(**kwargs) -> AsyncHashMap:
+    """Returns an AsyncHashMap holding key<i> -> i for i < N_KEYS."""
+    hash_map = AsyncHashMap(11, 'blake2b', **kwargs)
+    await hash_map.update(('key' + str(i), i) for i in range(N_KEYS))
+    await hash_map.rehash()
+    return hash_map
+
+
+def test_rehash_yields_between_slices():
+    async def main():
+        hash_map = await _filled_map(slice_time=0.0005)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while (True):
+                await asyncio.sleep(0)
+                ticks += 1
+
+        tick = asyncio.create_task(ticker())
+        await hash_map.resize_table(4 * hash_map.get_capacity())
+        assert hash_map.is_rehashing()
+        await hash_map.rehash()
+        tick.cancel()
+
+        assert not hash_map.is_rehashing()
+        # Tens of thousands of slots at half a millisecond per slice
+        assert ticks >= 5
+
+    asyncio.run(main())
+
+
+def test_gets_are_correct_mid_migration():
+    async def main():
+        hash_map = await _filled_map(slice_time=0.0001, slice_size=16)
+        await hash_map.resize_table(4 * hash_map.get_capacity())
+        checked_while_rehashing = 0
+
+        async def reader():
+            nonlocal checked_while_rehashing
+            while (hash_map.is_rehashing()):
+                for i in range(0, N_KEYS, 97):
+                    assert hash_map.get('key' + str(i)) == i
+                    assert ('key' + str(i)) in hash_map
+                assert hash_map.get('missing') is None
+                checked_while_rehashing += 1
+                await asyncio.sleep(0)
+
+        await asyncio.gather(reader(), hash_map.rehash())
+        assert checked_while_rehashing >= 2
+        assert hash_map.get_size() == N_KEYS
+        assert dict([pair async for pair in hash_map.items()]) == {
+            'key' + str(i): i for i in range(N_KEYS)}
+
+    asyncio.run(main())
+
+
+def test_resize_during_migration_waits_instead_of_draining():
+    hash_map = hash_map_oa.HashMap(11, 'blake2b', incremental=True)
+    for i in range(10000):
+        hash_map.put('key' + str(i), i)
+    hash_map.rehash()
+
+    hash_map.begin_resize(4 * hash_map.get_capacity())
+    migrated = hash_map._rehash_idx
+    capacity = hash_map.get_capacity()
+    hash_map.begin_resize(4 * capacity)
+    # The running migration was not finished on the spot
+    assert hash_map.is_rehashing()
+    assert hash_map._rehash_idx == migrated
+    assert hash_map.get_capacity() == capacity
+
+    hash_map.rehash()
+    assert not hash_map.is_rehashing()
+    assert hash_map.get_capacity() >= 4 * capacity
+    assert hash_map == {'key' + str(i): i for i in range(10000)}
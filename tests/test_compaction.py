@@ -0,0 +1,60 @@
+# Rehashing a table in place to clear out tombstones costs O(capacity), so
+# it may only happen once tombstones are a real share of the table.
+
+import random
+
+import pytest
+
+import hash_map_oa
+
+
+def _count_resizes(hash_map) -> list:
+    """
+    Makes hash_map record the capacity of every resize_table call in the
+    returned list.
+    """
+    calls = []
+    resize_table = hash_map.resize_table
+
+    def counting_resize_table(new_capacity):
+        calls.append(new_capacity)
+        resize_table(new_capacity)
+
+    hash_map.resize_table = counting_resize_table
+    return calls
+
+
+def test_insert_only_never_compacts():
+    hash_map = hash_map_oa.HashMap(1009, 'blake2b', max_occupancy=0.6)
+    calls = _count_resizes(hash_map)
+    for i in range(1000):
+        hash_map.put('key' + str(i), i)
+    assert hash_map.tombstone_count() == 0
+    # Only the growth past load 0.5
+    assert calls == [2018]
+
+
+def test_churn_near_growth_threshold_compacts_rarely():
+    hash_map = hash_map_oa.HashMap(2003, 'blake2b')
+    for i in range(982):
+        hash_map.put('key' + str(i), i)
+    calls = _count_resizes(hash_map)
+
+    rng = random.Random(7)
+    live = ['key' + str(i) for i in range(982)]
+    for i in range(2000):
+        key = live.pop(rng.randrange(len(live)))
+        hash_map.remove(key)
+        live.append('new' + str(i))
+        hash_map.put(live[-1], i)
+
+    assert hash_map.get_capacity() == 2003
+    # A compaction needs at least a quarter of the table to be tombstones
+    assert len(calls) <= 2000 // (2003 // 4) + 1
+    assert sorted(hash_map.keys()) == sorted(live)
+
+
+@pytest.mark.parametrize('max_occupancy', [0, 0.3, 0.5, 1.5])
+def test_max_occupancy_at_or_below_growth_threshold_is_rejected(max_occupancy):
+    with pytest.raises(ValueError):
+        hash_map_oa.HashMap(11, 'blake2b', max_occupancy=max_occupancy)
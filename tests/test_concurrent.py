@@ -0,0 +1,133 @@
+# ConcurrentHashMap shared between threads, with resizes running while
+# other threads read and write.
+
+import sys
+import threading
+
+import pytest
+
+from hash_map_concurrent import ConcurrentHashMap, _Forward
+
+N_THREADS = 8
+
+
+@pytest.fixture(autouse=True)
+def frequent_thread_switches():
+    """Switches threads far more often than usual, to shake out races."""
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def _run_threads(target, n_threads: int = N_THREADS) -> None:
+    """Runs target(n) in n_threads threads and re-raises any failure."""
+    errors = []
+
+    def run(n):
+        try:
+            target(n)
+        except BaseException as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if (errors):
+        raise errors[0]
+
+
+def test_mixed_writes_across_resizes_match_reference():
+    hash_map = ConcurrentHashMap(11, 'blake2b', concurrency=4, rehash_step=2)
+    expected = [{} for _ in range(N_THREADS)]
+
+    def worker(n):
+        # Each thread owns its keys, so its own dict is the reference
+        mine = expected[n]
+        for i in range(3000):
+            key = 't' + str(n) + ':' + str(i % 700)
+            if (i % 5 == 4):
+                assert hash_map.pop(key, None) == mine.pop(key, None)
+            else:
+                hash_map.put(key, i)
+                mine[key] = i
+            assert hash_map.get(key) == mine.get(key)
+
+    _run_threads(worker)
+    assert hash_map.get_capacity() > 11
+
+    merged = {}
+    for mine in expected:
+        merged.update(mine)
+    assert hash_map.get_size() == len(merged)
+    assert dict(hash_map) == merged
+    hash_map.rehash()
+    assert dict(hash_map) == merged
+
+
+def test_racing_setdefault_has_one_winner():
+    for round in range(50):
+        hash_map = ConcurrentHashMap(11, 'blake2b')
+        barrier = threading.Barrier(N_THREADS)
+        candidates = [object() for _ in range(N_THREADS)]
+        results = [None] * N_THREADS
+
+        def worker(n):
+            barrier.wait()
+            results[n] = hash_map.setdefault('key', candidates[n])
+
+        _run_threads(worker)
+        winners = [n for n in range(N_THREADS) if results[n] is candidates[n]]
+        assert len(winners) == 1
+        assert all(result is candidates[winners[0]] for result in results)
+        assert hash_map.get('key') is candidates[winners[0]]
+        assert hash_map.get_size() == 1
+
+
+def _map_mid_resize() -> (ConcurrentHashMap, dict):
+    """Returns a map with a resize under way, and its contents."""
+    hash_map = ConcurrentHashMap(1009, 'blake2b', concurrency=4, rehash_step=1)
+    expected = {}
+    i = 0
+    while (not hash_map.is_rehashing()):
+        hash_map.put('key' + str(i), i)
+        expected['key' + str(i)] = i
+        i += 1
+    return hash_map, expected
+
+
+def test_iteration_follows_forward_markers():
+    hash_map, expected = _map_mid_resize()
+    buckets = hash_map._table.buckets
+    assert any(type(bucket) is _Forward for bucket in buckets)
+    assert not all(type(bucket) is _Forward for bucket in buckets)
+
+    assert dict(hash_map.items()) == expected
+    assert not hash_map.is_rehashing()
+
+
+def test_iteration_started_before_resize_sees_each_key_once():
+    hash_map = ConcurrentHashMap(1009, 'blake2b', concurrency=4, rehash_step=1)
+    expected = {'key' + str(i): i for i in range(900)}
+    for key, value in expected.items():
+        hash_map.put(key, value)
+    assert not hash_map.is_rehashing()
+
+    items = iter(hash_map.items())
+    seen = [next(items) for _ in range(300)]
+
+    # Push the map into a resize while the iterator is part way through
+    i = 0
+    while (not hash_map.is_rehashing()):
+        hash_map.put('new' + str(i), i)
+        i += 1
+    assert any(type(bucket) is _Forward for bucket in hash_map._table.buckets)
+
+    seen.extend(items)
+    keys = [key for key, _ in seen]
+    assert len(keys) == len(set(keys))
+    # Keys present throughout are all seen; the new ones may or may not be
+    assert set(expected) <= set(keys)
+    assert all(hash_map.get(key) == value for key, value in seen)
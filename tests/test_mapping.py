@@ -0,0 +1,73 @@
+# The HashMaps stand in for dicts, so they must compare and drain like one.
+
+from collections.abc import MutableMapping
+from time import perf_counter
+
+import pytest
+
+import hash_map_oa
+import hash_map_sc
+
+MAKERS = [
+    lambda: hash_map_sc.HashMap(11, 'fnv1a', max_load=1.0, incremental=True),
+    lambda: hash_map_oa.HashMap(11, 'fnv1a'),
+    lambda: hash_map_oa.CompactHashMap(11, 'fnv1a'),
+]
+
+
+@pytest.mark.parametrize('make_map', MAKERS)
+def test_equality_follows_mapping_semantics(make_map):
+    hash_map = make_map()
+    expected = {}
+    for i in range(500):
+        hash_map.put('key' + str(i), i)
+        expected['key' + str(i)] = i
+
+    assert hash_map == expected and expected == hash_map
+    assert hash_map == hash_map.copy()
+    assert hash_map != dict(expected, key0=-1)
+    assert hash_map != dict(expected, extra=1)
+    assert hash_map != list(expected)
+    assert ('key1', 1) in hash_map.items()
+    assert ('key1', 2) not in hash_map.items()
+    assert ('missing', None) not in hash_map.items()
+
+
+@pytest.mark.parametrize('make_map', MAKERS)
+def test_popitem_drains_in_linear_time(make_map):
+    hash_map = make_map()
+    expected = {}
+    for i in range(100000):
+        hash_map.put(str(i), i)
+        expected[str(i)] = i
+
+    start = perf_counter()
+    while (hash_map.get_size() > 0):
+        key, value = hash_map.popitem()
+        assert expected.pop(key) == value
+    # Restarting the scan from the first bucket every call takes minutes
+    assert perf_counter() - start < 30
+    assert not expected
+
+    with pytest.raises(KeyError):
+        hash_map.popitem()
+
+
+@pytest.mark.parametrize('make_map', MAKERS)
+def test_is_a_real_mutable_mapping(make_map):
+    hash_map = make_map()
+    # A subclass, not just registered, so every abstract method is checked
+    assert MutableMapping in type(hash_map).__mro__
+    assert not type(hash_map).__abstractmethods__
+    assert type(hash_map).__hash__ is None
+
+    hash_map['a'] = 1
+    hash_map.update({'b': 2}, c=3)
+    assert hash_map.setdefault('a', 9) == 1
+    del hash_map['b']
+    assert len(hash_map) == 2 and 'a' in hash_map and 'b' not in hash_map
+    assert sorted(hash_map) == ['a', 'c']
+    assert hash_map.pop('c') == 3
+    assert hash_map.popitem() == ('a', 1)
+    with pytest.raises(KeyError):
+        hash_map['a']
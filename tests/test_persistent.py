@@ -0,0 +1,125 @@
+# PersistentHashMap keeps its table in a file: it has to survive being
+# reopened, refuse files it cannot trust, and keep the file compact.
+
+import os
+import random
+import struct
+
+import pytest
+
+import hash_map_mmap
+from hash_map_mmap import PersistentHashMap
+
+
+def test_reopen_round_trip(tmp_path):
+    path = str(tmp_path / 'table.a6')
+    expected = {}
+    with PersistentHashMap(path, 11, values='int') as hash_map:
+        for i in range(2000):
+            hash_map.put('key' + str(i), i)
+            expected['key' + str(i)] = i
+        for i in range(0, 2000, 4):
+            hash_map.remove('key' + str(i))
+            del expected['key' + str(i)]
+        capacity = hash_map.get_capacity()
+
+    with PersistentHashMap(path) as hash_map:
+        assert hash_map.get_capacity() == capacity
+        assert hash_map.get_size() == len(expected)
+        assert dict(hash_map) == expected
+        assert hash_map.get('key0') is None
+
+
+def test_live_view_blocks_growth_without_corrupting(tmp_path):
+    path = str(tmp_path / 'table.a6')
+    with PersistentHashMap(path, 101) as hash_map:
+        hash_map.put('a', b'x' * 10)
+        hash_map.put('b', b'y' * 10)
+        garbage = hash_map._garbage
+        heap_end = hash_map._heap_end
+
+        view = hash_map.get_view('a')
+        with pytest.raises(BufferError):
+            # Too big for the heap, so the file has to grow
+            hash_map.put('a', b'z' * 100000)
+        assert hash_map._garbage == garbage
+        assert hash_map._heap_end == heap_end
+        assert bytes(view) == b'x' * 10
+        view.release()
+
+        hash_map.put('a', b'z' * 100000)
+        assert hash_map.get('a') == b'z' * 100000
+        assert hash_map.get('b') == b'y' * 10
+
+
+def test_tombstone_churn_rewrites_rarely(tmp_path):
+    path = str(tmp_path / 'table.a6')
+    with PersistentHashMap(path, 2003) as hash_map:
+        for i in range(982):
+            hash_map.put('key' + str(i), b'v')
+        rewrites = []
+        resize_table = hash_map.resize_table
+
+        def counting_resize_table(new_capacity):
+            rewrites.append(new_capacity)
+            resize_table(new_capacity)
+
+        hash_map.resize_table = counting_resize_table
+        rng = random.Random(7)
+        live = ['key' + str(i) for i in range(982)]
+        for i in range(2000):
+            hash_map.remove(live.pop(rng.randrange(len(live))))
+            live.append('new' + str(i))
+            hash_map.put(live[-1], b'v')
+
+        assert hash_map.get_capacity() == 2003
+        assert len(rewrites) <= 2000 // (2003 // 4) + 1
+        assert sorted(hash_map) == sorted(live)
+
+
+def test_garbage_is_compacted(tmp_path):
+    path = str(tmp_path / 'table.a6')
+    with PersistentHashMap(path, 11) as hash_map:
+        for i in range(2000):
+            # Each value is longer than the last, so it never fits in place
+            hash_map.put('key', b'v' * (i % 500 + 1) + bytes(i % 7))
+            hash_map.put('other' + str(i % 3), b'w' * (i % 300))
+        live = hash_map._heap_end - hash_map._heap_start() - hash_map._garbage
+        assert hash_map._garbage <= max(live, hash_map_mmap._MIN_HEAP)
+        assert hash_map.get('key') == b'v' * (1999 % 500 + 1) + bytes(1999 % 7)
+    assert os.path.getsize(path) < 1 << 20
+
+
+def test_mismatched_header_is_rejected(tmp_path):
+    path = str(tmp_path / 'table.a6')
+    PersistentHashMap(path, 11, 'fnv1a', 'int').close()
+    with pytest.raises(ValueError):
+        PersistentHashMap(path, function='xx64')
+    with pytest.raises(ValueError):
+        PersistentHashMap(path, values='str')
+
+
+@pytest.mark.parametrize('offset, data', [
+    (0, b'NOTAMAP!'),
+    (8, struct.pack('<Q', 0)),          # capacity
+    (16, struct.pack('<Q', 1 << 40)),   # size
+    (32, struct.pack('<Q', 1 << 40)),   # heap end
+    (48, b'nosuchhash'),                # hash function name
+    (64, bytes([200])),                 # value codec
+])
+def test_corrupt_header_is_rejected(tmp_path, offset, data):
+    path = str(tmp_path / 'table.a6')
+    PersistentHashMap(path, 11).close()
+    with open(path, 'r+b') as file:
+        file.seek(offset)
+        file.write(data)
+    with pytest.raises(ValueError):
+        PersistentHashMap(path)
+
+
+def test_truncated_file_is_rejected(tmp_path):
+    path = str(tmp_path / 'table.a6')
+    with open(path, 'wb') as file:
+        file.write(b'A6MMAP01')
+    with pytest.raises(ValueError):
+        PersistentHashMap(path)
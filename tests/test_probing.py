@@ -0,0 +1,114 @@
+# Every probing strategy has to reach the slots it promises to, and the
+# OA HashMap has to behave like a dict whichever one it runs with.
+
+import random
+
+import pytest
+
+import hash_map_oa
+from hash_map_oa import PROBING_STRATEGIES, ProbingStrategy
+
+
+def _hash_values(capacity: int) -> list:
+    """Returns a spread of hash values, including ones far above capacity."""
+    rng = random.Random(capacity)
+    return [0, 1, capacity - 1] + [rng.getrandbits(64) for _ in range(20)]
+
+
+@pytest.mark.parametrize('name', ['linear', 'double', 'robin_hood'])
+@pytest.mark.parametrize('capacity', [2, 3, 11, 101, 1009])
+def test_probe_reaches_every_slot(name, capacity):
+    strategy = PROBING_STRATEGIES[name]()
+    for hash_value in _hash_values(capacity):
+        sequence = list(strategy.probe(hash_value, capacity))
+        assert len(sequence) == capacity
+        assert set(sequence) == set(range(capacity))
+
+
+@pytest.mark.parametrize('capacity', [1, 2, 8, 64, 1024])
+def test_triangular_probe_reaches_every_slot(capacity):
+    strategy = PROBING_STRATEGIES['triangular']()
+    for hash_value in _hash_values(capacity):
+        sequence = list(strategy.probe(hash_value, capacity))
+        assert len(sequence) == capacity
+        assert set(sequence) == set(range(capacity))
+
+
+@pytest.mark.parametrize('capacity', [3, 11, 101, 1009])
+def test_quadratic_probe_reaches_half_the_slots(capacity):
+    # With a prime capacity the first (capacity + 1) / 2 squares land on
+    # distinct slots, which is what lets a table at most half full always
+    # find a free one. The rest of the sequence revisits them.
+    strategy = PROBING_STRATEGIES['quadratic']()
+    for hash_value in _hash_values(capacity):
+        sequence = list(strategy.probe(hash_value, capacity))
+        assert len(sequence) == capacity
+        assert len(set(sequence[:(capacity + 1) // 2])) == (capacity + 1) // 2
+
+
+def test_probing_strategy_is_abstract():
+    with pytest.raises(TypeError):
+        ProbingStrategy()
+
+    class Incomplete(ProbingStrategy):
+        name = 'incomplete'
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+_CONFIGS = [(name, False) for name in PROBING_STRATEGIES] + [
+    (name, True) for name in PROBING_STRATEGIES if name != 'robin_hood']
+
+
+@pytest.mark.parametrize('name, incremental', _CONFIGS)
+def test_delete_heavy_workload_matches_dict(name, incremental):
+    hash_map = hash_map_oa.HashMap(11, 'blake2b', incremental=incremental,
+                                   rehash_step=2, probing=name)
+    expected = {}
+    rng = random.Random(5)
+    for i in range(6000):
+        key = 'key' + str(rng.randrange(400))
+        if (rng.random() < 0.6):
+            assert hash_map.pop(key, None) == expected.pop(key, None)
+        else:
+            hash_map.put(key, i)
+            expected[key] = i
+        if (i % 500 == 0):
+            assert hash_map == expected
+
+    assert hash_map.get_size() == len(expected)
+    assert hash_map == expected
+    for i in range(400):
+        key = 'key' + str(i)
+        assert hash_map.get(key) == expected.get(key)
+        assert hash_map.contains_key(key) == (key in expected)
+
+    # Drain it, then make sure it still works from empty
+    for key in list(expected):
+        hash_map.remove(key)
+    assert hash_map.get_size() == 0
+    assert list(hash_map) == []
+    hash_map.put('again', 1)
+    assert hash_map == {'again': 1}
+
+
+def test_robin_hood_delete_leaves_no_tombstones():
+    hash_map = hash_map_oa.HashMap(101, 'blake2b', probing='robin_hood')
+    for i in range(40):
+        hash_map.put('key' + str(i), i)
+    for i in range(0, 40, 2):
+        hash_map.remove('key' + str(i))
+    assert hash_map.tombstone_count() == 0
+    assert hash_map == {'key' + str(i): i for i in range(1, 40, 2)}
+
+
+def test_robin_hood_rejects_incremental_resizing():
+    with pytest.raises(ValueError):
+        hash_map_oa.HashMap(11, 'blake2b', incremental=True, probing='robin_hood')
+    with pytest.raises(ValueError):
+        hash_map_oa.HashMap(11, 'blake2b', incremental=True,
+                            probing=hash_map_oa.RobinHoodProbing())
+    hash_map = hash_map_oa.HashMap(11, 'blake2b', probing='robin_hood')
+    with pytest.raises(ValueError):
+        hash_map.begin_resize(101)
@@ -0,0 +1,62 @@
+# Incremental resizing must not make any single operation pay for the
+# whole table: the put that starts a resize should cost about as much as
+# any other put.
+
+import gc
+from time import perf_counter_ns
+
+import pytest
+
+import hash_map_oa
+import hash_map_sc
+
+N_KEYS = 200000
+
+
+def _trigger_put_times(hash_map) -> (list, int):
+    """
+    Puts N_KEYS keys. Returns the times of the puts that started a resize
+    and the median time of all puts, in nanoseconds.
+    """
+    keys = ['key' + str(i) for i in range(N_KEYS)]
+    times = []
+    trigger_times = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for key in keys:
+            capacity = hash_map.get_capacity()
+            start = perf_counter_ns()
+            hash_map.put(key, 1)
+            elapsed = perf_counter_ns() - start
+            times.append(elapsed)
+            if (hash_map.get_capacity() != capacity):
+                trigger_times.append(elapsed)
+    finally:
+        if (gc_was_enabled):
+            gc.enable()
+
+    times.sort()
+    return trigger_times, times[len(times) // 2]
+
+
+def test_sc_incremental_resize_put_stays_near_median():
+    trigger_times, median = _trigger_put_times(
+        hash_map_sc.HashMap(11, 'fnv1a', max_load=1.0, incremental=True))
+    assert len(trigger_times) >= 10
+    # Allow for timer noise, but far below the milliseconds a rehash of the
+    # larger tables takes
+    assert max(trigger_times) < max(100 * median, 500000)
+
+
+@pytest.mark.parametrize('map_type', [hash_map_oa.HashMap, hash_map_oa.CompactHashMap])
+def test_oa_incremental_resize_put_stays_near_median(map_type):
+    trigger_times, median = _trigger_put_times(map_type(11, 'fnv1a', incremental=True))
+    assert len(trigger_times) >= 10
+    assert max(trigger_times) < max(100 * median, 500000)
+
+
+def test_sc_stop_the_world_resize_is_what_incremental_avoids():
+    trigger_times, median = _trigger_put_times(
+        hash_map_sc.HashMap(11, 'fnv1a', max_load=1.0))
+    assert max(trigger_times) > 100 * median
@@ -0,0 +1,148 @@
+# SharedHashMap shared between processes: writers in children, readers that
+# must never see a half-written entry, and read-only attached copies.
+
+import multiprocessing
+import random
+
+import pytest
+
+from hash_map_shm import SharedHashMap
+
+N_WORKERS = 4
+VALUE_SIZE = 64
+
+
+def _writer(hash_map: SharedHashMap, worker: int) -> None:
+    """Puts keys of its own, removes every third, then overwrites the rest."""
+    for i in range(500):
+        hash_map.put('w' + str(worker) + ':' + str(i), i)
+    for i in range(0, 500, 3):
+        hash_map.remove('w' + str(worker) + ':' + str(i))
+    for i in range(500):
+        if (i % 3):
+            hash_map.put('w' + str(worker) + ':' + str(i), -i)
+    hash_map.close()
+
+
+def _flipper(hash_map: SharedHashMap, rounds: int) -> None:
+    """Rewrites one value over and over, each time with a single byte repeated."""
+    for i in range(rounds):
+        hash_map.put('key', bytes([i % 256]) * VALUE_SIZE)
+    hash_map.close()
+
+
+@pytest.fixture
+def shared_map():
+    """Yields a fresh SharedHashMap factory and frees every map it made."""
+    maps = []
+
+    def make(*args, **kwargs):
+        maps.append(SharedHashMap(*args, **kwargs))
+        return maps[-1]
+
+    yield make
+    for hash_map in maps:
+        hash_map.unlink()
+
+
+def test_writes_from_child_processes_are_seen_by_parent(shared_map):
+    hash_map = shared_map(8192, n_shards=8, values='int')
+    workers = [multiprocessing.Process(target=_writer, args=(hash_map, n))
+               for n in range(N_WORKERS)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+
+    expected = {'w' + str(n) + ':' + str(i): -i
+                for n in range(N_WORKERS) for i in range(500) if i % 3}
+    assert hash_map.get_size() == len(expected)
+    assert dict(hash_map) == expected
+    assert hash_map.get('w0:0') is None
+
+
+def test_readers_never_see_a_torn_value(shared_map):
+    hash_map = shared_map(64, n_shards=1, value_size=VALUE_SIZE)
+    hash_map.put('key', bytes(VALUE_SIZE))
+    writer = multiprocessing.Process(target=_flipper, args=(hash_map, 20000))
+    writer.start()
+
+    seen = set()
+    while (writer.is_alive()):
+        value = hash_map.get('key')
+        # Any mix of two writes would hold more than one distinct byte
+        assert len(set(value)) == 1
+        seen.add(value[0])
+    writer.join()
+    assert writer.exitcode == 0
+    assert hash_map.get('key') == bytes([19999 % 256]) * VALUE_SIZE
+    # The reader really did overlap the writer
+    assert len(seen) > 1
+
+
+def test_reader_waits_out_a_write_in_progress(shared_map, monkeypatch):
+    hash_map = shared_map(64, n_shards=1, value_size=VALUE_SIZE)
+    hash_map.put('key', b'a' * VALUE_SIZE)
+    buf = hash_map._bufs[0]
+
+    # Freeze the shard mid-write; the reader must retry until it is done
+    hash_map._bump_seq(buf)
+    sleeps = []
+
+    def finish_write(seconds):
+        sleeps.append(seconds)
+        if (len(sleeps) == 3):
+            hash_map._bump_seq(buf)
+            hash_map.put('key', b'b' * VALUE_SIZE)
+
+    monkeypatch.setattr('hash_map_shm.time.sleep', finish_write)
+    assert hash_map.get('key') == b'b' * VALUE_SIZE
+    assert len(sleeps) == 3
+
+
+def test_attached_map_is_read_only(shared_map):
+    hash_map = shared_map(256, n_shards=2, values='str')
+    hash_map.put('a', 'x')
+    reader = SharedHashMap.attach(hash_map.name)
+    try:
+        assert reader.get('a') == 'x'
+        assert dict(reader) == {'a': 'x'}
+        with pytest.raises(RuntimeError):
+            reader.put('b', 'y')
+        with pytest.raises(RuntimeError):
+            reader.remove('a')
+        with pytest.raises(RuntimeError):
+            reader.clear()
+
+        # Still a live view of the writer's table
+        hash_map.put('b', 'y')
+        assert reader.get('b') == 'y'
+    finally:
+        reader.close()
+    assert dict(hash_map) == {'a': 'x', 'b': 'y'}
+
+
+def test_churn_compacts_rarely(shared_map):
+    hash_map = shared_map(1024, n_shards=1, values='int')
+    capacity = hash_map.get_capacity()
+    calls = []
+    compact = hash_map._compact
+
+    def counting_compact(buf):
+        calls.append(1)
+        compact(buf)
+
+    hash_map._compact = counting_compact
+    rng = random.Random(7)
+    live = ['key' + str(i) for i in range(int(capacity * 0.7))]
+    for key in live:
+        hash_map.put(key, 0)
+    for i in range(4000):
+        hash_map.remove(live.pop(rng.randrange(len(live))))
+        live.append('new' + str(i))
+        hash_map.put(live[-1], i)
+
+    # Each compaction needs at least an eighth of the shard in tombstones
+    assert 1 <= len(calls) <= 4000 // (capacity // 8) + 1
+    assert sorted(hash_map) == sorted(live)
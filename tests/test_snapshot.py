@@ -0,0 +1,69 @@
+# dump / load round trips, and the parts of a snapshot that are not keys
+# or values are never unpickled.
+
+import io
+import pickle
+
+import pytest
+
+import hash_map_oa
+import hash_map_sc
+from snapshot import SNAPSHOT_MAGIC, read_snapshot, write_snapshot
+
+
+@pytest.mark.parametrize('map_type', [hash_map_sc.HashMap, hash_map_oa.HashMap,
+                                      hash_map_oa.CompactHashMap])
+def test_dump_load_round_trip(map_type):
+    hash_map = map_type(11, 'fnv1a')
+    expected = {}
+    for i in range(10000):
+        hash_map.put('key' + str(i), [i])
+        expected['key' + str(i)] = [i]
+    for i in range(0, 10000, 3):
+        hash_map.remove('key' + str(i))
+        del expected['key' + str(i)]
+
+    snapshot = io.BytesIO()
+    hash_map.dump(snapshot)
+    snapshot.seek(0)
+    loaded = map_type.load(snapshot)
+    assert loaded == expected
+    assert loaded.get_capacity() == hash_map.get_capacity()
+
+
+class _Trap:
+    """Unpickling this fails the test."""
+
+    def __reduce__(self):
+        return (pytest.fail, ('snapshot header was unpickled',))
+
+
+@pytest.mark.parametrize('data', [
+    b'A6SNAP01' + pickle.dumps(_Trap()),
+    SNAPSHOT_MAGIC + pickle.dumps(_Trap()),
+    SNAPSHOT_MAGIC + b'\x00\x00' + b'\xff\xff\xff\xff',
+])
+def test_malformed_snapshot_is_rejected_before_unpickling(data):
+    with pytest.raises(ValueError):
+        list(read_snapshot(io.BytesIO(data)))
+
+
+@pytest.mark.parametrize('map_type', [hash_map_sc.HashMap, hash_map_oa.HashMap,
+                                      hash_map_oa.CompactHashMap])
+def test_index_past_the_table_is_rejected(map_type):
+    hash_map = map_type(11, 'fnv1a')
+    for i in range(100):
+        hash_map.put('key' + str(i), i)
+    snapshot = io.BytesIO()
+    hash_map.dump(snapshot)
+    snapshot.seek(0)
+    records = read_snapshot(snapshot)
+    header = next(records)
+    records = list(records)
+    records[-1] = (header['capacity'] + 5,) + records[-1][1:]
+
+    corrupt = io.BytesIO()
+    write_snapshot(corrupt, header, records)
+    corrupt.seek(0)
+    with pytest.raises(ValueError):
+        map_type.load(corrupt)
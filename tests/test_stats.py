@@ -0,0 +1,142 @@
+# get_stats() and empty_buckets() are kept up to date as the map changes
+# instead of scanning it. After every kind of change they have to agree
+# with a recount done from scratch.
+
+import random
+from collections import Counter
+
+import pytest
+
+import hash_map_oa
+import hash_map_sc
+
+
+def _sc_histogram(hash_map) -> dict:
+    """Chain length -> number of buckets, counted bucket by bucket."""
+    buckets = hash_map._buckets
+    return dict(Counter(buckets[i].length() for i in range(hash_map._capacity)))
+
+
+def _oa_histogram(hash_map) -> dict:
+    """Probe length -> number of entries, counted slot by slot."""
+    histogram = Counter()
+    capacity = hash_map._capacity
+    for i in range(capacity):
+        entry = hash_map._entry_at(hash_map._buckets, i)
+        if (entry is not None):
+            histogram[hash_map._probe_length(entry[2], capacity, i)] += 1
+    return dict(histogram)
+
+
+def _check(hash_map, expected: dict, lookups: Counter) -> None:
+    """Compares every incrementally kept counter with a recount."""
+    # With debug=True this raises if the count differs from a full scan
+    empty = hash_map.empty_buckets()
+    assert empty == hash_map._scan_empty_buckets()
+
+    stats = hash_map.get_stats()
+    if (isinstance(hash_map, hash_map_sc.HashMap)):
+        assert stats['histogram'] == _sc_histogram(hash_map)
+    else:
+        assert stats['histogram'] == _oa_histogram(hash_map)
+        assert stats['tombstones'] == hash_map.tombstone_count()
+        assert stats['tombstones'] == sum(
+            hash_map._is_tombstone_at(hash_map._buckets, i)
+            for i in range(hash_map._capacity))
+    assert stats['max_length'] == max(stats['histogram'], default=0)
+    assert stats['hits'] == lookups['hits']
+    assert stats['misses'] == lookups['misses']
+    assert stats['size'] == hash_map.get_size() == len(expected)
+    assert stats['capacity'] == hash_map.get_capacity()
+
+
+_MAPS = {
+    'sc': lambda incremental: hash_map_sc.HashMap(
+        11, 'blake2b', max_load=1.0, incremental=incremental, rehash_step=2,
+        stats=True, debug=True),
+    'oa': lambda incremental: hash_map_oa.HashMap(
+        11, 'blake2b', incremental=incremental, rehash_step=2,
+        stats=True, debug=True),
+    'compact': lambda incremental: hash_map_oa.CompactHashMap(
+        11, 'blake2b', incremental=incremental, rehash_step=2,
+        stats=True, debug=True),
+    'robin_hood': lambda incremental: hash_map_oa.HashMap(
+        11, 'blake2b', probing='robin_hood', stats=True, debug=True),
+}
+
+
+@pytest.mark.parametrize('kind, incremental', [
+    ('sc', False), ('sc', True), ('oa', False), ('oa', True),
+    ('compact', False), ('compact', True), ('robin_hood', False)])
+def test_counters_match_a_recount(kind, incremental):
+    hash_map = _MAPS[kind](incremental)
+    expected = {}
+    lookups = Counter()
+    rng = random.Random(11)
+    checked_mid_resize = 0
+
+    for i in range(6000):
+        key = 'key' + str(rng.randrange(300))
+        op = rng.random()
+        if (op < 0.45):
+            hash_map.put(key, i)
+            expected[key] = i
+        elif (op < 0.75):
+            assert hash_map.pop(key, None) == expected.pop(key, None)
+        elif (op < 0.95):
+            found = hash_map.get(key)
+            assert found == expected.get(key)
+            lookups['hits' if found is not None else 'misses'] += 1
+        elif (op < 0.99 and expected):
+            key, value = hash_map.popitem()
+            assert expected.pop(key) == value
+        elif (op < 0.995):
+            hash_map.clear()
+            expected.clear()
+
+        if (hash_map.is_rehashing()):
+            checked_mid_resize += 1
+            _check(hash_map, expected, lookups)
+        elif (i % 50 == 0):
+            _check(hash_map, expected, lookups)
+
+    if (incremental):
+        assert checked_mid_resize > 0
+    hash_map.rehash()
+    _check(hash_map, expected, lookups)
+    hash_map.resize_table(4 * hash_map.get_capacity())
+    _check(hash_map, expected, lookups)
+    assert hash_map.get_stats()['resizes'] > 0
+
+
+@pytest.mark.parametrize('kind', ['oa', 'compact'])
+def test_counters_survive_compaction(kind):
+    hash_map = _MAPS[kind](False)
+    expected = {'key' + str(i): i for i in range(700)}
+    for key, value in expected.items():
+        hash_map.put(key, value)
+    capacity = hash_map.get_capacity()
+    compactions = []
+    resize_table = hash_map.resize_table
+
+    def counting_resize_table(new_capacity):
+        compactions.append(new_capacity)
+        resize_table(new_capacity)
+
+    hash_map.resize_table = counting_resize_table
+    rng = random.Random(3)
+    live = list(expected)
+    for i in range(4000):
+        key = live.pop(rng.randrange(len(live)))
+        hash_map.remove(key)
+        del expected[key]
+        live.append('new' + str(i))
+        hash_map.put(live[-1], i)
+        expected[live[-1]] = i
+        if (i % 100 == 0):
+            _check(hash_map, expected, Counter())
+
+    # Churn at a steady size only ever rehashes in place
+    assert compactions
+    assert hash_map.get_capacity() == capacity
+    _check(hash_map, expected, Counter())